@@ -3,4 +3,7 @@
 uv venv
 uv pip install -r requirements.txt
 uv run python manage.py migrate
-uv run python manage.py collectstatic --noinput
\ No newline at end of file
+uv run python manage.py collectstatic --noinput
+if [ -n "$LINK_SNAPSHOT_PATH" ]; then
+    uv run python manage.py build_link_snapshot
+fi
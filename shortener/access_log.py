@@ -0,0 +1,129 @@
+"""Opt-in redirect access log.
+
+One line per redirect, space separated::
+
+    2026-10-19T09:30:01.250Z abc123 hit 0.84 203.0.113.7 5d41402a
+
+timestamp (UTC), short code, ``hit`` (replica, snapshot or cache), ``miss`` (database),
+``404`` or ``410`` (expired), latency in ms, client IP and a CRC32 of the User-Agent.
+
+The request thread only puts a tuple on a bounded queue. A ``QueueListener`` thread
+formats the lines and hands them to a rotating file handler that writes whole batches.
+When the queue is full (the disk is stalled), lines are dropped and counted instead of
+blocking redirects.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+import zlib
+from logging.handlers import QueueListener, RotatingFileHandler
+from urllib.parse import quote
+from django.conf import settings
+from . import metrics
+
+ACCESS_LOG_PATH = getattr(settings, 'ACCESS_LOG_PATH', None)
+ACCESS_LOG_MAX_BYTES = getattr(settings, 'ACCESS_LOG_MAX_BYTES', 10 * 1024 * 1024)
+ACCESS_LOG_BACKUPS = getattr(settings, 'ACCESS_LOG_BACKUPS', 5)
+ACCESS_LOG_BATCH_SIZE = getattr(settings, 'ACCESS_LOG_BATCH_SIZE', 256)
+ACCESS_LOG_FLUSH_INTERVAL = getattr(settings, 'ACCESS_LOG_FLUSH_INTERVAL', 1.0)
+ACCESS_LOG_QUEUE_SIZE = getattr(settings, 'ACCESS_LOG_QUEUE_SIZE', 10000)
+
+STATUSES = ('hit', 'miss', '404', '410')
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """Buffers formatted lines and writes each batch with one write and one flush."""
+
+    def __init__(self, filename, max_bytes, backups, capacity):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True)
+        self.capacity = capacity
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+        if len(self.lines) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.lines:
+                return
+            data = '\n'.join(self.lines) + '\n'
+            self.lines = []
+            if self.stream is None:
+                self.stream = self._open()
+            size = self.stream.seek(0, 2)
+            if self.maxBytes and size and size + len(data) > self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(data)
+            self.stream.flush()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+def format_line(item) -> str:
+    ts, short_code, status, latency_ms, client_ip, user_agent = item
+    stamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(ts))
+    ua_hash = f"{zlib.crc32(user_agent.encode('utf-8')):08x}" if user_agent else '-'
+    return f"{stamp}.{int(ts % 1 * 1000):03d}Z {quote(short_code, safe='@')} {status} {latency_ms:.2f} {client_ip or '-'} {ua_hash}"
+
+
+class AccessLogListener(QueueListener):
+    """Turns queued tuples into records and flushes the batch whenever the queue goes quiet."""
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=ACCESS_LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+    def prepare(self, item):
+        return logging.makeLogRecord({'name': 'shortener.access', 'levelno': logging.INFO, 'msg': format_line(item)})
+
+
+_queue = None
+_listener = None
+_lock = threading.Lock()
+
+
+def _start():
+    global _queue, _listener
+    with _lock:
+        if _listener is None:
+            handler = BatchingRotatingFileHandler(ACCESS_LOG_PATH, ACCESS_LOG_MAX_BYTES, ACCESS_LOG_BACKUPS, ACCESS_LOG_BATCH_SIZE)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _queue = queue.Queue(maxsize=ACCESS_LOG_QUEUE_SIZE)
+            _listener = AccessLogListener(_queue, handler)
+            _listener.start()
+            atexit.register(stop)
+
+
+def stop():
+    """Drain the queue and flush the file; called at exit."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
+def log_redirect(short_code: str, status: str, started: float, client_ip: str | None, user_agent: str):
+    """Record one redirect; ``started`` is a ``time.perf_counter()`` reading from the start of the request."""
+    if not ACCESS_LOG_PATH:
+        return
+    if _listener is None:
+        _start()
+    try:
+        _queue.put_nowait((time.time(), short_code, status, (time.perf_counter() - started) * 1000, client_ip, user_agent))
+    except queue.Full:
+        metrics.incr('access_log_dropped')
@@ -1,13 +1,90 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.db import transaction
 from .models import Link, Profile
+from . import replica
+from .search import filter_links
+from .services import bulk_delete_links, bulk_retarget_links, bulk_replace_url_prefix
+
+
+class LinkActionForm(ActionForm):
+    original_url = forms.URLField(required=False, label="New target URL")
+    old_prefix = forms.URLField(required=False, label="Replace prefix")
+    new_prefix = forms.URLField(required=False, label="with")
+
 
 @admin.register(Link)
 class LinkAdmin(admin.ModelAdmin):
-    list_display = ('short_code', 'original_url', 'created_at')
+    action_form = LinkActionForm
+    actions = ('retarget_links', 'replace_url_prefix')
+    list_display = ('short_code', 'original_url', 'created_at', 'expires_at', 'target_status')
+    list_select_related = ('health',)
+    list_filter = ('created_at', 'expires_at', 'health__status_code')
     search_fields = ('short_code', 'original_url')
+    search_help_text = "Short code prefix or part of the URL; 'domain:example.com' matches a target host."
     readonly_fields = ('short_code',)
+    ordering = ('-created_at', '-id')
+    show_full_result_count = False
+
+    @admin.display(description='Target', ordering='health__status_code')
+    def target_status(self, obj):
+        check = getattr(obj, 'health', None)
+        if check is None:
+            return '-'
+        return check.status_code or check.error
+
+    def get_search_results(self, request, queryset, search_term):
+        # Index-friendly matching from shortener/search.py instead of icontains on every field.
+        terms, domain = [], ''
+        for term in search_term.split():
+            if term.startswith('domain:'):
+                domain = term[len('domain:'):]
+            else:
+                terms.append(term)
+        return filter_links(queryset, ' '.join(terms), domain), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(lambda: replica.publish_link(obj))
+
+    def delete_model(self, request, obj):
+        short_code = obj.short_code
+        super().delete_model(request, obj)
+        transaction.on_commit(lambda: replica.publish('del', short_code))
+
+    def delete_queryset(self, request, queryset):
+        # One DELETE per 1000 rows and one cache/replica batch instead of per-object signals.
+        bulk_delete_links(queryset)
+
+    def _action_data(self, request):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        return form.cleaned_data if form.is_valid() else None
+
+    @admin.action(description="Change target URL of selected links")
+    def retarget_links(self, request, queryset):
+        data = self._action_data(request)
+        if not data or not data['original_url']:
+            self.message_user(request, "Enter a valid new target URL.", messages.ERROR)
+            return
+        count = bulk_retarget_links(queryset, data['original_url'])
+        self.message_user(request, f"Retargeted {count} links.", messages.SUCCESS)
+
+    @admin.action(description="Change domain prefix of selected links")
+    def replace_url_prefix(self, request, queryset):
+        data = self._action_data(request)
+        if not data or not data['old_prefix'] or not data['new_prefix']:
+            self.message_user(request, "Enter valid old and new URL prefixes.", messages.ERROR)
+            return
+        try:
+            count = bulk_replace_url_prefix(queryset, data['old_prefix'], data['new_prefix'])
+        except ValueError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, f"Updated {count} links.", messages.SUCCESS)
 
 class ProfileInline(admin.StackedInline):
     model = Profile
@@ -17,6 +94,8 @@ class ProfileInline(admin.StackedInline):
 class UserAdmin(BaseUserAdmin):
     inlines = (ProfileInline,)
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'get_avatar_url')
+    list_select_related = ('profile',)
+    show_full_result_count = False
     
     def get_avatar_url(self, obj):
         return obj.profile.avatar_url
@@ -0,0 +1,168 @@
+import hmac
+import json
+from functools import wraps
+from django import forms
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .models import Link
+from .utils import check_reserved_short_code, normalize_short_code
+from .services import resolve_links, bulk_create_links, bulk_update_links, LINK_REUSE_EXISTING
+
+API_TOKENS = [t for t in getattr(settings, 'API_TOKENS', []) if t]
+API_MAX_BATCH = getattr(settings, 'API_MAX_BATCH', 1000)
+
+
+def api_token_required(view_func):
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        header = request.headers.get('Authorization', '')
+        token = header[7:] if header.startswith('Bearer ') else ''
+        if not token or not any(hmac.compare_digest(token, t) for t in API_TOKENS):
+            return JsonResponse({'error': 'Invalid or missing API token.'}, status=401)
+        return view_func(request, *args, **kwargs)
+    return csrf_exempt(wrapper)
+
+
+def _json_body(request, field):
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        return None, JsonResponse({'error': 'Body must be JSON.'}, status=400)
+    items = body.get(field, []) if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        return None, JsonResponse({'error': f"'{field}' must be a list."}, status=400)
+    if len(items) > API_MAX_BATCH:
+        return None, JsonResponse({'error': f"At most {API_MAX_BATCH} items per request."}, status=400)
+    return body, None
+
+
+def _link_json(link):
+    return {
+        'short_code': link.short_code,
+        'original_url': link.original_url,
+        'expires_at': link.expires_at.isoformat() if link.expires_at else None,
+    }
+
+
+@api_token_required
+@require_POST
+def resolve_links_view(request):
+    body, error = _json_body(request, 'codes')
+    if error:
+        return error
+    codes = [normalize_short_code(str(code)) for code in body.get('codes', [])]
+    return JsonResponse({'links': resolve_links(codes)})
+
+
+@api_token_required
+@require_POST
+def bulk_links_view(request):
+    """Create and retarget links in batches.
+
+    ``{"create": [{"original_url", "custom_alias"?, "expires_at"?}], "update": [{"short_code", "original_url", "expires_at"?}]}``
+
+    ``expires_at`` is an ISO 8601 timestamp; in an update, ``null`` clears the expiry.
+    With ``"reuse": true`` (default LINK_REUSE_EXISTING), creates without an alias or expiry
+    return the existing link for the same target, marked ``"reused": true``.
+    Created and updated links, like errors, carry the ``index`` of their request item.
+    """
+    body, error = _json_body(request, 'create')
+    if error:
+        return error
+    creates = body.get('create', [])
+    updates = body.get('update', [])
+    reuse = body.get('reuse', LINK_REUSE_EXISTING)
+    if not isinstance(updates, list) or len(creates) + len(updates) > API_MAX_BATCH:
+        return JsonResponse({'error': f"'update' must be a list; at most {API_MAX_BATCH} items per request."}, status=400)
+    if not isinstance(reuse, bool):
+        return JsonResponse({'error': "'reuse' must be true or false."}, status=400)
+
+    url_field = forms.URLField()
+    expiry_field = forms.DateTimeField(required=False)
+    # Same limits as the dashboard's LinkCreateForm.
+    alias_field = forms.CharField(required=False, max_length=15)
+    errors = []
+
+    to_create = []
+    for index, item in enumerate(creates):
+        item = item if isinstance(item, dict) else {}
+        try:
+            url = url_field.clean(item.get('original_url'))
+            expires_at = expiry_field.clean(item.get('expires_at'))
+            alias = alias_field.clean(item.get('custom_alias'))
+        except forms.ValidationError as e:
+            errors.append({'op': 'create', 'index': index, 'error': ' '.join(e.messages)})
+            continue
+        if expires_at and expires_at <= timezone.now():
+            errors.append({'op': 'create', 'index': index, 'error': "Expiry must be in the future."})
+            continue
+        if alias:
+            alias_error = check_reserved_short_code(alias)
+            if alias_error:
+                errors.append({'op': 'create', 'index': index, 'error': alias_error})
+                continue
+            alias = normalize_short_code(alias)
+        to_create.append((index, url, alias or None, expires_at))
+
+    # Duplicates inside the batch are rejected here; aliases held by other links are left to
+    # the INSERT's unique constraint, so the common case needs no lookup.
+    seen = set()
+    accepted, indexes = [], []
+    for index, url, alias, expires_at in to_create:
+        if alias and alias in seen:
+            errors.append({'op': 'create', 'index': index, 'error': f"Alias '{alias}' is already taken."})
+            continue
+        if alias:
+            seen.add(alias)
+        accepted.append((url, alias, expires_at))
+        indexes.append(index)
+
+    targets, expiries, update_indexes = {}, {}, {}
+    for index, item in enumerate(updates):
+        item = item if isinstance(item, dict) else {}
+        code = normalize_short_code(str(item.get('short_code') or ''))
+        try:
+            url = url_field.clean(item.get('original_url'))
+            expires_at = expiry_field.clean(item.get('expires_at'))
+        except forms.ValidationError as e:
+            errors.append({'op': 'update', 'index': index, 'error': ' '.join(e.messages)})
+            continue
+        targets[code] = url
+        update_indexes[code] = index
+        if 'expires_at' in item:
+            expiries[code] = expires_at
+
+    try:
+        created = bulk_create_links(accepted, reuse=reuse) if accepted else []
+    except IntegrityError:
+        # Some aliases are taken: look them up, report them and insert the rest.
+        taken = set(Link.objects.filter(short_code__in=list(seen)).values_list('short_code', flat=True))
+        for index, (_, alias, _) in zip(indexes, accepted):
+            if alias in taken:
+                errors.append({'op': 'create', 'index': index, 'error': f"Alias '{alias}' is already taken."})
+        kept = [(index, item) for index, item in zip(indexes, accepted) if item[1] not in taken]
+        indexes = [index for index, _ in kept]
+        accepted = [item for _, item in kept]
+        try:
+            created = bulk_create_links(accepted, reuse=reuse) if accepted else []
+        except IntegrityError:
+            return JsonResponse({'error': 'An alias was taken concurrently; retry the batch.'}, status=409)
+    updated = bulk_update_links(targets, expiries) if targets else []
+    updated_codes = {link.short_code for link in updated}
+    for index, item in enumerate(updates):
+        code = normalize_short_code(str(item.get('short_code') or '') if isinstance(item, dict) else '')
+        if code in targets and code not in updated_codes:
+            errors.append({'op': 'update', 'index': index, 'error': f"Link '{code}' not found."})
+
+    return JsonResponse({
+        # 'index' is the item's position in the request's 'create' / 'update' list.
+        'created': [{**_link_json(link), 'index': index, 'reused': not is_new}
+                    for index, (link, is_new) in zip(indexes, created)],
+        'updated': sorted(({**_link_json(l), 'index': update_indexes[l.short_code]} for l in updated),
+                          key=lambda item: item['index']),
+        'errors': errors,
+    }, status=200 if not errors else 207)
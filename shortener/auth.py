@@ -0,0 +1,98 @@
+"""Authenticated user lookups served from the cache.
+
+``AuthenticationMiddleware`` loads ``request.user`` on every admin request, and the base
+template then reads ``user.profile``. ``CachedModelBackend`` keeps that user, with
+its profile joined in, in the default cache for USER_CACHE_TTL seconds. A warm
+request therefore needs no auth queries, given that sessions are cached too
+(SESSION_ENGINE).
+
+Only a projection is cached: the USER_FIELDS and PROFILE_FIELDS the app and templates
+read, the session auth hash and whether the password is usable, never the password hash. The user is rebuilt from it
+with its other fields deferred, so reading one (``check_password``) loads it and
+``save()`` only writes the fields that were loaded.
+
+Entries are dropped whenever a user or profile is saved or deleted (see signals.py).
+"""
+import logging
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = getattr(settings, 'USER_CACHE_TTL', 300)
+
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser',
+               'last_login', 'date_joined')
+PROFILE_FIELDS = ('id', 'user_id', 'avatar_url')
+
+
+def user_cache_key(user_id) -> str:
+    return f"shortener:user:{user_id}"
+
+
+def _values(instance, names) -> dict:
+    return {f.attname: getattr(instance, f.attname) for f in instance._meta.concrete_fields if f.attname in names}
+
+
+def _from_values(model, values):
+    """A model instance as if loaded from the database with only ``values``; other fields are deferred."""
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    return model.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+
+def _project(user) -> dict:
+    profile = getattr(user, 'profile', None)
+    return {
+        'user': _values(user, USER_FIELDS),
+        'session_auth_hash': user.get_session_auth_hash(),
+        'usable_password': user.has_usable_password(),
+        'profile': _values(profile, PROFILE_FIELDS) if profile is not None else None,
+    }
+
+
+def _restore(entry):
+    user = _from_values(get_user_model(), entry['user'])
+    session_auth_hash, usable_password = entry['session_auth_hash'], entry['usable_password']
+    # Checked by the session on every request and by the admin header; both would load the password.
+    user.get_session_auth_hash = lambda: session_auth_hash
+    user.has_usable_password = lambda: usable_password
+    if entry['profile'] is not None:
+        user.profile = _from_values(Profile, entry['profile'])
+    else:
+        user._state.fields_cache['profile'] = None
+    return user
+
+
+def cache_user(user_id):
+    """Load a user with its profile and cache its projection; returns the user, or None for an unknown id."""
+    user = get_user_model()._default_manager.select_related('profile').filter(pk=user_id).first()
+    if user is not None:
+        try:
+            cache.set(user_cache_key(user_id), _project(user), USER_CACHE_TTL)
+        except Exception:
+            logger.debug("Cache set failed for user %s", user_id)
+    return user
+
+
+def invalidate_cached_user(user_id):
+    try:
+        cache.delete(user_cache_key(user_id))
+    except Exception:
+        logger.debug("Cache delete failed for user %s", user_id)
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose ``get_user`` (run once per request) reads the cache first."""
+
+    def get_user(self, user_id):
+        try:
+            entry = cache.get(user_cache_key(user_id))
+        except Exception:
+            logger.debug("Cache get failed for user %s", user_id)
+            entry = None
+        user = _restore(entry) if entry is not None else cache_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,32 @@
+import re
+from functools import lru_cache
+from django.conf import settings
+
+# Link-preview fetchers, uptime checkers and generic crawlers, as case-insensitive regular
+# expressions searched for in the User-Agent header. Tokens are specific on purpose: in-app
+# browsers (LinkedIn, Pinterest, Snapchat, ...) and phones such as CUBOT carry the platform's
+# name too, and those are people.
+DEFAULT_BOT_PATTERNS = (
+    r'\bbot\b', r'bot[/;-]', r'crawl', r'spider', r'slurp', r'\+https?://',
+    r'facebookexternalhit', r'facebookcatalog', r'slack-imgproxy', r'slackbot', r'whatsapp/',
+    r'telegrambot', r'discordbot', r'linkedinbot', r'embedly', r'pinterestbot', r'pinterest/0\.',
+    r'skypeuripreview', r'snap url preview', r'vkshare', r'iframely', r'bitlybot', r'mastodon/',
+    r'uptimerobot', r'pingdom', r'statuscake', r'site24x7', r'betteruptime', r'freshping',
+    r'headlesschrome', r'lighthouse', r'curl/', r'wget/', r'python-requests', r'python-urllib',
+    r'go-http-client', r'okhttp', r'axios/', r'node-fetch', r'java/', r'libwww-perl', r'httpclient',
+)
+
+BOT_PATTERNS = tuple(getattr(settings, 'BOT_USER_AGENT_PATTERNS', None) or DEFAULT_BOT_PATTERNS)
+BOT_UA_CACHE_SIZE = getattr(settings, 'BOT_UA_CACHE_SIZE', 4096)
+# Privacy tools and some in-app browsers send no User-Agent at all.
+BOT_EMPTY_USER_AGENT = getattr(settings, 'BOT_EMPTY_USER_AGENT', False)
+
+_BOT_RE = re.compile('|'.join(f'(?:{p})' for p in BOT_PATTERNS), re.IGNORECASE)
+
+
+@lru_cache(maxsize=BOT_UA_CACHE_SIZE)
+def is_bot(user_agent: str) -> bool:
+    """Return True if the User-Agent belongs to a crawler, preview fetcher or monitor."""
+    if not user_agent:
+        return BOT_EMPTY_USER_AGENT
+    return _BOT_RE.search(user_agent) is not None
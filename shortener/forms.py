@@ -1,17 +1,27 @@
 from django import forms
 from django.contrib.auth.models import User
-from .utils import validate_short_code, normalize_short_code
+from django.utils import timezone
+from .utils import check_reserved_short_code, normalize_short_code
+from .rules import compile_rules
 
 
 class LinkCreateForm(forms.Form):
     original_url = forms.URLField()
     custom_alias = forms.CharField(required=False, max_length=15)
+    expires_at = forms.DateTimeField(required=False)
+
+    def clean_expires_at(self):
+        expires_at = self.cleaned_data.get('expires_at')
+        if expires_at and expires_at <= timezone.now():
+            raise forms.ValidationError("Expiry must be in the future.")
+        return expires_at
 
     def clean_custom_alias(self):
         alias = self.cleaned_data.get('custom_alias', '').strip()
         if not alias:
             return ''
-        error = validate_short_code(alias)
+        # Only reserved words and routes; a taken alias is caught by the INSERT (services.AliasTaken).
+        error = check_reserved_short_code(alias)
         if error:
             raise forms.ValidationError(error)
         return normalize_short_code(alias)
@@ -20,6 +30,9 @@ class LinkCreateForm(forms.Form):
 class LinkUpdateForm(forms.Form):
     original_url = forms.URLField(required=False)
     custom_alias = forms.CharField(required=False, max_length=15)
+    rules = forms.JSONField(required=False)
+    # Blank clears the expiry; a past time expires the link right away.
+    expires_at = forms.DateTimeField(required=False)
 
     def __init__(self, *args, **kwargs):
         self.link_id = kwargs.pop('link_id', None)
@@ -32,11 +45,74 @@ class LinkUpdateForm(forms.Form):
             return ''
         if self.initial_alias and alias == self.initial_alias:
             return normalize_short_code(alias)
-        error = validate_short_code(alias, exclude_link_id=self.link_id)
+        error = check_reserved_short_code(alias)
         if error:
             raise forms.ValidationError(error)
         return normalize_short_code(alias)
 
+    def clean_rules(self):
+        rules = self.cleaned_data.get('rules') or None
+        try:
+            compile_rules(rules)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        return rules
+
+
+class LinkSearchForm(forms.Form):
+    q = forms.CharField(required=False, max_length=200)
+    domain = forms.CharField(required=False, max_length=253)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    cursor = forms.CharField(required=False, max_length=100)
+
+    def is_filtered(self):
+        data = self.cleaned_data
+        return bool(data.get('q') or data.get('domain') or data.get('date_from') or data.get('date_to'))
+
+
+class IdListField(forms.Field):
+    """Repeated ``name=<id>`` values, e.g. from row checkboxes, as a list of ints."""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        try:
+            return [int(v) for v in value or []]
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Invalid link selection.")
+
+
+class LinkBulkActionForm(forms.Form):
+    ACTIONS = (
+        ('delete', 'Delete'),
+        ('retarget', 'Change target URL'),
+        ('replace_prefix', 'Change domain prefix'),
+        ('expire', 'Set expiry'),
+    )
+    action = forms.ChoiceField(choices=ACTIONS)
+    ids = IdListField(required=False)
+    # Apply to every link matching the current search instead of the checked rows.
+    select_all = forms.BooleanField(required=False)
+    original_url = forms.URLField(required=False)
+    old_prefix = forms.URLField(required=False)
+    new_prefix = forms.URLField(required=False)
+    # For 'expire'; blank clears the expiry.
+    expires_at = forms.DateTimeField(required=False)
+
+    def clean(self):
+        data = super().clean()
+        if not data.get('select_all') and not data.get('ids'):
+            raise forms.ValidationError("Select at least one link.")
+        action = data.get('action')
+        if action == 'retarget' and not data.get('original_url'):
+            self.add_error('original_url', "Enter the new target URL.")
+        if action == 'replace_prefix':
+            if not data.get('old_prefix'):
+                self.add_error('old_prefix', "Enter the prefix to replace, e.g. https://old.example.com/.")
+            if not data.get('new_prefix'):
+                self.add_error('new_prefix', "Enter the new prefix, e.g. https://new.example.com/.")
+        return data
+
 
 class AdminUserCreateForm(forms.Form):
     username = forms.CharField(max_length=150)
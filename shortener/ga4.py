@@ -1,9 +1,11 @@
 import os
-import requests
 import threading
+import time
 import uuid
+import zlib
 import urllib.parse
 import logging
+from functools import cache
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -12,22 +14,134 @@ GA_MEASUREMENT_ID = os.environ.get('GA_MEASUREMENT_ID') or getattr(settings, 'GA
 GA_API_SECRET = os.environ.get('GA_API_SECRET') or getattr(settings, 'GA_API_SECRET', None)
 GA_TIMEOUT = getattr(settings, 'GA4_TIMEOUT', 3)
 GA_ASYNC = getattr(settings, 'GA4_ASYNC', True)
+GA_SAMPLE_RATE = float(getattr(settings, 'GA4_SAMPLE_RATE', 1.0))
+GA_SAMPLE_OVERRIDES = getattr(settings, 'GA4_SAMPLE_OVERRIDES', None) or {}
+GA_ADAPTIVE = getattr(settings, 'GA4_ADAPTIVE_SAMPLING', False)
+GA_ADAPTIVE_MAX_INFLIGHT = getattr(settings, 'GA4_ADAPTIVE_MAX_INFLIGHT', 32)
+GA_ADAPTIVE_MAX_LATENCY = getattr(settings, 'GA4_ADAPTIVE_MAX_LATENCY', 1.0)
+GA_ADAPTIVE_MIN_RATE = getattr(settings, 'GA4_ADAPTIVE_MIN_RATE', 0.01)
+GA_ENDPOINT = getattr(settings, 'GA4_ENDPOINT', 'https://www.google-analytics.com/mp/collect')
+GA_MAX_INFLIGHT = getattr(settings, 'GA4_MAX_INFLIGHT', 64)
+GA_FAILURE_COOLDOWN = getattr(settings, 'GA4_FAILURE_COOLDOWN', 30)
+GA_SPOOL_DIR = getattr(settings, 'GA4_SPOOL_DIR', None)
+# GA4 Measurement Protocol accepts at most 25 events per request.
+GA_MAX_EVENTS_PER_REQUEST = 25
 
-logger.info("GA4 config: enabled=%s timeout=%s async=%s", bool(GA_MEASUREMENT_ID and GA_API_SECRET), GA_TIMEOUT, GA_ASYNC)
 
+# Dispatch backlog and latency, used by adaptive sampling.
+_state_lock = threading.Lock()
+_inflight = 0
+_latency_ewma = 0.0
+# While the endpoint is failing, events go straight to the spool instead of holding threads.
+_endpoint_down_until = 0.0
+_spool = None
+_spool_lock = threading.Lock()
+
+
+@cache
+def _log_config():
+    logger.info("GA4 config: enabled=%s timeout=%s async=%s sample_rate=%s adaptive=%s", bool(GA_MEASUREMENT_ID and GA_API_SECRET), GA_TIMEOUT, GA_ASYNC, GA_SAMPLE_RATE, GA_ADAPTIVE)
+
+
+def _dispatch_started():
+    global _inflight
+    with _state_lock:
+        _inflight += 1
+
+
+def _dispatch_finished(elapsed):
+    global _inflight, _latency_ewma
+    with _state_lock:
+        _inflight -= 1
+        if elapsed is not None:
+            _latency_ewma = elapsed if not _latency_ewma else 0.8 * _latency_ewma + 0.2 * elapsed
+
+
+def effective_sample_rate(short_code=None) -> float:
+    rate = GA_SAMPLE_OVERRIDES.get(short_code, GA_SAMPLE_RATE) if short_code else GA_SAMPLE_RATE
+    if GA_ADAPTIVE and rate > 0:
+        pressure = max(_inflight / GA_ADAPTIVE_MAX_INFLIGHT, _latency_ewma / GA_ADAPTIVE_MAX_LATENCY)
+        if pressure > 1:
+            rate = max(rate / pressure, min(rate, GA_ADAPTIVE_MIN_RATE))
+    return min(max(rate, 0.0), 1.0)
+
+
+def _sample_bucket(client_id: str) -> float:
+    """Map a client_id to a stable point in [0, 1) so a session is kept or dropped as a whole."""
+    return zlib.crc32(client_id.encode('utf-8')) / 4294967296.0
 
-def _send_ga4_event_thread(client_id, event_name, params, ip_address=None, user_agent=None, user_data=None):
-    if not GA_MEASUREMENT_ID or not GA_API_SECRET:
-        return
 
-    url = f"https://www.google-analytics.com/mp/collect?measurement_id={GA_MEASUREMENT_ID}&api_secret={GA_API_SECRET}"
-    
+def get_spool():
+    """Return the on-disk event spool, or None when GA4_SPOOL_DIR is not configured."""
+    global _spool
+    if not GA_SPOOL_DIR:
+        return None
+    if _spool is None:
+        from .spool import EventSpool
+        with _spool_lock:
+            if _spool is None:
+                _spool = EventSpool(
+                    GA_SPOOL_DIR,
+                    prefix='ga4',
+                    segment_bytes=getattr(settings, 'GA4_SPOOL_SEGMENT_BYTES', 4 * 1024 * 1024),
+                    fsync_every=getattr(settings, 'GA4_SPOOL_FSYNC_EVERY', 64),
+                    fsync_interval=getattr(settings, 'GA4_SPOOL_FSYNC_INTERVAL', 1.0),
+                )
+    return _spool
+
+
+def _spool_event(client_id, event_name, params, ip_address=None, user_agent=None, user_data=None, timestamp_micros=None):
+    spool = get_spool()
+    if spool is None:
+        return False
+    try:
+        spool.append([
+            timestamp_micros or int(time.time() * 1_000_000),
+            client_id, event_name, params, ip_address, user_agent, user_data,
+        ])
+        return True
+    except Exception as e:
+        # Runs on the request thread when dispatch is saturated; never fail the redirect.
+        logger.warning("GA4 spool write failed: %s", e)
+        return False
+
+
+def _mark_endpoint_down():
+    global _endpoint_down_until
+    _endpoint_down_until = time.monotonic() + GA_FAILURE_COOLDOWN
+
+
+def _collect_url(ip_address=None, user_agent=None):
+    url = f"{GA_ENDPOINT}?measurement_id={GA_MEASUREMENT_ID}&api_secret={GA_API_SECRET}"
+
     if ip_address:
          url += f"&ip_override={ip_address}"
 
     if user_agent:
         encoded_ua = urllib.parse.quote(user_agent)
         url += f"&ua={encoded_ua}"
+    return url
+
+
+def _post(url, payload, user_agent=None):
+    """POST a Measurement Protocol payload; raises on network errors and 429/5xx responses."""
+    # requests is imported by the senders, which run on dispatch threads, keeping it off cold starts.
+    import requests
+    headers = {}
+    if user_agent:
+        headers['User-Agent'] = user_agent
+    response = requests.post(url, json=payload, headers=headers, timeout=GA_TIMEOUT)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise requests.HTTPError(f"GA4 responded {response.status_code}", response=response)
+    return response
+
+
+def _send_ga4_event_thread(client_id, event_name, params, ip_address=None, user_agent=None, user_data=None, timestamp_micros=None):
+    if not GA_MEASUREMENT_ID or not GA_API_SECRET:
+        return
+    import requests
+
+    url = _collect_url(ip_address, user_agent)
 
     payload = {
         "client_id": client_id,
@@ -43,30 +157,81 @@ def _send_ga4_event_thread(client_id, event_name, params, ip_address=None, user_
     if settings.DEBUG:
         logger.debug("GA4 sending event=%s payload=%s ip=%s ua=%s", event_name, payload, ip_address, user_agent)
 
+    elapsed = None
+    failed = False
     try:
-        headers = {}
-        if user_agent:
-            headers['User-Agent'] = user_agent
-
-        response = requests.post(url, json=payload, headers=headers, timeout=GA_TIMEOUT)
+        started = time.monotonic()
+        response = _post(url, payload, user_agent)
+        elapsed = time.monotonic() - started
         if settings.DEBUG:
             logger.debug("GA4 response %s %s", response.status_code, response.text[:200])
     except requests.Timeout as e:
+        elapsed = GA_TIMEOUT
+        failed = True
         log_fn = logger.debug if not settings.DEBUG else logger.warning
         log_fn("GA4 send timeout: %s", e)
     except requests.RequestException as e:
+        failed = True
         log_fn = logger.debug if not settings.DEBUG else logger.warning
         log_fn("GA4 request failed: %s", e)
     except Exception as e:
         logger.debug("GA4 unexpected error: %s", e, exc_info=settings.DEBUG)
 
+    if failed:
+        _mark_endpoint_down()
+        _spool_event(client_id, event_name, params, ip_address, user_agent, user_data, timestamp_micros)
+    return elapsed
+
+
+def send_ga4_batch(records) -> int:
+    """Deliver spooled records, returning how many leading records were sent.
+
+    Consecutive records from the same client, IP and user agent share one request
+    (up to 25 events), backdated with their original ``timestamp_micros``.
+    """
+    if not GA_MEASUREMENT_ID or not GA_API_SECRET:
+        return 0
+    import requests
+
+    delivered = 0
+    pos = 0
+    while pos < len(records):
+        ts, client_id, _, _, ip_address, user_agent, user_data = records[pos]
+        group_key = (client_id, ip_address, user_agent, repr(user_data))
+        end = pos + 1
+        while (
+            end < len(records)
+            and end - pos < GA_MAX_EVENTS_PER_REQUEST
+            and (records[end][1], records[end][4], records[end][5], repr(records[end][6])) == group_key
+        ):
+            end += 1
+
+        payload = {
+            "client_id": client_id,
+            "events": [
+                {"name": r[2], "params": r[3], "timestamp_micros": r[0]}
+                for r in records[pos:end]
+            ],
+        }
+        if user_data:
+            payload["user_data"] = user_data
+
+        try:
+            _post(_collect_url(ip_address, user_agent), payload, user_agent)
+        except requests.RequestException as e:
+            logger.debug("GA4 replay failed: %s", e)
+            return delivered
+        delivered += end - pos
+        pos = end
+    return delivered
+
 
-def send_ga4_event(request, event_name='page_view', params=None, ip_address=None, user_agent=None, user_data=None):
+def send_ga4_event(request, event_name='page_view', params=None, ip_address=None, user_agent=None, user_data=None, short_code=None):
+    _log_config()
     if not GA_MEASUREMENT_ID or not GA_API_SECRET:
         return
 
-    if params is None:
-        params = {}
+    params = dict(params) if params else {}
 
     client_id = request.COOKIES.get('_ga', str(uuid.uuid4()))
     if client_id.startswith('GA'):
@@ -74,8 +239,28 @@ def send_ga4_event(request, event_name='page_view', params=None, ip_address=None
         if len(parts) > 2:
             client_id = '.'.join(parts[2:])
 
+    rate = effective_sample_rate(short_code)
+    if rate < 1.0:
+        if _sample_bucket(client_id) >= rate:
+            return
+        # Lets GA4 totals be scaled back up to the unsampled volume.
+        params['sample_weight'] = round(1.0 / rate, 4)
+
+    # Overflow and known outages go to the spool without spending a thread on them.
+    if GA_SPOOL_DIR and (_inflight >= GA_MAX_INFLIGHT or time.monotonic() < _endpoint_down_until):
+        _spool_event(client_id, event_name, params, ip_address, user_agent, user_data)
+        return
+
+    timestamp_micros = int(time.time() * 1_000_000)
+
     def _send():
-        _send_ga4_event_thread(client_id, event_name, params, ip_address, user_agent, user_data)
+        elapsed = None
+        try:
+            elapsed = _send_ga4_event_thread(client_id, event_name, params, ip_address, user_agent, user_data, timestamp_micros)
+        finally:
+            _dispatch_finished(elapsed)
+
+    _dispatch_started()
 
     if GA_ASYNC:
         try:
@@ -0,0 +1,258 @@
+"""Hot short codes: per-thread Space-Saving sketches merged across workers through Redis.
+
+Every redirect calls ``record``, which updates the calling thread's Space-Saving sketch
+of HOT_KEYS_CAPACITY counters (a few hundred nanoseconds, no lock). About every
+HOT_KEYS_FLUSH_INTERVAL seconds a thread swaps its sketch for an empty one and hands the
+old one to a daemon thread, which adds the counts with ZINCRBY to a sorted set for the
+current HOT_KEYS_WINDOW; requests never wait on Redis. ``top_keys`` reads the current and
+previous windows, so the list follows recent traffic.
+
+With HOT_KEYS_PIN enabled, the HOT_KEYS_PIN_TOP keys at or above HOT_KEYS_PIN_MIN_HITS
+are pinned:
+
+* their Redis entries are made persistent;
+* every worker keeps a copy in process, checked before Redis;
+* the copies are refreshed (or dropped, once the entry is invalidated) at each flush;
+* a copy is not served once the link changes, as seen in the change log (link_changes);
+* keys that cool down get CACHE_TTL back. Pinned codes are recorded in a Redis set, so
+  whichever worker refreshes next restores the TTL, even after a restart or when another
+  worker pinned the key.
+
+Links with an expiry are never pinned, so their entries still expire on time.
+"""
+import atexit
+import heapq
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from django.conf import settings
+from zlink.settings import CACHE_TTL
+from . import link_cache, link_changes, metrics
+
+logger = logging.getLogger(__name__)
+
+HOT_KEYS_CAPACITY = getattr(settings, 'HOT_KEYS_CAPACITY', 128)
+HOT_KEYS_FLUSH_INTERVAL = getattr(settings, 'HOT_KEYS_FLUSH_INTERVAL', 10)
+HOT_KEYS_WINDOW = getattr(settings, 'HOT_KEYS_WINDOW', 60)
+HOT_KEYS_PIN = getattr(settings, 'HOT_KEYS_PIN', False)
+HOT_KEYS_PIN_TOP = getattr(settings, 'HOT_KEYS_PIN_TOP', 20)
+HOT_KEYS_PIN_MIN_HITS = getattr(settings, 'HOT_KEYS_PIN_MIN_HITS', 1000)
+
+HOT_KEYS_KEY = 'shortener:hotkeys'
+PINNED_KEY = f'{HOT_KEYS_KEY}:pinned'
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in ``capacity`` counters (Metwally et al.).
+
+    A new key evicts a key with the smallest count and inherits that count as its
+    error, so ``count - error <= true count <= count``. Any key seen more than
+    ``n / capacity`` times in a stream of ``n`` is guaranteed to be monitored.
+
+    Counting a monitored key is a single dict update. The min-heap of ``(count, key)``
+    is only brought up to date when a key has to be evicted: stale entries at the top
+    are pushed back with their current count until the top one is exact.
+    """
+
+    __slots__ = ('capacity', 'counts', 'errors', '_heap')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def offer(self, key):
+        counts = self.counts
+        count = counts.get(key)
+        if count is not None:
+            counts[key] = count + 1
+            return
+        if len(counts) < self.capacity:
+            counts[key] = 1
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (1, key))
+            return
+        heap = self._heap
+        while True:
+            low, victim = heap[0]
+            current = counts[victim]
+            if current == low:
+                break
+            heapq.heapreplace(heap, (current, victim))
+        del counts[victim], self.errors[victim]
+        counts[key] = low + 1
+        self.errors[key] = low
+        heapq.heapreplace(heap, (low + 1, key))
+
+    def top(self, n: int | None = None) -> list[tuple[str, int, int]]:
+        """``(key, count, error)`` by descending count."""
+        ranked = sorted(self.counts.items(), key=lambda kv: -kv[1])
+        return [(key, count, self.errors[key]) for key, count in ranked[:n]]
+
+    def __len__(self):
+        return len(self.counts)
+
+
+class _Tracker:
+    """One thread's sketch and hand-off schedule; threads never share a sketch, so no lock is taken."""
+
+    __slots__ = ('sketch', 'seen', 'flush_at', '__weakref__')
+
+    def __init__(self):
+        self.sketch = SpaceSaving(HOT_KEYS_CAPACITY)
+        self.seen = 0
+        self.flush_at = time.monotonic() + HOT_KEYS_FLUSH_INTERVAL
+
+
+_local = threading.local()
+_trackers = weakref.WeakSet()
+_trackers_lock = threading.Lock()
+# Read the clock every this many requests rather than on each one.
+_CHECK_EVERY = 32
+# Sketches handed off by request threads, waiting for the flusher (deque appends are atomic).
+_handed_off = deque()
+_flusher = None
+# (ms the copies were read at, {short_code: cache entry}), replaced as a whole.
+_pins = (0, {})
+
+
+def _new_tracker() -> _Tracker:
+    global _flusher
+    tracker = _local.tracker = _Tracker()
+    with _trackers_lock:
+        _trackers.add(tracker)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_flusher, name='hot-keys', daemon=True)
+            _flusher.start()
+    return tracker
+
+
+def record(short_code: str):
+    try:
+        tracker = _local.tracker
+    except AttributeError:
+        tracker = _new_tracker()
+    tracker.sketch.offer(short_code)
+    tracker.seen += 1
+    if tracker.seen % _CHECK_EVERY == 0 and time.monotonic() >= tracker.flush_at:
+        _hand_off(tracker)
+
+
+def _hand_off(tracker: _Tracker):
+    """Swap the tracker's sketch for an empty one; the flusher thread sends the old one to Redis."""
+    sketch, tracker.sketch = tracker.sketch, SpaceSaving(HOT_KEYS_CAPACITY)
+    tracker.flush_at = time.monotonic() + HOT_KEYS_FLUSH_INTERVAL
+    if sketch.counts:
+        _handed_off.append(sketch)
+
+
+def pinned_entry(short_code: str):
+    """This worker's copy of a pinned link's cache entry, or None once the link changed anywhere."""
+    copied_at, entries = _pins
+    entry = entries.get(short_code)
+    if entry is not None and link_changes.is_current(short_code, copied_at):
+        return entry
+    return None
+
+
+def forget(short_code: str):
+    """Drop a local pinned copy right away, e.g. when the link changes; other workers see the change log."""
+    _pins[1].pop(short_code, None)
+
+
+def _window_key(window: int) -> str:
+    return f"{HOT_KEYS_KEY}:{window}"
+
+
+def flush(con=None):
+    """Add the handed-off counts to the shared window with one pipelined round trip."""
+    totals = {}
+    while _handed_off:
+        for code, count in _handed_off.popleft().counts.items():
+            totals[code] = totals.get(code, 0) + count
+    if not totals:
+        return
+    con = con or link_cache.redis_connection('default')
+    key = _window_key(int(time.time() // HOT_KEYS_WINDOW))
+    pipe = con.pipeline(transaction=False)
+    for code, count in totals.items():
+        pipe.zincrby(key, count, code)
+    pipe.expire(key, HOT_KEYS_WINDOW * 3)
+    pipe.execute()
+
+
+def _run_flusher():
+    """Flush handed-off sketches and refresh pins every HOT_KEYS_FLUSH_INTERVAL, off the request threads."""
+    while True:
+        time.sleep(HOT_KEYS_FLUSH_INTERVAL)
+        try:
+            con = link_cache.redis_connection('default')
+            flush(con)
+            if HOT_KEYS_PIN:
+                _refresh_pins(con)
+        except Exception:
+            logger.debug("Hot key flush failed")
+
+
+def flush_all():
+    with _trackers_lock:
+        trackers = list(_trackers)
+    for tracker in trackers:
+        _hand_off(tracker)
+    try:
+        flush()
+    except Exception:
+        logger.debug("Hot key flush failed")
+
+
+atexit.register(flush_all)
+
+
+def top_keys(limit: int = 20, con=None) -> list[tuple[str, int]]:
+    """Hottest ``(short_code, hits)`` over the current and previous windows, across workers."""
+    con = con or link_cache.redis_connection('default')
+    window = int(time.time() // HOT_KEYS_WINDOW)
+    pipe = con.pipeline(transaction=False)
+    for w in (window - 1, window):
+        # Each sketch keeps its top HOT_KEYS_CAPACITY, so deeper ranks are noise.
+        pipe.zrevrange(_window_key(w), 0, HOT_KEYS_CAPACITY - 1, withscores=True)
+    totals = {}
+    for rows in pipe.execute():
+        for code, score in rows:
+            code = code.decode('utf-8')
+            totals[code] = totals.get(code, 0) + int(score)
+    return sorted(totals.items(), key=lambda kv: -kv[1])[:limit]
+
+
+def _refresh_pins(con):
+    global _pins
+    hot = [code for code, hits in top_keys(HOT_KEYS_PIN_TOP, con) if hits >= HOT_KEYS_PIN_MIN_HITS]
+    # The mirror must already be following the change log when the copies are read,
+    # or changes in between would be missed.
+    link_changes.get_mirror()
+    # Stamped before the read: a change racing with it makes the copy look older, never newer.
+    copied_at = link_changes.now_ms()
+    entries = link_cache.get_many(hot) if hot else {}
+    # Persisting an expiring link's entry would keep it past its expiry.
+    entries = {code: entry for code, entry in entries.items() if not (isinstance(entry, dict) and entry.get('expires_at'))}
+    if entries:
+        # Recorded before persisting, so a persistent key is always listed for a later cool-down.
+        con.sadd(PINNED_KEY, *entries)
+        link_cache.persist_many(entries)
+    pinned = _pins[1]
+    cooled = ({code.decode('utf-8') for code in con.smembers(PINNED_KEY)} | pinned.keys()) - entries.keys()
+    if cooled:
+        if CACHE_TTL:
+            link_cache.expire_many(cooled, CACHE_TTL)
+        con.srem(PINNED_KEY, *cooled)
+    added = len(entries.keys() - pinned.keys())
+    _pins = (copied_at, entries)
+    if added:
+        metrics.incr('hot_key_pinned', added)
+
+
+def pinned_codes() -> list[str]:
+    return sorted(_pins[1])
@@ -0,0 +1,256 @@
+import bisect
+import itertools
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import caches
+from .utils import link_cache_key
+
+LINK_CACHE_ALIASES = list(getattr(settings, 'LINK_CACHE_ALIASES', None) or ['default'])
+LINK_CACHE_VNODES = getattr(settings, 'LINK_CACHE_VNODES', 160)
+# alias -> the stable name its ring points are hashed from (shard URL or explicit name).
+LINK_CACHE_NODE_IDS = getattr(settings, 'LINK_CACHE_NODE_IDS', None) or {}
+LINK_KEY_PATTERN = "*shortener:url:*"
+CACHE_STATS_SAMPLE_SIZE = getattr(settings, 'CACHE_STATS_SAMPLE_SIZE', 200)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes; adding a node only remaps ~1/N of the keys.
+
+    ``nodes`` maps each node to the identity its points are hashed from; a plain list of
+    node names uses the names. Identities must not depend on the nodes' order.
+    """
+
+    def __init__(self, nodes, vnodes=LINK_CACHE_VNODES):
+        identities = dict(nodes) if isinstance(nodes, dict) else {node: node for node in nodes}
+        self.nodes = list(identities)
+        points = sorted((_hash(f"{identity}#{i}"), node) for node, identity in identities.items() for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def get_node(self, key: str) -> str:
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        idx = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[idx]
+
+
+ring = HashRing({alias: LINK_CACHE_NODE_IDS.get(alias, alias) for alias in LINK_CACHE_ALIASES})
+
+
+def alias_for(short_code: str) -> str:
+    return ring.get_node(short_code)
+
+
+def cache_for(short_code: str):
+    return caches[alias_for(short_code)]
+
+
+def get(short_code: str):
+    return cache_for(short_code).get(link_cache_key(short_code))
+
+
+def store(short_code: str, entry, timeout):
+    cache_for(short_code).set(link_cache_key(short_code), entry, timeout=timeout)
+
+
+def _lock_key(short_code: str, name: str) -> str:
+    # Outside LINK_KEY_PATTERN, so key counts, samples, clears and reconcile passes never see locks.
+    return f"shortener:{name}:{short_code}"
+
+
+def add_lock(short_code: str, name: str, timeout) -> bool:
+    """Take a per-link lock such as ``refresh`` on the link's shard; False if it is held."""
+    return cache_for(short_code).add(_lock_key(short_code, name), 1, timeout=timeout)
+
+
+def delete_lock(short_code: str, name: str):
+    cache_for(short_code).delete(_lock_key(short_code, name))
+
+
+def touch(short_code: str, timeout):
+    cache_for(short_code).touch(link_cache_key(short_code), timeout)
+
+
+def delete(short_code: str):
+    cache_for(short_code).delete(link_cache_key(short_code))
+
+
+def _group_by_alias(short_codes):
+    groups = {}
+    for code in short_codes:
+        groups.setdefault(alias_for(code), []).append(code)
+    return groups
+
+
+def get_many(short_codes) -> dict:
+    """One MGET per shard; returns ``{short_code: entry}`` for the hits only."""
+    found = {}
+    for alias, codes in _group_by_alias(short_codes).items():
+        keys = {link_cache_key(code): code for code in codes}
+        for key, entry in caches[alias].get_many(list(keys)).items():
+            found[keys[key]] = entry
+    return found
+
+
+def store_many(entries: dict, timeout):
+    """Write ``{short_code: entry}`` with one pipelined set_many per shard."""
+    for alias, codes in _group_by_alias(entries).items():
+        caches[alias].set_many({link_cache_key(code): entries[code] for code in codes}, timeout=timeout)
+
+
+def delete_many(short_codes):
+    for alias, codes in _group_by_alias(short_codes).items():
+        caches[alias].delete_many([link_cache_key(code) for code in codes])
+
+
+def redis_connection(alias: str):
+    from django_redis import get_redis_connection
+    return get_redis_connection(alias)
+
+
+def fan_out(fn, aliases=None):
+    """Run ``fn(alias)`` on every shard in parallel; returns ``[(alias, result, error)]``."""
+    aliases = list(aliases or LINK_CACHE_ALIASES)
+
+    def _call(alias):
+        try:
+            return alias, fn(alias), None
+        except Exception as e:
+            return alias, None, e
+
+    if len(aliases) == 1:
+        return [_call(aliases[0])]
+    with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+        return list(pool.map(_call, aliases))
+
+
+def scan_shard(alias: str) -> list[dict]:
+    """All link keys on a shard with their TTL and type, fetched in pipelined batches."""
+    con = redis_connection(alias)
+    keys = list(con.scan_iter(match=LINK_KEY_PATTERN, count=1000))
+    items = []
+    for start in range(0, len(keys), 1000):
+        batch = keys[start:start + 1000]
+        pipe = con.pipeline(transaction=False)
+        for k in batch:
+            pipe.ttl(k)
+            pipe.type(k)
+        results = pipe.execute()
+        for k, ttl, k_type in zip(batch, results[::2], results[1::2]):
+            items.append({'key': k.decode('utf-8'), 'ttl': ttl, 'type': k_type.decode('utf-8')})
+    return items
+
+
+def scan_page(alias: str, cursor: int = 0, count: int = 1000) -> tuple[int, dict]:
+    """One SCAN step over a shard's link keys: ``(next_cursor, {short_code: raw_key})``.
+
+    A next cursor of 0 means the pass is complete.
+    """
+    prefix = link_cache_key('')
+    cursor, keys = redis_connection(alias).scan(cursor, match=LINK_KEY_PATTERN, count=count)
+    found = {key.decode('utf-8').split(prefix, 1)[1]: key for key in keys}
+    return cursor, found
+
+
+def clear_shard(alias: str) -> int:
+    con = redis_connection(alias)
+    deleted = 0
+    batch = []
+    for k in con.scan_iter(match=LINK_KEY_PATTERN, count=1000):
+        batch.append(k)
+        if len(batch) >= 1000:
+            deleted += con.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += con.unlink(*batch)
+    return deleted
+
+
+def shard_health(alias: str) -> dict:
+    con = redis_connection(alias)
+    started = time.perf_counter()
+    con.ping()
+    latency_ms = (time.perf_counter() - started) * 1000
+    return {'latency_ms': round(latency_ms, 2), 'dbsize': con.dbsize()}
+
+
+def _sample_link_memory(con, sample_size: int) -> tuple[int, float | None, bool]:
+    """``(sampled, avg_bytes, exact)`` for up to ``sample_size`` link keys.
+
+    Uses MEMORY USAGE; servers without it (some managed Redis) fall back to
+    STRLEN plus the key length, which leaves out Redis' per-key overhead.
+    """
+    keys = list(itertools.islice(con.scan_iter(match=LINK_KEY_PATTERN, count=1000), sample_size))
+    if not keys:
+        return 0, None, True
+    from redis.exceptions import ResponseError
+    try:
+        con.memory_usage(keys[0])
+        exact = True
+    except ResponseError:
+        exact = False
+    pipe = con.pipeline(transaction=False)
+    for k in keys:
+        pipe.memory_usage(k) if exact else pipe.strlen(k)
+    sizes = pipe.execute()
+    if not exact:
+        sizes = [length + len(k) for k, length in zip(keys, sizes)]
+    sizes = [size for size in sizes if size]
+    return len(sizes), (sum(sizes) / len(sizes) if sizes else None), exact
+
+
+def shard_stats(alias: str, sample_size: int = CACHE_STATS_SAMPLE_SIZE) -> dict:
+    """Memory, keyspace and eviction figures from INFO, plus sampled per-link-key memory."""
+    con = redis_connection(alias)
+    info = con.info()
+    sampled, avg_bytes, exact = _sample_link_memory(con, sample_size)
+    return {
+        'used_memory': info.get('used_memory'),
+        'used_memory_human': info.get('used_memory_human'),
+        'used_memory_peak_human': info.get('used_memory_peak_human'),
+        'maxmemory': info.get('maxmemory') or None,
+        'maxmemory_policy': info.get('maxmemory_policy'),
+        'fragmentation_ratio': info.get('mem_fragmentation_ratio'),
+        'keyspace': {name: value for name, value in info.items() if name.startswith('db') and isinstance(value, dict)},
+        'evicted_keys': info.get('evicted_keys'),
+        'expired_keys': info.get('expired_keys'),
+        'sampled_keys': sampled,
+        'avg_key_bytes': round(avg_bytes) if avg_bytes is not None else None,
+        'memory_exact': exact,
+    }
+
+
+def _pipeline_by_alias(short_codes, command, *args):
+    """Run ``command(key, *args)`` for each link key, one pipeline per shard."""
+    for alias, codes in _group_by_alias(short_codes).items():
+        cache = caches[alias]
+        pipe = redis_connection(alias).pipeline(transaction=False)
+        for code in codes:
+            getattr(pipe, command)(cache.make_key(link_cache_key(code)), *args)
+        pipe.execute()
+
+
+def persist_many(short_codes):
+    """Remove the TTL from link keys, e.g. while they are pinned as hot."""
+    _pipeline_by_alias(short_codes, 'persist')
+
+
+def expire_many(short_codes, timeout):
+    _pipeline_by_alias(short_codes, 'expire', int(timeout))
+
+
+def unlink_many(short_codes, chunk_size=1000):
+    """Drop link keys with multi-key UNLINKs (memory is freed off Redis' main thread), one pipeline per shard."""
+    for alias, codes in _group_by_alias(short_codes).items():
+        cache = caches[alias]
+        keys = [cache.make_key(link_cache_key(code)) for code in codes]
+        pipe = redis_connection(alias).pipeline(transaction=False)
+        for start in range(0, len(keys), chunk_size):
+            pipe.unlink(*keys[start:start + chunk_size])
+        pipe.execute()
@@ -0,0 +1,110 @@
+"""Recently changed short codes, for tiers that serve local copies without asking Redis.
+
+The mmap snapshot and pinned hot keys answer redirects from copies held in the
+worker. Every invalidation records the code and the time of the change in the
+``shortener:link_changes`` sorted set; each worker mirrors the set from a daemon
+thread every LINK_CHANGES_INTERVAL seconds. ``is_current`` then refuses a copy
+made before the code's last change, and refuses every copy while the mirror is
+out of date (e.g. Redis unreachable), so those requests fall through to the
+cache and the database.
+"""
+import logging
+import threading
+import time
+from django.conf import settings
+from . import link_cache
+
+logger = logging.getLogger(__name__)
+
+LINK_CHANGES_INTERVAL = getattr(settings, 'LINK_CHANGES_INTERVAL', 1.0)
+# Changes are kept this long; copies older than that are never served (rebuild the snapshot).
+LINK_CHANGES_RETENTION = getattr(settings, 'LINK_CHANGES_RETENTION', 7 * 86400)
+# Only the tiers that hand out local copies need the log.
+LINK_CHANGES_ENABLED = bool(getattr(settings, 'LINK_SNAPSHOT_PATH', None) or getattr(settings, 'HOT_KEYS_PIN', False))
+
+CHANGES_KEY = 'shortener:link_changes'
+# A mirror that has not synced for this many intervals is treated as out of date.
+STALE_AFTER_INTERVALS = 3
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def record(short_codes):
+    """Note that these codes changed now; one round trip, no-op unless a local tier is enabled."""
+    if not LINK_CHANGES_ENABLED or not short_codes:
+        return
+    stamp = now_ms()
+    try:
+        pipe = link_cache.redis_connection('default').pipeline(transaction=False)
+        pipe.zadd(CHANGES_KEY, {code: stamp for code in short_codes})
+        pipe.zremrangebyscore(CHANGES_KEY, '-inf', stamp - LINK_CHANGES_RETENTION * 1000)
+        pipe.execute()
+    except Exception:
+        logger.debug("Recording link changes failed for %d codes", len(short_codes))
+
+
+class ChangeMirror:
+    """This worker's copy of the change log from ``since_ms`` on."""
+
+    def __init__(self, since_ms: int):
+        # Changes before this were never mirrored, so copies older than it are refused.
+        self.start_ms = since_ms
+        self.since_ms = since_ms
+        self.changed = {}
+        self.synced_at = None
+        self.horizon_ms = 0
+        self._thread = None
+
+    def sync(self, con):
+        """Fetch changes at or after the newest one seen; the boundary is re-read, which is harmless."""
+        rows = con.zrangebyscore(CHANGES_KEY, self.since_ms, '+inf', withscores=True)
+        for code, score in rows:
+            code = code.decode('utf-8') if isinstance(code, bytes) else code
+            self.changed[code] = max(int(score), self.changed.get(code, 0))
+            self.since_ms = max(self.since_ms, int(score))
+        self.horizon_ms = now_ms() - LINK_CHANGES_RETENTION * 1000
+        self.synced_at = time.monotonic()
+
+    def fresh(self) -> bool:
+        return self.synced_at is not None and time.monotonic() - self.synced_at < STALE_AFTER_INTERVALS * LINK_CHANGES_INTERVAL
+
+    def is_current(self, short_code: str, copied_at_ms: int) -> bool:
+        return (self.fresh() and self.horizon_ms < copied_at_ms and self.start_ms <= copied_at_ms
+                and self.changed.get(short_code, 0) < copied_at_ms)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='link-changes', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync(link_cache.redis_connection('default'))
+            except Exception as e:
+                logger.debug("Link change sync failed: %s", e)
+            time.sleep(LINK_CHANGES_INTERVAL)
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """The process-wide mirror, started on first use from the snapshot's build time (or now)."""
+    global _mirror
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                from .snapshot import get_snapshot
+                snapshot = get_snapshot()
+                _mirror = ChangeMirror(snapshot.built_at * 1000 if snapshot is not None else now_ms())
+                _mirror.start()
+    return _mirror
+
+
+def is_current(short_code: str, copied_at_ms: int) -> bool:
+    """Whether a local copy of ``short_code`` taken at ``copied_at_ms`` may still be served."""
+    return get_mirror().is_current(short_code, copied_at_ms)
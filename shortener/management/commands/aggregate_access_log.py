@@ -0,0 +1,75 @@
+import json
+import os
+from collections import defaultdict
+from urllib.parse import unquote
+from django.core.management.base import BaseCommand, CommandError
+from shortener.access_log import ACCESS_LOG_PATH, ACCESS_LOG_BACKUPS, STATUSES
+
+
+def _default_files():
+    """The live log and its rotated backups, oldest first."""
+    if not ACCESS_LOG_PATH:
+        return []
+    candidates = [f"{ACCESS_LOG_PATH}.{i}" for i in range(ACCESS_LOG_BACKUPS, 0, -1)] + [ACCESS_LOG_PATH]
+    return [path for path in candidates if os.path.exists(path)]
+
+
+class Command(BaseCommand):
+    help = "Roll the redirect access log up into per-link counts (hits, misses, 404s, 410s, visitors, latency)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help="Log files to read (default: ACCESS_LOG_PATH and its backups).")
+        parser.add_argument('--since', default=None, help="Only lines at or after this ISO timestamp, e.g. 2026-10-01.")
+        parser.add_argument('--top', type=int, default=50, help="How many links to list, busiest first (0 for all).")
+        parser.add_argument('--json', action='store_true', help="Emit JSON instead of a table.")
+
+    def handle(self, *args, **options):
+        files = options['files'] or _default_files()
+        if not files:
+            raise CommandError("No access log files; set ACCESS_LOG_PATH or pass file paths.")
+
+        since = options['since']
+        stats = defaultdict(lambda: {'total': 0, **{status: 0 for status in STATUSES}, 'latency_ms': 0.0, 'visitors': set()})
+        skipped = 0
+        for path in files:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 6 or parts[2] not in STATUSES:
+                        skipped += 1
+                        continue
+                    stamp, code, status, latency, client_ip, ua_hash = parts
+                    # ISO timestamps compare correctly as strings.
+                    if since and stamp < since:
+                        continue
+                    entry = stats[unquote(code)]
+                    entry['total'] += 1
+                    entry[status] += 1
+                    entry['latency_ms'] += float(latency)
+                    entry['visitors'].add((client_ip, ua_hash))
+
+        rows = sorted(stats.items(), key=lambda kv: -kv[1]['total'])
+        if options['top']:
+            rows = rows[:options['top']]
+        report = [
+            {
+                'short_code': code,
+                'total': entry['total'],
+                **{status: entry[status] for status in STATUSES},
+                'visitors': len(entry['visitors']),
+                'avg_latency_ms': round(entry['latency_ms'] / entry['total'], 2),
+            }
+            for code, entry in rows
+        ]
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"{'short code':<20} {'total':>8} {'hit':>8} {'miss':>8} {'404':>8} {'410':>8} {'visitors':>9} {'avg ms':>8}")
+            for row in report:
+                self.stdout.write(
+                    f"{row['short_code']:<20} {row['total']:>8} {row['hit']:>8} {row['miss']:>8} {row['404']:>8} {row['410']:>8} "
+                    f"{row['visitors']:>9} {row['avg_latency_ms']:>8.2f}"
+                )
+        if skipped:
+            self.stderr.write(f"Skipped {skipped} malformed lines.")
@@ -0,0 +1,57 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from shortener.models import Link
+from shortener.services import resolve_link
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark cache-miss link lookups: full-row fetch vs the column-pruned resolve_link."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--seed-links', type=int, default=0,
+                            help="Insert this many synthetic links for the run; they are rolled back afterwards.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['seed_links']:
+                    Link.objects.bulk_create(
+                        [Link(original_url=f"https://example.com/bench/{i}/" + "x" * 200, short_code=f"bench{i}")
+                         for i in range(options['seed_links'])],
+                        batch_size=1000,
+                    )
+                codes = list(Link.objects.values_list('short_code', flat=True)[:10000])
+                if not codes:
+                    raise CommandError("No links to benchmark; pass --seed-links.")
+                self._run(codes, options['iterations'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, codes, iterations):
+        variants = (
+            ('full row (before)', lambda code: Link.objects.get(short_code=code)),
+            ('pruned (after)', resolve_link),
+        )
+        for label, lookup in variants:
+            sample = [random.choice(codes) for _ in range(iterations)]
+            for code in sample[:50]:
+                lookup(code)
+            timings = []
+            for code in sample:
+                started = time.perf_counter()
+                lookup(code)
+                timings.append((time.perf_counter() - started) * 1e6)
+            timings.sort()
+            self.stdout.write(
+                f"{label:<18} mean={statistics.fmean(timings):8.1f}us "
+                f"p50={timings[len(timings) // 2]:8.1f}us p95={timings[int(len(timings) * 0.95)]:8.1f}us"
+            )
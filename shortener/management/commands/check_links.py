@@ -0,0 +1,166 @@
+import asyncio
+import math
+import ssl
+import time
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+from urllib.parse import urlsplit
+import certifi
+import httpx
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from shortener.models import Link, LinkCheck
+from shortener.services import bump_links_table_generation
+
+USER_AGENT = 'ZLink link checker'
+# Servers that refuse or mishandle HEAD get the same URL again with GET.
+HEAD_FALLBACK_STATUSES = {403, 405, 501}
+
+
+async def check_url(client: httpx.AsyncClient, url: str) -> dict:
+    """HEAD ``url`` following redirects, falling back to a bodiless GET; never raises."""
+    started = time.perf_counter()
+    status_code, final_url, error = None, '', ''
+    try:
+        response = await client.head(url)
+        if response.status_code in HEAD_FALLBACK_STATUSES:
+            # Stream so only the headers are read; the body is discarded unread.
+            async with client.stream('GET', url) as response:
+                pass
+        status_code, final_url = response.status_code, str(response.url)
+    except httpx.TimeoutException:
+        error = 'timeout'
+    except Exception as e:
+        # HTTPError, but also InvalidURL (e.g. a bad IDNA host) and anything else a target provokes.
+        error = f"{type(e).__name__}: {e}"
+    return {
+        'status_code': status_code,
+        'final_url': final_url[:2000],
+        'error': error[:200],
+        'latency_ms': round((time.perf_counter() - started) * 1000),
+    }
+
+
+def _fetch_chunk(after_id: int, size: int, checked_before):
+    """Next ``(id, original_url)`` rows by id, skipping links checked since ``checked_before``."""
+    queryset = Link.objects.filter(id__gt=after_id).order_by('id')
+    if checked_before:
+        queryset = queryset.exclude(health__checked_at__gte=checked_before)
+    return list(queryset.values_list('id', 'original_url')[:size])
+
+
+def _save_results(results):
+    """Upsert one row per link; links deleted while being checked are skipped."""
+    existing = set(Link.objects.filter(id__in=[link_id for link_id, _, _ in results]).values_list('id', flat=True))
+    LinkCheck.objects.bulk_create(
+        [LinkCheck(link_id=link_id, checked_at=checked_at, **result)
+         for link_id, checked_at, result in results if link_id in existing],
+        update_conflicts=True,
+        unique_fields=['link'],
+        update_fields=['status_code', 'error', 'latency_ms', 'final_url', 'checked_at'],
+        batch_size=500,
+    )
+
+
+class Command(BaseCommand):
+    help = "Check link targets concurrently and record status, latency and final URL for the dashboard."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=200, help="Requests in flight overall.")
+        parser.add_argument('--per-host', type=int, default=8, help="Requests in flight to any one host.")
+        parser.add_argument('--timeout', type=float, default=10.0, help="Seconds per request, connect and read.")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Links read, and results written, per batch.")
+        parser.add_argument('--older-than', type=float, default=None,
+                            help="Only links not checked in this many hours (default: every link).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        totals = asyncio.run(self._run(options))
+        bump_links_table_generation()
+        elapsed = time.perf_counter() - started
+        checked = sum(totals.values())
+        self.stdout.write(
+            f"Checked {checked} links in {elapsed:.1f}s ({checked / elapsed if elapsed else 0:.0f}/s): "
+            f"{totals['ok']} ok, {totals['broken']} broken (4xx/5xx), {totals['failed']} unreachable"
+        )
+
+    async def _run(self, options):
+        concurrency, chunk_size = options['concurrency'], options['chunk_size']
+        checked_before = None
+        if options['older_than'] is not None:
+            checked_before = timezone.now() - timedelta(hours=options['older_than'])
+
+        global_slots = asyncio.Semaphore(concurrency)
+        host_slots = defaultdict(lambda: asyncio.Semaphore(options['per_host']))
+        # Links scheduled but not finished, including those waiting on a busy host.
+        pending = asyncio.Semaphore(concurrency * 4)
+        tasks = set()
+        results = []
+        totals = {'ok': 0, 'broken': 0, 'failed': 0}
+        fetch = sync_to_async(_fetch_chunk)
+        save = sync_to_async(_save_results)
+
+        # httpcore scans its whole pool for every request, so one pool of `concurrency`
+        # connections costs milliseconds of CPU per check. Hosts are spread over small pools
+        # instead; a host always maps to the same pool, so its connections are reused.
+        pool_size = options['per_host'] * 2
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        clients = [
+            httpx.AsyncClient(
+                follow_redirects=True,
+                verify=ssl_context,
+                timeout=httpx.Timeout(options['timeout']),
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                headers={'User-Agent': USER_AGENT},
+            )
+            for _ in range(max(1, math.ceil(concurrency / options['per_host'])))
+        ]
+
+        async def _check(link_id, url):
+            try:
+                host = urlsplit(url).hostname or ''
+            except ValueError:
+                host = ''
+            client = clients[zlib.crc32(host.encode('utf-8', 'replace')) % len(clients)]
+            try:
+                async with host_slots[host], global_slots:
+                    result = await check_url(client, url)
+                results.append((link_id, timezone.now(), result))
+                if result['status_code'] is None:
+                    totals['failed'] += 1
+                elif result['status_code'] < 400:
+                    totals['ok'] += 1
+                else:
+                    totals['broken'] += 1
+            finally:
+                pending.release()
+
+        async def _flush():
+            batch = results[:]
+            del results[:len(batch)]
+            if batch:
+                await save(batch)
+
+        try:
+            after_id = 0
+            while rows := await fetch(after_id, chunk_size, checked_before):
+                for link_id, url in rows:
+                    await pending.acquire()
+                    task = asyncio.create_task(_check(link_id, url))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                after_id = rows[-1][0]
+                if len(results) >= chunk_size:
+                    await _flush()
+                    self.stdout.write(f"  {sum(totals.values())} checked, up to link id {after_id}")
+            # A check that crashes must not cancel the rest; its link is simply left unrecorded.
+            for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(outcome, Exception):
+                    self.stderr.write(f"  check failed: {type(outcome).__name__}: {outcome}")
+        finally:
+            for client in clients:
+                await client.aclose()
+        await _flush()
+        return totals
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from shortener import replica
+
+
+class Command(BaseCommand):
+    help = "Publish the link replica snapshot to Redis and report replica memory usage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--publish-snapshot', action='store_true',
+                            help="Rebuild the snapshot from the database and store it in Redis.")
+
+    def handle(self, *args, **options):
+        if options['publish_snapshot']:
+            started = time.perf_counter()
+            size = replica.publish_snapshot()
+            self.stdout.write(f"Snapshot published: {size} bytes compressed in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        local = replica.LinkReplica()
+        local.load()
+        load_time = time.perf_counter() - started
+        usage = local.memory_usage()
+        self.stdout.write(
+            f"Replica: {usage['links']} links, {usage['bytes'] / 1024 / 1024:.1f} MiB in memory, "
+            f"{usage['bytes_per_million'] / 1024 / 1024:.1f} MiB per million links, loaded in {load_time:.2f}s"
+        )
@@ -0,0 +1,115 @@
+import time
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from shortener import link_cache
+from shortener.models import Link
+from shortener.services import cache_entry_matches
+from shortener.utils import link_cache_key
+
+RECONCILE_KEY = 'shortener:reconcile'
+DRIFT_KINDS = ('orphaned', 'stale', 'misplaced')
+
+
+def _state_key(alias: str) -> str:
+    return f"{RECONCILE_KEY}:{alias}"
+
+
+def reconcile_page(alias: str, codes: dict, dry_run: bool = False) -> dict:
+    """Compare one SCAN page with the database and evict entries that drifted from it.
+
+    * orphaned: no link with that code any more
+    * stale: the link's target, id or rules changed since the entry was written
+    * misplaced: the ring maps the code to another shard (left over after a resize)
+
+    Entries are read before the database, so an update racing with the check can only
+    cause an unnecessary eviction, never keep an old target. Evicted codes are
+    re-cached from the database by their next redirect.
+    """
+    counts = {'scanned': len(codes), **{kind: 0 for kind in DRIFT_KINDS}}
+    if not codes:
+        return counts
+    misplaced = [code for code in codes if link_cache.alias_for(code) != alias]
+    cached = caches[alias].get_many([link_cache_key(code) for code in codes if code not in misplaced])
+    entries = {key[len(link_cache_key('')):]: entry for key, entry in cached.items()}
+    links = {
+        link.short_code: link
+        for link in Link.objects.filter(short_code__in=list(entries)).only('id', 'short_code', 'original_url', 'rules', 'expires_at')
+    }
+    orphaned = [code for code in entries if code not in links]
+    stale = [code for code, entry in entries.items() if code in links and not cache_entry_matches(entry, links[code])]
+
+    counts.update(orphaned=len(orphaned), stale=len(stale), misplaced=len(misplaced))
+    evict = misplaced + orphaned + stale
+    if evict and not dry_run:
+        link_cache.redis_connection(alias).unlink(*[codes[code] for code in evict])
+    return counts
+
+
+class Command(BaseCommand):
+    help = "Scan cached links shard by shard and evict entries that no longer match the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500, help="SCAN COUNT hint, and the size of each DB lookup.")
+        parser.add_argument('--batches', type=int, default=0,
+                            help="Stop after this many SCAN pages per shard (default: finish the pass).")
+        parser.add_argument('--sleep', type=float, default=0.05, help="Seconds to pause between pages.")
+        parser.add_argument('--loop', action='store_true', help="Run continuously, pass after pass.")
+        parser.add_argument('--interval', type=float, default=60.0, help="With --loop, seconds between passes.")
+        parser.add_argument('--alias', action='append', choices=link_cache.LINK_CACHE_ALIASES,
+                            help="Only these shards (repeatable).")
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without evicting anything.")
+        parser.add_argument('--reset', action='store_true', help="Discard the saved cursors and start a new pass.")
+
+    def handle(self, *args, **options):
+        aliases = options['alias'] or link_cache.LINK_CACHE_ALIASES
+        if options['count'] < 1:
+            raise CommandError("--count must be positive.")
+        if options['reset']:
+            for alias in aliases:
+                link_cache.redis_connection(alias).delete(_state_key(alias))
+        while True:
+            for alias in aliases:
+                self._run_shard(alias, options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def _run_shard(self, alias, options):
+        """Resume the shard's pass from its saved cursor; progress is saved after every page."""
+        con = link_cache.redis_connection(alias)
+        key = _state_key(alias)
+        state = {name.decode('utf-8'): int(value) for name, value in con.hgetall(key).items()}
+        cursor = state.get('cursor', 0)
+        pages = 0
+        while True:
+            cursor, codes = link_cache.scan_page(alias, cursor, options['count'])
+            counts = reconcile_page(alias, codes, options['dry_run'])
+            pages += 1
+            pipe = con.pipeline(transaction=False)
+            for name, value in counts.items():
+                pipe.hincrby(key, name, value)
+            pipe.hset(key, 'cursor', cursor)
+            totals = pipe.execute()[:len(counts)]
+            if cursor == 0:
+                break
+            if options['batches'] and pages >= options['batches']:
+                self.stdout.write(f"{alias}: paused at cursor {cursor} after {pages} pages, {self._summary(counts.keys(), totals)} so far this pass")
+                return
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        # Pass complete: keep its totals for reporting and start the next one from scratch.
+        pipe = con.pipeline(transaction=False)
+        pipe.delete(key)
+        pipe.hset(key, mapping={'cursor': 0, 'last_pass_at': int(time.time()),
+                                **{f"last_{name}": value for name, value in zip(counts, totals)}})
+        pipe.execute()
+        drift = sum(value for name, value in zip(counts, totals) if name in DRIFT_KINDS)
+        self.stdout.write(
+            f"{alias}: pass complete, {self._summary(counts.keys(), totals)}"
+            + (" (dry run, nothing evicted)" if options['dry_run'] and drift else "")
+        )
+
+    @staticmethod
+    def _summary(names, totals):
+        return ", ".join(f"{value} {name}" for name, value in zip(names, totals))
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from shortener import ga4
+
+
+class Command(BaseCommand):
+    help = "Replay GA4 events spooled to disk while the Measurement Protocol endpoint was slow or unreachable."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ga4.GA_MAX_EVENTS_PER_REQUEST)
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop after this many batches per pass.")
+        parser.add_argument('--loop', action='store_true', help="Keep draining, backing off while the endpoint fails.")
+        parser.add_argument('--interval', type=float, default=10.0, help="Seconds between passes when the spool is empty.")
+        parser.add_argument('--max-backoff', type=float, default=300.0)
+
+    def handle(self, *args, **options):
+        spool = ga4.get_spool()
+        if spool is None:
+            raise CommandError("GA4_SPOOL_DIR is not configured.")
+
+        backoff = 1.0
+        while True:
+            sent, ok = spool.drain(ga4.send_ga4_batch, batch_size=options['batch_size'], max_batches=options['max_batches'])
+            if sent or not ok:
+                self.stdout.write(f"Replayed {sent} events" + ("" if ok else ", endpoint failing"))
+            if not options['loop']:
+                if not ok:
+                    raise CommandError(f"Replay stopped after {sent} events; {spool.pending_count()} still spooled.")
+                break
+
+            if ok:
+                backoff = 1.0
+                time.sleep(options['interval'])
+            else:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, options['max_backoff'])
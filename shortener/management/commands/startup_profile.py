@@ -0,0 +1,103 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules a redirect cold start must not load; they belong to the dashboard, API or GA4 dispatch.
+REDIRECT_EXCLUDED_MODULES = ('requests', 'urllib3', 'shortener.views', 'shortener.forms', 'shortener.api')
+
+# Runs in a fresh interpreter: boot the WSGI app the way a serverless cold start does,
+# then resolve one URL, which imports the URLconf and the view that serves it, and
+# reverse any URL names given after it.
+_BOOT_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zlink.settings')
+from zlink.wsgi import application
+booted = time.perf_counter()
+from django.urls import resolve, reverse
+match = resolve(sys.argv[1])
+resolved = time.perf_counter()
+reversed_urls = [reverse(name) for name in sys.argv[2:]]
+print(json.dumps({
+    'boot_ms': (booted - started) * 1000,
+    'resolve_ms': (resolved - booted) * 1000,
+    'view': match._func_path,
+    'reversed': reversed_urls,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+
+def _parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """``(module, self_us, cumulative_us)`` from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure_startup(path: str = '/x/', importtime: bool = False, reverse_names=()) -> dict:
+    """Boot the app in a subprocess, resolve ``path`` and reverse ``reverse_names``; returns timings and the modules loaded."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', _BOOT_SCRIPT, path, *reverse_names]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(settings.BASE_DIR), os.environ.get('PYTHONPATH')])))
+    result = subprocess.run(command, capture_output=True, text=True, cwd=settings.BASE_DIR, env=env)
+    if result.returncode != 0:
+        raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['imports'] = _parse_importtime(result.stderr) if importtime else []
+    return report
+
+
+class Command(BaseCommand):
+    help = "Profile a cold start: boot the WSGI app in a fresh interpreter and report import-time breakdown."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/x/', help="URL to resolve after boot (default: a short-code redirect).")
+        parser.add_argument('--top', type=int, default=20, help="How many modules and packages to list.")
+        parser.add_argument('--runs', type=int, default=5, help="Timed runs (without importtime) for the median.")
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help="Fail if median boot + resolve exceeds this many milliseconds.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        profile = measure_startup(path, importtime=True)
+        imports = profile['imports']
+
+        self.stdout.write(f"Resolved {path} -> {profile['view']}")
+        self.stdout.write(f"{len(profile['modules'])} modules loaded, "
+                          f"{sum(s for _, s, _ in imports) / 1000:.1f}ms spent importing")
+
+        by_package = defaultdict(int)
+        for name, self_us, _ in imports:
+            by_package[name.split('.')[0]] += self_us
+        self.stdout.write("\nSelf time by top-level package:")
+        for package, total in sorted(by_package.items(), key=lambda kv: -kv[1])[:options['top']]:
+            self.stdout.write(f"  {total / 1000:8.1f}ms  {package}")
+
+        self.stdout.write("\nSlowest modules (cumulative, including what they import):")
+        for name, _, cumulative in sorted(imports, key=lambda row: -row[2])[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+        loaded = set(profile['modules'])
+        excluded = [m for m in REDIRECT_EXCLUDED_MODULES if m in loaded]
+        if profile['view'].startswith('shortener.redirects.') and excluded:
+            self.stdout.write(self.style.WARNING(f"\nRedirect path loaded {', '.join(excluded)}"))
+
+        timings = sorted(
+            run['boot_ms'] + run['resolve_ms'] for run in (measure_startup(path) for _ in range(options['runs']))
+        )
+        median = timings[len(timings) // 2]
+        self.stdout.write(f"\nBoot + resolve, median of {len(timings)}: {median:.1f}ms "
+                          f"(min {timings[0]:.1f}ms, max {timings[-1]:.1f}ms)")
+        if options['budget_ms'] is not None and median > options['budget_ms']:
+            raise CommandError(f"Cold start {median:.1f}ms exceeds the {options['budget_ms']:.0f}ms budget.")
@@ -0,0 +1,59 @@
+import json
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from shortener.models import Link
+from shortener.services import BULK_CHUNK_SIZE, bulk_delete_links
+
+ARCHIVE_FIELDS = ('id', 'short_code', 'original_url', 'rules', 'created_at', 'expires_at')
+
+
+class Command(BaseCommand):
+    help = "Delete expired links in bounded batches, evicting their cache entries with one pipeline per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BULK_CHUNK_SIZE, help="Links deleted per transaction.")
+        parser.add_argument('--grace', type=float, default=0.0,
+                            help="Keep links this many hours past their expiry (they keep answering 410).")
+        parser.add_argument('--archive', default=None,
+                            help="Append each link to this file as a JSON line before deleting it.")
+        parser.add_argument('--sleep', type=float, default=0.1, help="Seconds to pause between batches.")
+        parser.add_argument('--limit', type=int, default=0, help="Stop after this many links (default: all).")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the links that would be deleted.")
+
+    def handle(self, *args, **options):
+        batch_size, limit = options['batch_size'], options['limit']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+        cutoff = timezone.now() - timedelta(hours=options['grace'])
+        # Served by the partial index on expires_at.
+        expired = Link.objects.filter(expires_at__lte=cutoff)
+        if options['dry_run']:
+            self.stdout.write(f"{expired.count()} links expired before {cutoff:%Y-%m-%d %H:%M:%S %Z}.")
+            return
+
+        started = time.perf_counter()
+        archive = open(options['archive'], 'a', encoding='utf-8') if options['archive'] else None
+        deleted = 0
+        try:
+            while not limit or deleted < limit:
+                size = min(batch_size, limit - deleted) if limit else batch_size
+                rows = list(expired.order_by('expires_at').values(*ARCHIVE_FIELDS)[:size])
+                if not rows:
+                    break
+                if archive:
+                    archive.writelines(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+                    archive.flush()
+                # Re-checked in the DELETE: a link whose expiry was just extended is kept.
+                deleted += bulk_delete_links(expired.filter(pk__in=[row['id'] for row in rows]))
+                self.stdout.write(f"  {deleted} deleted")
+                if len(rows) < size:
+                    break
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+        finally:
+            if archive:
+                archive.close()
+        self.stdout.write(f"Deleted {deleted} expired links in {time.perf_counter() - started:.1f}s.")
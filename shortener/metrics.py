@@ -0,0 +1,86 @@
+"""In-process counters, periodically added to a Redis hash shared by all workers.
+
+``incr`` only bumps a local Counter. Every METRICS_FLUSH_INTERVAL seconds a daemon
+thread (and, at exit, the exiting thread) sends the increments since the last flush
+with one pipelined HINCRBY per counter, so the settings cache page can show totals
+across workers. Requests never wait on Redis.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+METRICS_KEY = 'shortener:metrics'
+
+_lock = threading.Lock()
+_counters = Counter()
+_flushed = Counter()
+_flusher = None
+
+
+def incr(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] += amount
+    if _flusher is None:
+        _start_flusher()
+
+
+def _start_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_flusher, name='metrics', daemon=True)
+            _flusher.start()
+
+
+def _run_flusher():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def snapshot() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def flush():
+    """Send the increments since the last flush to Redis; on failure they are kept for the next one."""
+    with _lock:
+        pending = {name: value - _flushed[name] for name, value in _counters.items() if value != _flushed[name]}
+        _flushed.update(pending)
+    if not pending:
+        return
+    try:
+        from .link_cache import redis_connection
+        pipe = redis_connection('default').pipeline(transaction=False)
+        pipe.hsetnx(METRICS_KEY, 'since', int(time.time()))
+        for name, amount in pending.items():
+            pipe.hincrby(METRICS_KEY, name, amount)
+        pipe.execute()
+    except Exception:
+        logger.debug("Metrics flush failed")
+        with _lock:
+            _flushed.subtract(pending)
+
+
+atexit.register(flush)
+
+
+def totals() -> dict:
+    """Counters summed across workers, plus ``since`` (epoch seconds of the first flush after a reset)."""
+    from .link_cache import redis_connection
+    flush()
+    raw = redis_connection('default').hgetall(METRICS_KEY)
+    return {name.decode('utf-8'): int(value) for name, value in raw.items()}
+
+
+def reset():
+    from .link_cache import redis_connection
+    flush()
+    redis_connection('default').delete(METRICS_KEY)
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 10:36
+
+import shortener.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0004_profile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='link',
+            name='short_code',
+            field=models.CharField(db_index=True, default=shortener.models.generate_short_code, max_length=15, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['short_code'], include=('original_url', 'id'), name='link_code_covering_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0005_link_code_covering_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='link',
+            name='link_code_covering_idx',
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='rules',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['short_code'], include=('original_url', 'id', 'rules'), name='link_code_covering_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+def create_trigram_index(apps, schema_editor):
+    # Serves original_url__icontains, which Django compiles to UPPER(original_url::text) LIKE ...
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS link_url_trgm_idx ON shortener_link '
+        'USING gin (UPPER(original_url::text) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS link_url_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0006_link_rules'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['-created_at', '-id'], name='link_created_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-19 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0007_link_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinkCheck',
+            fields=[
+                ('link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='health', serialize=False, to='shortener.link')),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('final_url', models.URLField(blank=True, max_length=2000)),
+                ('checked_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0008_linkcheck'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='link',
+            name='link_code_covering_idx',
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['short_code'], include=('original_url', 'id', 'rules', 'expires_at'), name='link_code_covering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(condition=models.Q(('expires_at__isnull', False)), fields=['expires_at'], name='link_expires_idx'),
+        ),
+    ]
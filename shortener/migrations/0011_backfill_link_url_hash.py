@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-19 15:06
+
+from django.db import migrations, transaction
+from shortener.urlhash import url_hash
+
+BATCH_SIZE = 2000
+
+
+def backfill_url_hash(apps, schema_editor):
+    # Keyset batches, each committed on its own, so a large table is never locked as a whole.
+    Link = apps.get_model('shortener', 'Link')
+    last_id = 0
+    while True:
+        batch = list(
+            Link.objects.filter(id__gt=last_id, url_hash__isnull=True)
+            .order_by('id').only('id', 'original_url')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for link in batch:
+            link.url_hash = url_hash(link.original_url)
+        with transaction.atomic():
+            Link.objects.bulk_update(batch, ['url_hash'], batch_size=500)
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('shortener', '0010_link_url_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_url_hash, migrations.RunPython.noop),
+    ]
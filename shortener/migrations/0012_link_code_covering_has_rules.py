@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0011_backfill_link_url_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='link',
+            name='link_code_covering_idx',
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='has_rules',
+            field=models.GeneratedField(db_persist=True, expression=models.Q(('rules__isnull', False)), output_field=models.BooleanField()),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['short_code'], include=('original_url', 'id', 'has_rules', 'expires_at'), name='link_code_covering_idx'),
+        ),
+    ]
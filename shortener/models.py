@@ -1,12 +1,17 @@
 from django.db import models
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.contrib.auth.models import User
 import string
 import random
+from .urlhash import url_hash
+
+def random_short_code(length=6):
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
 def generate_short_code():
-    length = 6
     while True:
-        code = ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+        code = random_short_code()
         if not Link.objects.filter(short_code=code).exists():
             return code
 
@@ -14,10 +19,69 @@ class Link(models.Model):
     original_url = models.URLField()
     short_code = models.CharField(max_length=15, unique=True, default=generate_short_code, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Optional conditional redirect rules, see shortener/rules.py for the format.
+    rules = models.JSONField(blank=True, null=True)
+    # Kept by the database. The covering index carries this flag instead of the unbounded
+    # rules document, so only links that have rules need a second fetch.
+    has_rules = models.GeneratedField(
+        expression=models.Q(rules__isnull=False), output_field=models.BooleanField(), db_persist=True,
+    )
+    # Past this moment the code answers 410 Gone; manage.py sweep_expired_links removes the row.
+    expires_at = models.DateTimeField(blank=True, null=True)
+    # Hash of the normalised original_url (shortener/urlhash.py), set on save. Lets
+    # "reuse the existing link" look up a target with one small index probe.
+    url_hash = models.BigIntegerField(blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Lets the redirect fallback be an index-only scan on PostgreSQL.
+            # Backends without INCLUDE support (SQLite) create a plain index.
+            models.Index(fields=['short_code'], include=['original_url', 'id', 'has_rules', 'expires_at'], name='link_code_covering_idx'),
+            # Newest-first listing and keyset pagination in shortener/search.py.
+            models.Index(fields=['-created_at', '-id'], name='link_created_idx'),
+            # Only expiring links are indexed, for the sweeper; most links never expire.
+            models.Index(fields=['expires_at'], condition=models.Q(expires_at__isnull=False), name='link_expires_idx'),
+            models.Index(fields=['url_hash'], name='link_url_hash_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.url_hash = url_hash(self.original_url)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'original_url' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'url_hash'}
+        super().save(*args, **kwargs)
+
+    @property
+    def is_expired(self):
+        return self.expires_at is not None and self.expires_at <= timezone.now()
+
+    def clean(self):
+        from .rules import compile_rules
+        try:
+            compile_rules(self.rules)
+        except ValueError as e:
+            raise ValidationError({'rules': str(e)})
 
     def __str__(self):
         return f"{self.short_code} -> {self.original_url}"
 
+class LinkCheck(models.Model):
+    """Latest health check of a link's target, written by ``manage.py check_links``."""
+    link = models.OneToOneField(Link, on_delete=models.CASCADE, primary_key=True, related_name='health')
+    # None when no response arrived (timeout, DNS or connection error); see ``error``.
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    error = models.CharField(max_length=200, blank=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    final_url = models.URLField(max_length=2000, blank=True)
+    checked_at = models.DateTimeField(db_index=True)
+
+    @property
+    def ok(self):
+        return self.status_code is not None and self.status_code < 400
+
+    def __str__(self):
+        return f"{self.link_id}: {self.status_code or self.error}"
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar_url = models.URLField(max_length=500, blank=True, null=True)
@@ -0,0 +1,224 @@
+"""On-demand profiling of single requests, for superusers.
+
+Settings > Profiler hands out a signed token. A request carrying it in the
+``X-Profile-Token`` header (or the ``_profile`` query parameter) is run under
+cProfile, with every SQL query (via ``connection.execute_wrapper``) and Django
+cache call timed. The report is kept in the default cache for PROFILE_REPORT_TTL
+seconds, listed on the settings page, and its id returned in ``X-Profile-Id``.
+
+Any other request pays one check for the header and the parameter.
+"""
+import logging
+import time
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = getattr(settings, 'PROFILING_ENABLED', True)
+PROFILE_TOKEN_MAX_AGE = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600)
+PROFILE_REPORT_TTL = getattr(settings, 'PROFILE_REPORT_TTL', 900)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE_TOKEN'
+PROFILE_PARAM = '_profile'
+PROFILES_KEY = 'shortener:profiles'
+# Queries and cache calls kept per report (all are counted and timed), and reports listed.
+PROFILE_MAX_EVENTS = 500
+PROFILE_INDEX_SIZE = 50
+PROFILE_FUNCTIONS = 40
+
+CACHE_METHODS = (
+    'get', 'get_many', 'get_or_set', 'set', 'set_many', 'add', 'touch',
+    'delete', 'delete_many', 'has_key', 'incr', 'decr',
+)
+_SALT = 'shortener.profiling'
+
+
+def make_token(user) -> str:
+    return signing.TimestampSigner(salt=_SALT).sign(str(user.pk))
+
+
+def token_user(token: str):
+    """The active superuser ``token`` was issued to, or None if it is invalid or expired."""
+    try:
+        user_id = signing.TimestampSigner(salt=_SALT).unsign(token, max_age=PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    from .auth import CachedModelBackend
+    user = CachedModelBackend().get_user(user_id)
+    return user if user is not None and user.is_superuser else None
+
+
+def report_key(report_id: str) -> str:
+    return f"{PROFILES_KEY}:{report_id}"
+
+
+def get_report(report_id: str):
+    try:
+        return cache.get(report_key(report_id))
+    except Exception:
+        logger.debug("Cache get failed for profile %s", report_id)
+        return None
+
+
+def recent_reports() -> list:
+    """Summaries of the reports still stored, newest first."""
+    try:
+        recent = cache.get(PROFILES_KEY) or []
+    except Exception:
+        logger.debug("Cache get failed for profile index")
+        return []
+    cutoff = time.time() - PROFILE_REPORT_TTL
+    return [summary for summary in recent if summary['at'] > cutoff]
+
+
+def _store(report):
+    summary = {name: report[name] for name in ('id', 'at', 'method', 'path', 'status', 'total_ms', 'user')}
+    summary.update(queries=report['sql']['count'], cache_calls=report['cache']['count'])
+    try:
+        cache.set(report_key(report['id']), report, PROFILE_REPORT_TTL)
+        # Last writer wins if two profiled requests finish together; that only drops a listing.
+        cache.set(PROFILES_KEY, [summary, *recent_reports()][:PROFILE_INDEX_SIZE], PROFILE_REPORT_TTL)
+    except Exception:
+        logger.debug("Cache set failed for profile %s", report['id'])
+
+
+def _describe_key(key) -> str:
+    if isinstance(key, (list, tuple, set, dict)):
+        return f"{len(key)} keys"
+    return str(key)
+
+
+class _Recorder:
+    """Collects timed SQL queries and cache calls for one request."""
+
+    def __init__(self):
+        self.sql = {'count': 0, 'ms': 0.0, 'events': []}
+        self.cache = {'count': 0, 'ms': 0.0, 'hits': 0, 'misses': 0, 'events': []}
+
+    @staticmethod
+    def _add(totals, event):
+        totals['count'] += 1
+        totals['ms'] += event['ms']
+        if len(totals['events']) < PROFILE_MAX_EVENTS:
+            totals['events'].append(event)
+
+    def sql_wrapper(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self._add(self.sql, {'alias': alias, 'sql': sql, 'many': many,
+                                     'ms': (time.perf_counter() - started) * 1000})
+        return wrapper
+
+    def cache_wrapper(self, alias, name, method):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = method(*args, **kwargs)
+            key = args[0] if args else None
+            event = {'alias': alias, 'op': name, 'key': _describe_key(key) if args else '',
+                     'ms': (time.perf_counter() - started) * 1000, 'hits': ''}
+            if name == 'get':
+                hits, lookups = int(result is not None), 1
+            elif name == 'get_many' and hasattr(key, '__len__'):
+                hits, lookups = len(result), len(key)
+            else:
+                hits = lookups = 0
+            if lookups:
+                event['hits'] = f"{hits}/{lookups}"
+                self.cache['hits'] += hits
+                self.cache['misses'] += lookups - hits
+            self._add(self.cache, event)
+            return result
+        return wrapper
+
+    def install(self):
+        """Wrap the methods of this thread's cache instances; returns the ``(backend, name)`` pairs wrapped."""
+        undo = []
+        for alias in caches:
+            backend = caches[alias]
+            for name in CACHE_METHODS:
+                method = getattr(backend, name, None)
+                if method is not None:
+                    setattr(backend, name, self.cache_wrapper(alias, name, method))
+                    undo.append((backend, name))
+        return undo
+
+
+def _functions(profiler) -> str:
+    import io
+    import pstats
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).strip_dirs().sort_stats('cumulative').print_stats(PROFILE_FUNCTIONS)
+    return stream.getvalue().strip()
+
+
+class ProfilingMiddleware:
+    """Profile requests that carry a superuser's profiling token; see the module docstring.
+
+    Listed first in MIDDLEWARE so the report covers the whole stack. Set
+    PROFILING_ENABLED to False to remove it altogether.
+    """
+
+    def __init__(self, get_response):
+        if not PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_HEADER not in request.META and PROFILE_PARAM not in request.META.get('QUERY_STRING', ''):
+            return self.get_response(request)
+        user = token_user(request.META.get(PROFILE_HEADER) or request.GET.get(PROFILE_PARAM, ''))
+        if user is None:
+            return self.get_response(request)
+        return self._profile(request, user)
+
+    def _profile(self, request, user):
+        import cProfile
+        from contextlib import ExitStack
+
+        recorder = _Recorder()
+        profiler = cProfile.Profile()
+        query = request.GET.copy()
+        query.pop(PROFILE_PARAM, None)
+        started_at = time.time()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder.sql_wrapper(alias)))
+            for backend, name in recorder.install():
+                stack.callback(backend.__dict__.pop, name, None)
+            started = time.perf_counter()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler (a debugger, coverage) holds the hook; keep the SQL and cache data.
+                profiler = None
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+            total_ms = (time.perf_counter() - started) * 1000
+
+        report = {
+            'id': uuid.uuid4().hex[:12],
+            'at': started_at,
+            'method': request.method,
+            'path': request.path + (f"?{query.urlencode()}" if query else ''),
+            'view': getattr(request.resolver_match, '_func_path', None),
+            'status': response.status_code,
+            'user': user.get_username(),
+            'total_ms': total_ms,
+            'sql': recorder.sql,
+            'cache': recorder.cache,
+            'functions': _functions(profiler) if profiler is not None else '',
+        }
+        _store(report)
+        response['X-Profile-Id'] = report['id']
+        return response
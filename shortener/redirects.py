@@ -0,0 +1,157 @@
+"""Short-code redirects: the hot path, and the only views a cold start usually serves.
+
+Keep imports here to what a redirect needs; the dashboard, forms and API are
+loaded lazily by shortener/urls.py on first use.
+"""
+from django.conf import settings
+from django.http import Http404, HttpResponseGone, HttpResponseRedirect
+from django.shortcuts import redirect
+from .utils import get_client_ip
+from . import link_cache
+from zlink.settings import CACHE_SOFT_TTL
+from .ga4 import send_ga4_event
+from .bots import is_bot
+from .replica import get_replica
+from .snapshot import get_snapshot
+from .rules import evaluate as evaluate_rules
+from . import hotkeys, link_changes, metrics
+from .access_log import log_redirect
+from .services import (
+    resolve_link as service_resolve_link,
+    cache_link,
+    cache_timeout,
+    get_cached_link,
+    is_gone,
+    is_stale,
+    refresh_link_cache,
+)
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BOT_ANALYTICS = getattr(settings, 'BOT_ANALYTICS', 'skip')
+
+
+def _track_redirect(request, short_code, target_url, client_ip, user_agent):
+    if is_bot(user_agent):
+        metrics.incr('redirect_bot')
+        if BOT_ANALYTICS != 'tag':
+            return
+        extra = {'is_bot': 1}
+    else:
+        metrics.incr('redirect_human')
+        extra = {}
+
+    # GA4 Tracking
+    current_scheme = request.scheme
+    current_host = request.get_host()
+    full_short_url = f"{current_scheme}://{current_host}/{short_code}"
+
+    send_ga4_event(
+        request,
+        params={
+            'page_title': target_url, # Use original URL as page title
+            'page_location': full_short_url,
+            **extra,
+        },
+        ip_address=client_ip,
+        user_agent=user_agent,
+        short_code=short_code,
+    )
+
+
+def _target_url(request, entry, client_ip):
+    if not isinstance(entry, dict):
+        return entry
+    compiled = entry.get('rules')
+    if compiled:
+        return evaluate_rules(compiled, request, request.COOKIES.get('_ga') or client_ip or '') or entry['url']
+    return entry['url']
+
+
+def _redirect(request, short_code, target_url, client_ip, user_agent, started, status):
+    _track_redirect(request, short_code, target_url, client_ip, user_agent)
+    log_redirect(short_code, status, started, client_ip, user_agent)
+    return HttpResponseRedirect(target_url)
+
+
+def _gone(short_code, started, client_ip, user_agent):
+    metrics.incr('link_gone')
+    log_redirect(short_code, '410', started, client_ip, user_agent)
+    return HttpResponseGone()
+
+
+def resolve_short_code(request, short_code):
+    started = time.perf_counter()
+    client_ip = get_client_ip(request)
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    hotkeys.record(short_code)
+
+    # Replica mode: the whole link map lives in this worker, no network round trip.
+    replica = get_replica()
+    if replica is not None:
+        target_url = replica.lookup(short_code)
+        if target_url:
+            metrics.incr('link_local_hit')
+            return _redirect(request, short_code, target_url, client_ip, user_agent, started, 'hit')
+
+    # Build-time snapshot: a local mmap lookup; newer links, and links changed since the
+    # build, fall through to cache/DB.
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        target_url = snapshot.lookup(short_code)
+        if target_url and link_changes.is_current(short_code, snapshot.built_at * 1000):
+            metrics.incr('link_local_hit')
+            return _redirect(request, short_code, target_url, client_ip, user_agent, started, 'hit')
+
+    # Pinned hot keys: a copy held by this worker, refreshed at each hot key flush.
+    pinned = hotkeys.pinned_entry(short_code)
+    if pinned is not None:
+        metrics.incr('link_pinned_hit')
+        return _redirect(request, short_code, _target_url(request, pinned, client_ip), client_ip, user_agent, started, 'hit')
+
+    cached_data = get_cached_link(short_code)
+
+    if cached_data:
+        # Expired link: the entry is a tombstone, answered without touching the DB.
+        if is_gone(cached_data):
+            return _gone(short_code, started, client_ip, user_agent)
+        if CACHE_SOFT_TTL:
+            # Stale-while-revalidate: serve right away, refresh off the request path.
+            if is_stale(cached_data):
+                refresh_link_cache(short_code)
+        else:
+            try:
+                link_cache.touch(short_code, cache_timeout(cached_data))
+            except Exception:
+                if settings.DEBUG:
+                    logger.warning("Cache touch failed for %s", short_code)
+
+        target_url = _target_url(request, cached_data, client_ip)
+        return _redirect(request, short_code, target_url, client_ip, user_agent, started, 'hit')
+
+    try:
+        link = service_resolve_link(short_code)
+    except Http404:
+        metrics.incr('link_404')
+        log_redirect(short_code, '404', started, client_ip, user_agent)
+        raise
+    entry = cache_link(link, short_code)
+    if is_gone(entry):
+        return _gone(short_code, started, client_ip, user_agent)
+    target_url = _target_url(request, entry, client_ip)
+    return _redirect(request, short_code, target_url, client_ip, user_agent, started, 'miss')
+
+
+def redirect_to_original(request, short_code):
+    return resolve_short_code(request, short_code)
+
+
+def root_redirect(request):
+    try:
+        return resolve_short_code(request, '@root')
+    except Http404:
+        if request.user.is_authenticated:
+            return redirect('dashboard')
+        return redirect('login')
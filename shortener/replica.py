@@ -0,0 +1,264 @@
+import sys
+import threading
+import time
+import zlib
+import logging
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ENABLED = getattr(settings, 'LINK_REPLICA', False)
+REPLICA_STREAM_MAXLEN = getattr(settings, 'LINK_REPLICA_STREAM_MAXLEN', 100000)
+# A publish that fails is only logged; periodic full resyncs repair what it missed.
+REPLICA_RESYNC_INTERVAL = getattr(settings, 'LINK_REPLICA_RESYNC_INTERVAL', 900)
+REPLICA_BLOCK_MS = 5000
+
+SEQ_KEY = 'shortener:replica:seq'
+STREAM_KEY = 'shortener:replica:stream'
+SNAPSHOT_KEY = 'shortener:replica:snapshot'
+SNAPSHOT_AT_KEY = 'shortener:replica:snapshot_at'
+REBUILD_LOCK_KEY = 'shortener:replica:rebuild'
+
+# INCR and XADD in one step so sequence numbers appear in the stream in order.
+_PUBLISH_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[4], '*', 'seq', seq, 'op', ARGV[1], 'code', ARGV[2], 'url', ARGV[3])
+return seq
+"""
+
+_SEP = b'\x00'
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection("default")
+
+
+def publish(op: str, short_code: str, url: str = ''):
+    """Append a 'set' or 'del' event to the replica change stream."""
+    if not REPLICA_ENABLED:
+        return
+    try:
+        _redis().eval(_PUBLISH_SCRIPT, 2, SEQ_KEY, STREAM_KEY, op, short_code, url or '', REPLICA_STREAM_MAXLEN)
+    except Exception as e:
+        logger.warning("Replica publish failed for %s, stale until the next resync: %s", short_code, e)
+
+
+def publish_many(events):
+    """Append ``(op, short_code, url)`` events with one pipelined round trip."""
+    if not REPLICA_ENABLED or not events:
+        return
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for op, short_code, url in events:
+            pipe.eval(_PUBLISH_SCRIPT, 2, SEQ_KEY, STREAM_KEY, op, short_code, url or '', REPLICA_STREAM_MAXLEN)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Replica publish failed for %d links, stale until the next resync: %s", len(events), e)
+
+
+def publish_link(link):
+    """Publish a link's current target; links with redirect rules or an expiry are left to the cache tier."""
+    if link.rules or link.expires_at:
+        publish('del', link.short_code)
+    else:
+        publish('set', link.short_code, link.original_url)
+
+
+def _stream_position(con):
+    """Current (seq, last stream id), read atomically."""
+    pipe = con.pipeline(transaction=True)
+    pipe.get(SEQ_KEY)
+    pipe.xrevrange(STREAM_KEY, count=1)
+    seq, last = pipe.execute()
+    return int(seq or 0), (last[0][0] if last else b'0-0')
+
+
+def build_snapshot(con=None) -> bytes:
+    """Dump every replicable link into a compressed ``seq, stream id, code, url, ...`` blob."""
+    from .models import Link
+
+    con = con or _redis()
+    seq, stream_id = _stream_position(con)
+    parts = [str(seq).encode(), stream_id]
+    for code, url in Link.objects.filter(rules__isnull=True, expires_at__isnull=True).values_list('short_code', 'original_url').iterator(chunk_size=5000):
+        parts.append(code.encode('utf-8'))
+        parts.append(url.encode('utf-8'))
+    return zlib.compress(_SEP.join(parts), 6)
+
+
+def _store_snapshot(con, blob: bytes, built_at: float):
+    pipe = con.pipeline(transaction=True)
+    pipe.set(SNAPSHOT_KEY, blob)
+    pipe.set(SNAPSHOT_AT_KEY, built_at)
+    pipe.execute()
+
+
+def publish_snapshot(con=None) -> int:
+    con = con or _redis()
+    built_at = time.time()
+    blob = build_snapshot(con)
+    _store_snapshot(con, blob, built_at)
+    return len(blob)
+
+
+def _parse_snapshot(blob: bytes):
+    parts = zlib.decompress(blob).split(_SEP)
+    seq, stream_id = int(parts[0]), parts[1]
+    it = iter(parts[2:])
+    data = {sys.intern(code.decode('utf-8')): sys.intern(url.decode('utf-8')) for code, url in zip(it, it)}
+    return seq, stream_id, data
+
+
+class LinkReplica:
+    """Whole ``short_code -> original_url`` map held in process and kept current from the stream."""
+
+    def __init__(self):
+        self._map = {}
+        self._seq = 0
+        self._stream_id = b'0-0'
+        self.ready = False
+        self.resyncs = 0
+        # When the loaded snapshot was built (epoch seconds), and when to next look for a newer one.
+        self.snapshot_at = 0.0
+        self._refresh_at = 0.0
+        self._pending_resyncs = 0
+        self._thread = None
+
+    def lookup(self, short_code: str) -> str | None:
+        return self._map.get(short_code) if self.ready else None
+
+    def __len__(self):
+        return len(self._map)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='link-replica', daemon=True)
+            self._thread.start()
+
+    def load(self, con=None, from_db=False):
+        con = con or _redis()
+        blob, built_at = (None, None) if from_db else con.mget(SNAPSHOT_KEY, SNAPSHOT_AT_KEY)
+        if blob is None:
+            built_at = time.time()
+            blob = build_snapshot(con)
+            _store_snapshot(con, blob, built_at)
+        self._seq, self._stream_id, self._map = _parse_snapshot(blob)
+        self.snapshot_at = float(built_at or 0)
+        self._refresh_at = time.monotonic() + REPLICA_RESYNC_INTERVAL
+        self.ready = True
+
+    def apply(self, seq: int, op: str, code: str, url: str) -> bool:
+        """Apply one stream event; False means a gap was detected and a resync is needed."""
+        if seq <= self._seq:
+            return True
+        if seq != self._seq + 1:
+            return False
+        if op == 'set':
+            self._map[sys.intern(code)] = sys.intern(url)
+        else:
+            self._map.pop(code, None)
+        self._seq = seq
+        return True
+
+    def _resync(self, con):
+        self.resyncs += 1
+        self._pending_resyncs += 1
+        # The shared snapshot may predate events already trimmed from the stream; rebuild from the DB then.
+        try:
+            self.load(con, from_db=self._pending_resyncs > 1)
+        finally:
+            close_old_connections()
+        logger.info("Link replica resynced at seq %s (%s links)", self._seq, len(self._map))
+
+    def _refresh(self, con):
+        """Periodic full resync, so links missed by a failed publish are repaired.
+
+        The first worker to find the shared snapshot older than REPLICA_RESYNC_INTERVAL
+        rebuilds it from the database; every worker then loads it once. Events since the
+        rebuild are replayed from the stream as after any load.
+        """
+        self._refresh_at = time.monotonic() + REPLICA_RESYNC_INTERVAL
+        built_at = float(con.get(SNAPSHOT_AT_KEY) or 0)
+        if time.time() - built_at >= REPLICA_RESYNC_INTERVAL and con.set(
+                REBUILD_LOCK_KEY, 1, nx=True, ex=max(1, int(REPLICA_RESYNC_INTERVAL))):
+            try:
+                publish_snapshot(con)
+            finally:
+                close_old_connections()
+            built_at = float(con.get(SNAPSHOT_AT_KEY) or 0)
+        if built_at > self.snapshot_at:
+            self.load(con)
+            logger.info("Link replica reloaded at seq %s (%s links)", self._seq, len(self._map))
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                con = _redis()
+                if not self.ready:
+                    try:
+                        self.load(con)
+                    finally:
+                        close_old_connections()
+                self._tail(con)
+            except Exception as e:
+                logger.warning("Link replica sync error: %s", e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def _tail(self, con):
+        while True:
+            if time.monotonic() >= self._refresh_at:
+                self._refresh(con)
+            result = con.xread({STREAM_KEY: self._stream_id}, count=1000, block=REPLICA_BLOCK_MS)
+            gap = False
+            for _, entries in result or ():
+                for entry_id, fields in entries:
+                    if not self.apply(
+                        int(fields[b'seq']),
+                        fields[b'op'].decode(),
+                        fields[b'code'].decode('utf-8'),
+                        fields[b'url'].decode('utf-8'),
+                    ):
+                        gap = True
+                        break
+                    self._stream_id = entry_id
+            if gap:
+                self._resync(con)
+            elif result:
+                self._pending_resyncs = 0
+
+    def memory_usage(self) -> dict:
+        """Approximate resident size of the map, including distinct key and value objects."""
+        seen = set()
+        total = sys.getsizeof(self._map)
+        for code, url in self._map.items():
+            for obj in (code, url):
+                if id(obj) not in seen:
+                    seen.add(id(obj))
+                    total += sys.getsizeof(obj)
+        count = len(self._map)
+        return {
+            'links': count,
+            'bytes': total,
+            'bytes_per_million': int(total / count * 1_000_000) if count else 0,
+        }
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+
+def get_replica():
+    """Return the process-wide replica, starting its sync thread on first use; None when disabled."""
+    global _replica
+    if not REPLICA_ENABLED:
+        return None
+    if _replica is None:
+        with _replica_lock:
+            if _replica is None:
+                _replica = LinkReplica()
+                _replica.start()
+    return _replica
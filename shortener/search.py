@@ -0,0 +1,95 @@
+"""Link search shared by the dashboard and the admin.
+
+Matching is written so PostgreSQL can answer it from indexes:
+
+* ``original_url__icontains`` compiles to ``UPPER(original_url::text) LIKE UPPER(%s)``,
+  which the ``link_url_trgm_idx`` GIN trigram index (migration 0007) serves.
+* Short codes are only ever matched by prefix (``short_code__startswith``), served
+  by the ``varchar_pattern_ops`` index Django creates for the unique column.
+
+Results are ordered newest first and paginated by keyset on ``(created_at, id)``,
+so deep pages cost the same as the first and no COUNT(*) is needed.
+"""
+import base64
+import re
+from datetime import datetime, timedelta, time as dt_time
+from django.db.models import Q
+from django.utils import timezone
+from .models import Link
+
+PAGE_SIZE = 50
+# Trigram indexes need at least three characters to narrow anything down.
+MIN_URL_TERM = 3
+
+_SHORT_CODE_RE = re.compile(r'^[A-Za-z0-9_@-]+$')
+_DOMAIN_RE = re.compile(r'^(?:https?://)?([^/\s:]+)')
+
+
+def search_q(term: str) -> Q:
+    """Filter for a free-text term: short-code prefix, plus URL substring for longer terms."""
+    term = term.strip()
+    if not term:
+        return Q()
+    q = Q(pk__in=[])
+    if _SHORT_CODE_RE.match(term):
+        q |= Q(short_code__startswith=term)
+    if len(term) >= MIN_URL_TERM:
+        q |= Q(original_url__icontains=term)
+    return q
+
+
+def domain_q(domain: str) -> Q:
+    """Links whose target host is ``domain`` (scheme and path in the input are ignored)."""
+    match = _DOMAIN_RE.match(domain.strip().lower())
+    if not match:
+        return Q()
+    host = match.group(1)
+    return Q(original_url__istartswith=f'https://{host}/') | Q(original_url__istartswith=f'http://{host}/') \
+        | Q(original_url__iexact=f'https://{host}') | Q(original_url__iexact=f'http://{host}')
+
+
+def _day_start(value):
+    return timezone.make_aware(datetime.combine(value, dt_time.min)) if value else None
+
+
+def filter_links(queryset, query='', domain='', date_from=None, date_to=None):
+    """Apply search, domain and inclusive ``date_from``/``date_to`` (dates) filters."""
+    if query:
+        queryset = queryset.filter(search_q(query))
+    if domain:
+        queryset = queryset.filter(domain_q(domain))
+    if date_from:
+        queryset = queryset.filter(created_at__gte=_day_start(date_from))
+    if date_to:
+        queryset = queryset.filter(created_at__lt=_day_start(date_to) + timedelta(days=1))
+    return queryset
+
+
+def encode_cursor(link) -> str:
+    raw = f"{link.created_at.isoformat()}|{link.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Return ``(created_at, id)`` or None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, link_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(link_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def search_links(query='', domain='', date_from=None, date_to=None, cursor='', page_size=PAGE_SIZE):
+    """One page of matching links, newest first; returns ``(links, next_cursor or None)``."""
+    queryset = filter_links(Link.objects.select_related('health'), query, domain, date_from, date_to)
+    position = decode_cursor(cursor)
+    if position:
+        created_at, link_id = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=link_id))
+    links = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+    if len(links) > page_size:
+        return links[:page_size], encode_cursor(links[page_size - 1])
+    return links, None
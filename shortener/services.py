@@ -1,69 +1,546 @@
-from django.core.cache import cache
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
-from django.db import transaction
-from .models import Link
-from .utils import link_cache_key
-from zlink.settings import CACHE_TTL
+from django.core.cache import cache
+from django.db import transaction, close_old_connections, DatabaseError, IntegrityError
+from django.db.models import BigIntegerField, Case, Value, When
+from django.db.models.functions import Concat, Substr
+from django.http import Http404
+from .models import Link, LinkCheck, random_short_code
+from . import hotkeys, link_cache, link_changes, metrics, replica
+from .rules import compile_rules
+from .urlhash import normalize_url, url_hash
+from zlink.settings import CACHE_TTL, CACHE_SOFT_TTL, CACHE_REFRESH_ASYNC, LINK_GONE_CACHE_TTL
+import math
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+LINK_REUSE_EXISTING = getattr(settings, 'LINK_REUSE_EXISTING', False)
+CACHE_REFRESH_LOCK_TTL = 10
+LINKS_TABLE_GENERATION_KEY = 'shortener:links_table:generation'
+# Generated codes are inserted without a lookup; a collision is retried with a fresh code.
+CREATE_LINK_ATTEMPTS = 5
+
+
+class AliasTaken(ValueError):
+    """The short code belongs to another link; raised from the INSERT or UPDATE, not a pre-check."""
+
+    def __init__(self, alias: str):
+        super().__init__(f"Alias '{alias}' is already taken.")
+        self.alias = alias
+
+
+# The columns the redirect needs, served from the covering index on PostgreSQL.
+REDIRECT_FIELDS = ('id', 'short_code', 'original_url', 'has_rules', 'expires_at')
+
+
+def load_rules(links):
+    """Fill in ``rules`` on links read with REDIRECT_FIELDS; one query, only for links that have rules."""
+    ruled = {link.pk: link for link in links if link.has_rules}
+    for link in links:
+        link.rules = None
+    if ruled:
+        for pk, rules in Link.objects.filter(pk__in=list(ruled)).values_list('pk', 'rules'):
+            ruled[pk].rules = rules
+    return links
+
 
 def resolve_link(short_code: str) -> Link:
-    return get_object_or_404(Link, short_code=short_code)
+    link = get_object_or_404(Link.objects.only(*REDIRECT_FIELDS), short_code=short_code)
+    load_rules([link])
+    return link
 
 
-def cache_link(link: Link):
+def _compiled_rules(link: Link):
+    if not link.rules:
+        return None
     try:
-        cache.set(
-            link_cache_key(link.short_code),
-            {
-                "url": link.original_url,
-                "id": link.id,
-            },
-            timeout=CACHE_TTL
-        )
+        return compile_rules(link.rules)
+    except ValueError as e:
+        logger.warning("Ignoring invalid rules on link %s: %s", link.id, e)
+        return None
+
+
+def build_cache_entry(link: Link) -> dict:
+    now = time.time()
+    return {
+        "url": link.original_url,
+        "id": link.id,
+        # Compiled decision structure, evaluated per redirect without further lookups.
+        "rules": _compiled_rules(link),
+        "cached_at": now,
+        # Soft expiry: past this point the entry is served stale while it is refreshed.
+        # The hard expiry is the Redis TTL (CACHE_TTL).
+        "fresh_until": now + CACHE_SOFT_TTL if CACHE_SOFT_TTL else None,
+        # Past this point the entry is a tombstone and the code answers 410.
+        "expires_at": link.expires_at.timestamp() if link.expires_at else None,
+    }
+
+
+def is_gone(entry) -> bool:
+    expires_at = entry.get("expires_at") if isinstance(entry, dict) else None
+    return expires_at is not None and time.time() >= expires_at
+
+
+def cache_timeout(entry) -> int | None:
+    """Redis TTL for an entry: CACHE_TTL capped at the link's remaining lifetime, or LINK_GONE_CACHE_TTL once expired."""
+    expires_at = entry.get("expires_at") if isinstance(entry, dict) else None
+    if expires_at is None:
+        return CACHE_TTL
+    remaining = math.ceil(expires_at - time.time())
+    if remaining <= 0:
+        return LINK_GONE_CACHE_TTL
+    return min(remaining, CACHE_TTL) if CACHE_TTL else remaining
+
+
+def cache_entry_matches(entry, link: Link) -> bool:
+    """Whether a cached entry still describes ``link``: same row, target and compiled rules."""
+    if not isinstance(entry, dict):
+        # Plain URL entries predate rules.
+        return entry == link.original_url and not link.rules
+    return (
+        entry.get('id') == link.id
+        and entry.get('url') == link.original_url
+        and entry.get('rules') == _compiled_rules(link)
+        and entry.get('expires_at') == (link.expires_at.timestamp() if link.expires_at else None)
+    )
+
+
+def get_cached_link(short_code: str) -> dict | None:
+    try:
+        entry = link_cache.get(short_code)
+    except Exception:
+        logger.debug("Cache get failed for %s", short_code)
+        entry = None
+    metrics.incr('link_cache_hit' if entry else 'link_cache_miss')
+    return entry
+
+
+def is_stale(entry: dict) -> bool:
+    fresh_until = entry.get("fresh_until") if isinstance(entry, dict) else None
+    return fresh_until is not None and time.time() > fresh_until
+
+
+def cache_link(link: Link, short_code: str | None = None) -> dict:
+    short_code = short_code or link.short_code
+    entry = build_cache_entry(link)
+    try:
+        link_cache.store(short_code, entry, cache_timeout(entry))
+    except Exception:
+        logger.debug("Cache set failed for %s", short_code)
+    return entry
+
+
+def _refresh_link(short_code: str):
+    try:
+        link = resolve_link(short_code)
+    except Http404:
+        invalidate_link_cache(short_code)
+    except DatabaseError as e:
+        # Keep serving the stale entry until its hard expiry; the lock expiry allows a retry.
+        logger.warning("Link refresh failed for %s, serving stale: %s", short_code, e)
+    else:
+        cache_link(link, short_code)
+
+
+def refresh_link_cache(short_code: str):
+    """Single-flight refresh of a stale cache entry; only the caller that wins the lock hits the DB."""
+    try:
+        if not link_cache.add_lock(short_code, "refresh", CACHE_REFRESH_LOCK_TTL):
+            return
     except Exception:
-        logger.debug("Cache set failed for %s", link.short_code)
+        return
+
+    def _refresh_and_unlock():
+        try:
+            _refresh_link(short_code)
+        finally:
+            try:
+                link_cache.delete_lock(short_code, "refresh")
+            except Exception:
+                logger.debug("Releasing the refresh lock failed for %s", short_code)
+
+    if not CACHE_REFRESH_ASYNC:
+        _refresh_and_unlock()
+        return
+
+    def _run():
+        try:
+            _refresh_and_unlock()
+        finally:
+            close_old_connections()
+
+    try:
+        threading.Thread(target=_run, daemon=True).start()
+    except Exception as exc:
+        logger.debug("Async link refresh failed to start: %s", exc)
 
 
 def invalidate_link_cache(short_code: str):
+    hotkeys.forget(short_code)
+    # After commit, so a snapshot built meanwhile cannot have read the old row after this time.
+    transaction.on_commit(lambda: link_changes.record([short_code]))
     try:
-        cache.delete(link_cache_key(short_code))
+        link_cache.delete(short_code)
     except Exception:
         logger.debug("Cache delete failed for %s", short_code)
 
 
-def create_link(original_url: str, custom_alias: str | None = None) -> Link:
-    if custom_alias:
-        link = Link.objects.create(original_url=original_url, short_code=custom_alias)
+def links_table_generation() -> int | None:
+    """Current version of the dashboard link table, or None if the cache is unreachable."""
+    try:
+        # Seeded from the clock so a lost key never reuses an older generation.
+        return cache.get_or_set(LINKS_TABLE_GENERATION_KEY, lambda: int(time.time() * 1000), timeout=None)
+    except Exception:
+        logger.debug("Cache get failed for links table generation")
+        return None
+
+
+def bump_links_table_generation():
+    """Invalidate every cached rendering of the link table."""
+    try:
+        cache.incr(LINKS_TABLE_GENERATION_KEY)
+    except ValueError:
+        links_table_generation()
+    except Exception:
+        logger.debug("Cache incr failed for links table generation")
+
+
+def _save_or_raise(link: Link, **kwargs):
+    """Save ``link`` and let the unique constraint on short_code report a conflict.
+
+    Inside an outer transaction a savepoint keeps a failed statement from aborting it;
+    in autocommit the statement stands alone, so no transaction is opened.
+    """
+    if transaction.get_connection().in_atomic_block:
+        with transaction.atomic():
+            link.save(**kwargs)
     else:
-        link = Link.objects.create(original_url=original_url)
+        link.save(**kwargs)
+
+
+def create_link(original_url: str, custom_alias: str | None = None, expires_at=None) -> Link:
+    """Insert a link straight away; raises AliasTaken if ``custom_alias`` is in use.
+
+    Reserved words and system routes must already be rejected (utils.check_reserved_short_code).
+    """
+    for attempt in range(CREATE_LINK_ATTEMPTS):
+        link = Link(original_url=original_url, short_code=custom_alias or random_short_code(), expires_at=expires_at)
+        try:
+            _save_or_raise(link, force_insert=True)
+            break
+        except IntegrityError:
+            if custom_alias:
+                raise AliasTaken(custom_alias) from None
+            if attempt == CREATE_LINK_ATTEMPTS - 1:
+                raise
+    transaction.on_commit(lambda: replica.publish_link(link))
     return link
 
 
-def update_link(link: Link, original_url: str | None, new_short_code: str | None):
+def _reusable(queryset):
+    # Only plain links: sharing one with rules or an expiry would change what the new caller gets.
+    return queryset.filter(rules__isnull=True, expires_at__isnull=True)
+
+
+def find_reusable_links(urls) -> dict[str, Link]:
+    """``{url: oldest plain link with the same normalised target}``, from one ``url_hash__in`` query.
+
+    The hash only narrows the lookup; candidates are compared on the normalised URL.
+    """
+    normalized = {url: normalize_url(url) for url in urls}
+    if not normalized:
+        return {}
+    found = {}
+    hashes = {url_hash(url) for url in normalized}
+    for link in _reusable(Link.objects.filter(url_hash__in=hashes)).order_by('id'):
+        found.setdefault(normalize_url(link.original_url), link)
+    return {url: found[target] for url, target in normalized.items() if target in found}
+
+
+def get_or_create_link(original_url: str) -> tuple[Link, bool]:
+    """The existing plain link for ``original_url``, or a new one; ``(link, created)``.
+
+    Two concurrent calls may both create a link; duplicates are allowed, just avoided.
+    """
+    existing = find_reusable_links([original_url]).get(original_url)
+    if existing is not None:
+        return existing, False
+    return create_link(original_url), True
+
+
+_UNCHANGED = object()
+# What update_link may change on the instance; save() recomputes url_hash.
+_UPDATABLE_FIELDS = ('original_url', 'url_hash', 'short_code', 'rules', 'expires_at')
+
+
+def update_link(link: Link, original_url: str | None, new_short_code: str | None, rules=_UNCHANGED,
+                expires_at=_UNCHANGED):
+    """Save the changes; raises AliasTaken (leaving ``link`` as it was) if the new code is in use."""
     old_code = link.short_code
+    before = {field: getattr(link, field) for field in _UPDATABLE_FIELDS}
     if original_url:
         link.original_url = original_url
+    if rules is not _UNCHANGED:
+        link.rules = rules or None
+    if expires_at is not _UNCHANGED:
+        link.expires_at = expires_at
     if new_short_code and new_short_code != link.short_code:
         link.short_code = new_short_code
-    with transaction.atomic():
-        link.save()
-        invalidate_link_cache(old_code)
-        if old_code != link.short_code:
-            invalidate_link_cache(link.short_code)
+    try:
+        with transaction.atomic():
+            link.save()
+            invalidate_link_cache(old_code)
+            if old_code != link.short_code:
+                invalidate_link_cache(link.short_code)
+                transaction.on_commit(lambda: replica.publish('del', old_code))
+            transaction.on_commit(lambda: replica.publish_link(link))
+    except IntegrityError:
+        new_code = link.short_code
+        for field, value in before.items():
+            setattr(link, field, value)
+        if old_code == new_code:
+            raise
+        raise AliasTaken(new_code) from None
     return link
 
 
 def delete_link(link: Link):
-    invalidate_link_cache(link.short_code)
+    short_code = link.short_code
+    invalidate_link_cache(short_code)
     link.delete()
+    transaction.on_commit(lambda: replica.publish('del', short_code))
+
+
+def get_cached_links(short_codes) -> dict:
+    try:
+        found = link_cache.get_many(short_codes)
+    except Exception:
+        logger.debug("Cache get_many failed for %d codes", len(short_codes))
+        found = {}
+    if found:
+        metrics.incr('link_cache_hit', len(found))
+    if len(short_codes) > len(found):
+        metrics.incr('link_cache_miss', len(short_codes) - len(found))
+    return found
+
+
+def cache_links(links, short_codes=None):
+    short_codes = short_codes or [link.short_code for link in links]
+    # One store_many per distinct TTL; links expiring together (a campaign) share one.
+    by_timeout = {}
+    for code, link in zip(short_codes, links):
+        entry = build_cache_entry(link)
+        by_timeout.setdefault(cache_timeout(entry), {})[code] = entry
+    try:
+        for timeout, entries in by_timeout.items():
+            link_cache.store_many(entries, timeout)
+    except Exception:
+        logger.debug("Cache set_many failed for %d links", len(short_codes))
+
+
+def resolve_links(short_codes) -> dict[str, str | None]:
+    """Resolve many codes with one MGET per shard and one DB query for the misses; expired links resolve to None."""
+    codes = list(dict.fromkeys(short_codes))
+    cached = {code: entry for code, entry in get_cached_links(codes).items() if entry}
+    resolved = {
+        code: entry['url'] if isinstance(entry, dict) else entry
+        for code, entry in cached.items() if not is_gone(entry)
+    }
+    misses = [code for code in codes if code not in cached]
+    if misses:
+        links = load_rules(list(Link.objects.filter(short_code__in=misses).only(*REDIRECT_FIELDS)))
+        cache_links(links)
+        resolved.update((link.short_code, link.original_url) for link in links if not link.is_expired)
+        if len(links) < len(misses):
+            metrics.incr('link_404', len(misses) - len(links))
+    return {code: resolved.get(code) for code in codes}
+
+
+def _unused_short_codes(count: int) -> list[str]:
+    codes = set()
+    while len(codes) < count:
+        candidates = {random_short_code() for _ in range(count - len(codes))} - codes
+        taken = set(Link.objects.filter(short_code__in=candidates).values_list('short_code', flat=True))
+        codes |= candidates - taken
+    return list(codes)
+
+
+def bulk_create_links(items, reuse: bool = False) -> list[tuple[Link, bool]]:
+    """Create links from ``(original_url, custom_alias or None, expires_at or None)`` tuples in one INSERT.
+
+    Returns ``(link, created)`` per item. Aliases must already be validated; generated
+    codes are checked for collisions with a single ``short_code__in`` query per round.
+    With ``reuse``, items without an alias or expiry get the existing plain link for
+    their target, or share one new link with identical items in the batch.
+    """
+    items = list(items)
+    plain = {url for url, alias, expires_at in items if not alias and not expires_at} if reuse else set()
+    reusable = {normalize_url(url): link for url, link in find_reusable_links(plain).items()}
+    results, links = [], []
+    for url, alias, expires_at in items:
+        target = normalize_url(url) if url in plain else None
+        if target in reusable:
+            results.append((reusable[target], False))
+            continue
+        link = Link(original_url=url, short_code=alias, expires_at=expires_at, url_hash=url_hash(url))
+        if target:
+            # Later identical items in this batch share the new link.
+            reusable[target] = link
+        links.append(link)
+        results.append((link, True))
+    generated = iter(_unused_short_codes(sum(1 for link in links if not link.short_code)))
+    for link in links:
+        link.short_code = link.short_code or next(generated)
+    if not links:
+        return results
+    with transaction.atomic():
+        Link.objects.bulk_create(links, batch_size=500)
+        transaction.on_commit(bump_links_table_generation)
+
+        def _publish():
+            for link in links:
+                replica.publish_link(link)
+        transaction.on_commit(_publish)
+    return results
+
+
+def bulk_update_links(targets: dict, expiries: dict | None = None) -> list[Link]:
+    """Retarget links given ``{short_code: original_url}`` with one SELECT and one bulk UPDATE.
+
+    ``expiries`` optionally sets ``{short_code: expires_at or None}`` for some of them in the same UPDATE.
+    """
+    expiries = expiries or {}
+    links = list(Link.objects.filter(short_code__in=list(targets)).only('id', 'short_code', 'original_url', 'rules', 'expires_at'))
+    for link in links:
+        link.original_url = targets[link.short_code]
+        link.url_hash = url_hash(link.original_url)
+        if link.short_code in expiries:
+            link.expires_at = expiries[link.short_code]
+    fields = ['original_url', 'url_hash'] + (['expires_at'] if expiries else [])
+    with transaction.atomic():
+        Link.objects.bulk_update(links, fields, batch_size=500)
+        # After commit: a redirect racing the UPDATE could otherwise re-cache the old target.
+        _after_bulk_write(
+            [link.short_code for link in links],
+            _retarget_events([(link.pk, link.short_code, link.rules, link.original_url, link.expires_at) for link in links],
+                             lambda url: url),
+        )
+    return links
+
+
+BULK_CHUNK_SIZE = 1000
+
+
+def _chunks(items, size=BULK_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _after_bulk_write(short_codes, events):
+    """On commit: one pipelined UNLINK batch per shard, one table bump and one replica pipeline."""
+    def _run():
+        for code in short_codes:
+            hotkeys.forget(code)
+        link_changes.record(short_codes)
+        try:
+            link_cache.unlink_many(short_codes)
+        except Exception:
+            logger.debug("Cache unlink failed for %d codes", len(short_codes))
+        bump_links_table_generation()
+        replica.publish_many(events)
+    transaction.on_commit(_run)
+
+
+def bulk_delete_links(queryset) -> int:
+    """Delete the matching links with set-based DELETEs in one transaction.
+
+    Bypasses the per-instance ``post_delete`` signal; caches are invalidated once, after commit.
+    """
+    with transaction.atomic():
+        rows = list(queryset.values_list('pk', 'short_code'))
+        deleted = 0
+        for chunk in _chunks(rows):
+            pks = [pk for pk, _ in chunk]
+            # _raw_delete skips the ORM cascade, so remove dependent rows first.
+            checks = LinkCheck.objects.filter(link_id__in=pks)
+            checks._raw_delete(checks.db)
+            batch = Link.objects.filter(pk__in=pks)
+            deleted += batch._raw_delete(batch.db)
+        short_codes = [code for _, code in rows]
+        _after_bulk_write(short_codes, [('del', code, '') for code in short_codes])
+    return deleted
+
+
+def _retarget_events(rows, new_url):
+    # Links with rules or an expiry are left to the cache tier, as in replica.publish_link.
+    return [
+        ('del', code, '') if rules or expires_at else ('set', code, new_url(url))
+        for _, code, rules, url, expires_at in rows
+    ]
+
+
+def bulk_retarget_links(queryset, original_url: str) -> int:
+    """Point every matching link at ``original_url`` with set-based UPDATEs in one transaction."""
+    with transaction.atomic():
+        rows = list(queryset.values_list('pk', 'short_code', 'rules', 'original_url', 'expires_at'))
+        updated = 0
+        for chunk in _chunks(rows):
+            updated += Link.objects.filter(pk__in=[row[0] for row in chunk]).update(
+                original_url=original_url, url_hash=url_hash(original_url),
+            )
+        _after_bulk_write([row[1] for row in rows], _retarget_events(rows, lambda url: original_url))
+    return updated
+
+
+def bulk_replace_url_prefix(queryset, old_prefix: str, new_prefix: str) -> int:
+    """Rewrite ``old_prefix`` to ``new_prefix`` at the start of matching links' URLs, in SQL.
+
+    Raises ValueError, before writing anything, if a rewritten URL would not fit the column.
+    """
+    max_length = Link._meta.get_field('original_url').max_length
+    with transaction.atomic():
+        matching = queryset.filter(original_url__startswith=old_prefix)
+        rows = list(matching.values_list('pk', 'short_code', 'rules', 'original_url', 'expires_at'))
+        too_long = [code for _, code, _, url, _ in rows if len(url) - len(old_prefix) + len(new_prefix) > max_length]
+        if too_long:
+            raise ValueError(f"{len(too_long)} URLs would exceed {max_length} characters (e.g. {too_long[0]}).")
+        rewritten = Concat(Value(new_prefix), Substr('original_url', len(old_prefix) + 1))
+        updated = 0
+        for chunk in _chunks(rows):
+            updated += Link.objects.filter(
+                pk__in=[row[0] for row in chunk], original_url__startswith=old_prefix,
+            ).update(
+                original_url=rewritten,
+                # Hashing needs Python, so the new hashes ride along as a CASE on pk.
+                url_hash=Case(
+                    *[When(pk=pk, then=Value(url_hash(new_prefix + url[len(old_prefix):]))) for pk, _, _, url, _ in chunk],
+                    output_field=BigIntegerField(),
+                ),
+            )
+        _after_bulk_write(
+            [row[1] for row in rows],
+            _retarget_events(rows, lambda url: new_prefix + url[len(old_prefix):]),
+        )
+    return updated
+
+
+def bulk_set_expiry(queryset, expires_at) -> int:
+    """Set (or with None, clear) the expiry of every matching link with set-based UPDATEs."""
+    with transaction.atomic():
+        rows = list(queryset.values_list('pk', 'short_code', 'rules', 'original_url'))
+        updated = 0
+        for chunk in _chunks(rows):
+            updated += Link.objects.filter(pk__in=[row[0] for row in chunk]).update(expires_at=expires_at)
+        _after_bulk_write(
+            [row[1] for row in rows],
+            _retarget_events([(*row, expires_at) for row in rows], lambda url: url),
+        )
+    return updated
 
 
 def create_admin_user(username: str, email: str, password: str) -> User:
-    user = User.objects.create_user(username=username, email=email, password=password)
-    user.is_staff = True
-    user.save()
-    return user
+    return User.objects.create_user(username=username, email=email, password=password, is_staff=True)
@@ -1,15 +1,34 @@
 from django.db.models.signals import post_save, post_delete,post_migrate
 from django.dispatch import receiver
-from django.core.cache import cache
-from .models import Link
-from .utils import link_cache_key
+from django.contrib.auth.signals import user_logged_in
+from .models import Link, Profile
+from . import link_cache, link_changes
+from .auth import cache_user, invalidate_cached_user
+from .services import bump_links_table_generation
+from django.db import transaction
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
 
 @receiver([post_save, post_delete], sender=Link)
 def clear_link_cache(sender, instance, **kwargs):
-    cache.delete(link_cache_key(instance.short_code))
+    link_cache.delete(instance.short_code)
+    transaction.on_commit(lambda: link_changes.record([instance.short_code]))
+    transaction.on_commit(bump_links_table_generation)
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def clear_user_cache(sender, instance, **kwargs):
+    # Covers edit_user, toggle_user_active, settings_profile and the admin, which all save().
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
+
+@receiver([post_save, post_delete], sender=Profile)
+def clear_profile_user_cache(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_cached_user(instance.user_id))
+
+@receiver(user_logged_in)
+def warm_user_cache(sender, request, user, **kwargs):
+    # Runs after update_last_login's save, so the first page after login is already warm.
+    cache_user(user.pk)
 
 @receiver(post_migrate)
 def create_superuser(sender, **kwargs):
@@ -23,13 +42,14 @@ def create_superuser(sender, **kwargs):
         print(f"Superuser '{settings.DEFAULT_SUPERUSER_USERNAME}' created successfully.")
 
 @receiver(post_save, sender=get_user_model())
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_or_update_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    from .models import Profile
     if created:
-        from .models import Profile
         Profile.objects.create(user=instance)
-    else:
-        # Just in case it doesn't exist for some reason
-        from .models import Profile
-        if not hasattr(instance, 'profile'):
-            Profile.objects.create(user=instance)
-        instance.profile.save()
\ No newline at end of file
+        return
+    # Partial saves (last_login at login, is_active toggles) never need a profile check.
+    if update_fields is not None:
+        return
+    # Just in case it doesn't exist for some reason
+    if not hasattr(instance, 'profile'):
+        Profile.objects.create(user=instance)
@@ -0,0 +1,115 @@
+"""Immutable, memory-mapped snapshot of all links.
+
+Layout (little endian)::
+
+    header        magic 'ZLSN', version u32, count u32, built_at u64
+    key offsets   (count + 1) x u32, into the key blob
+    url offsets   (count + 1) x u64, into the url blob
+    key blob      UTF-8 short codes, sorted bytewise
+    url blob      UTF-8 target URLs, in key order
+
+Lookups binary-search the key offsets straight out of the mapping, so opening a
+snapshot costs one ``mmap`` call and pages are only read when touched.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from django.conf import settings
+
+MAGIC = b'ZLSN'
+VERSION = 1
+HEADER = struct.Struct('<4sIIQ')
+KEY_OFFSET = struct.Struct('<I')
+URL_OFFSET = struct.Struct('<Q')
+
+SNAPSHOT_PATH = getattr(settings, 'LINK_SNAPSHOT_PATH', None)
+
+
+def write_snapshot(path, rows, built_at=None) -> int:
+    """Write ``(short_code, original_url)`` rows to ``path`` atomically; returns the link count.
+
+    ``built_at`` (epoch seconds, default now) should be taken before ``rows`` are read:
+    links changed after it are not served from the snapshot (see link_changes).
+    """
+    entries = sorted((code.encode('utf-8'), url.encode('utf-8')) for code, url in rows)
+    count = len(entries)
+
+    key_offsets = [0]
+    url_offsets = [0]
+    for code, url in entries:
+        key_offsets.append(key_offsets[-1] + len(code))
+        url_offsets.append(url_offsets[-1] + len(url))
+
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, count, int(time.time() if built_at is None else built_at)))
+        f.write(struct.pack(f'<{count + 1}I', *key_offsets))
+        f.write(struct.pack(f'<{count + 1}Q', *url_offsets))
+        for code, _ in entries:
+            f.write(code)
+        for _, url in entries:
+            f.write(url)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+class LinkSnapshot:
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.built_at = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{self.path} is not a v{VERSION} link snapshot")
+        self._key_table = HEADER.size
+        self._url_table = self._key_table + KEY_OFFSET.size * (self.count + 1)
+        self._keys = self._url_table + URL_OFFSET.size * (self.count + 1)
+        self._urls = self._keys + KEY_OFFSET.unpack_from(self._mm, self._url_table - KEY_OFFSET.size)[0]
+
+    def __len__(self):
+        return self.count
+
+    def _key(self, i):
+        start, end = struct.unpack_from('<2I', self._mm, self._key_table + i * KEY_OFFSET.size)
+        return self._mm[self._keys + start:self._keys + end]
+
+    def lookup(self, short_code: str) -> str | None:
+        target = short_code.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self._key(mid)
+            if key < target:
+                lo = mid + 1
+            elif key > target:
+                hi = mid
+            else:
+                start, end = struct.unpack_from('<2Q', self._mm, self._url_table + mid * URL_OFFSET.size)
+                return self._mm[self._urls + start:self._urls + end].decode('utf-8')
+        return None
+
+    def close(self):
+        self._mm.close()
+
+
+_snapshot = None
+_snapshot_checked = False
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Return the snapshot at LINK_SNAPSHOT_PATH, opened once per process; None if absent."""
+    global _snapshot, _snapshot_checked
+    if _snapshot_checked:
+        return _snapshot
+    with _snapshot_lock:
+        if not _snapshot_checked:
+            if SNAPSHOT_PATH and os.path.exists(SNAPSHOT_PATH):
+                _snapshot = LinkSnapshot(SNAPSHOT_PATH)
+            _snapshot_checked = True
+    return _snapshot
@@ -0,0 +1,226 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.open'
+SEALED_SUFFIX = '.log'
+
+
+class EventSpool:
+    """Append-only, segment-rotated local spool of JSON lines.
+
+    Each process writes to its own ``<prefix>-<millis>-<pid>-<n>.open`` segment. A segment
+    is sealed (renamed to ``.log``) when it grows past ``segment_bytes`` or gets
+    older than ``max_segment_age``; only sealed segments are drained. Writes are
+    fsynced in batches, every ``fsync_every`` records or ``fsync_interval`` seconds;
+    a background timer does the same for a quiet writer and seals its aged segment.
+
+    The writer holds an flock on its ``.open`` segment, so a drainer only takes over
+    segments whose process has died.
+    """
+
+    def __init__(self, directory, prefix='events', segment_bytes=4 * 1024 * 1024,
+                 fsync_every=64, fsync_interval=1.0, max_segment_age=60.0):
+        self.directory = str(directory)
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.max_segment_age = max_segment_age
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._opened_at = 0.0
+        self._unsynced = 0
+        self._last_sync = 0.0
+        self._seq = 0
+        self._timer = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    # Writing
+
+    def append(self, record):
+        line = json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+        data = line.encode('utf-8')
+        with self._lock:
+            now = time.monotonic()
+            if self._file is not None and (
+                self._file.tell() + len(data) > self.segment_bytes
+                or now - self._opened_at > self.max_segment_age
+            ):
+                self._seal()
+            try:
+                if self._file is None:
+                    self._open(now)
+                self._file.write(data)
+                self._unsynced += 1
+                if self._unsynced >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                    self._sync(now)
+            except Exception:
+                # Start over with a fresh segment on the next append rather than a broken handle.
+                self._reset()
+                raise
+
+    def flush(self):
+        """fsync pending records and seal the active segment so it can be drained."""
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._seal()
+                except Exception:
+                    self._reset()
+                    raise
+
+    def _open(self, now):
+        self._seq += 1
+        self._path = os.path.join(self.directory, f"{self.prefix}-{int(time.time() * 1000):015d}-{os.getpid()}-{self._seq:06d}{OPEN_SUFFIX}")
+        self._file = open(self._path, 'ab', buffering=64 * 1024)
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._opened_at = now
+        self._last_sync = now
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._run_timer, name=f'{self.prefix}-spool-sync', daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                if self._file is None:
+                    continue
+                now = time.monotonic()
+                try:
+                    if now - self._opened_at > self.max_segment_age:
+                        self._seal()
+                    elif self._unsynced:
+                        self._sync(now)
+                except Exception as e:
+                    logger.warning("Spool sync failed for %s: %s", self._path, e)
+                    self._reset()
+
+    def _reset(self):
+        """Drop the current segment handle after a failure; what reached the file stays there."""
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        self._file = None
+        self._path = None
+        self._unsynced = 0
+
+    def _sync(self, now):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = now
+
+    def _seal(self):
+        self._sync(time.monotonic())
+        # Renamed while still locked, so a drainer never claims a segment mid-seal.
+        os.replace(self._path, self._path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        self._file.close()
+        self._file = None
+        self._path = None
+
+    # Draining
+
+    def sealed_segments(self, include_stale_open=True):
+        segments = glob.glob(os.path.join(self.directory, f"{self.prefix}-*{SEALED_SUFFIX}"))
+        if include_stale_open:
+            # Segments left open by a process that died are picked up once they go quiet;
+            # drain() still skips any whose writer holds its lock.
+            cutoff = time.time() - 2 * self.max_segment_age
+            for path in glob.glob(os.path.join(self.directory, f"{self.prefix}-*{OPEN_SUFFIX}")):
+                try:
+                    quiet = os.path.getmtime(path) < cutoff
+                except FileNotFoundError:
+                    continue
+                if path != self._path and quiet:
+                    segments.append(path)
+        return sorted(segments, key=os.path.basename)
+
+    def pending_count(self) -> int:
+        count = 0
+        for path in self.sealed_segments():
+            with open(path, 'rb') as f:
+                count += sum(1 for _ in f)
+        return count
+
+    def drain(self, send, batch_size=25, max_batches=None):
+        """Replay sealed segments through ``send(records) -> int`` in batches.
+
+        ``send`` returns how many leading records of the batch were delivered. Draining
+        stops at the first short batch; the undelivered tail of that segment is written
+        back so nothing is lost or replayed twice. Returns ``(sent, ok)``.
+        """
+        sent = 0
+        batches = 0
+        for path in self.sealed_segments():
+            claim = _claim_open_segment(path) if path.endswith(OPEN_SUFFIX) else None
+            if path.endswith(OPEN_SUFFIX) and claim is None:
+                continue
+            try:
+                records = _read_segment(path)
+                pos = 0
+                while pos < len(records):
+                    if max_batches is not None and batches >= max_batches:
+                        _rewrite_segment(path, records[pos:])
+                        return sent, True
+                    batch = records[pos:pos + batch_size]
+                    delivered = send(batch)
+                    pos += delivered
+                    sent += delivered
+                    batches += 1
+                    if delivered < len(batch):
+                        _rewrite_segment(path, records[pos:])
+                        return sent, False
+                os.remove(path)
+            finally:
+                if claim is not None:
+                    claim.close()
+        return sent, True
+
+
+def _claim_open_segment(path):
+    """Lock an ``.open`` segment left by a dead writer; None while its writer is alive (or it is gone)."""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _read_segment(path):
+    records = []
+    with open(path, 'rb') as f:
+        for raw in f:
+            try:
+                records.append(json.loads(raw))
+            except ValueError:
+                # Torn write at the end of a segment from a crash; skip it.
+                logger.debug("Skipping corrupt spool line in %s", path)
+    return records
+
+
+def _rewrite_segment(path, records):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+    sealed = path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX if path.endswith(OPEN_SUFFIX) else path
+    os.replace(tmp, sealed)
+    if sealed != path:
+        os.remove(path)
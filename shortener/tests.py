@@ -1,3 +1,1494 @@
-from django.test import TestCase
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from shortener import api, profiling
+from shortener.hotkeys import SpaceSaving
+from shortener.management.commands.reconcile_cache import reconcile_page
+from shortener.management.commands.startup_profile import REDIRECT_EXCLUDED_MODULES, measure_startup
+from shortener.models import Link, LinkCheck
 
-# Create your tests here.
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shortener-tests',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(TestCase):
+    """Every page runs a fixed number of queries, however many rows it shows.
+
+    Each check runs once with the fixture data and again after ``add_rows`` grows
+    the table, asserting the same exact count both times.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        cls.link = Link.objects.create(original_url='https://example.com/', short_code='first')
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def add_links(self, count=20):
+        offset = Link.objects.count()
+        Link.objects.bulk_create(
+            Link(original_url=f'https://example.com/{offset + i}', short_code=f'bulk{offset + i}') for i in range(count)
+        )
+
+    def add_users(self, count=10):
+        offset = User.objects.count()
+        for i in range(count):
+            User.objects.create_user(f'user{offset + i}', password='pw', is_staff=True)
+
+    def assertConstantQueries(self, num, add_rows, request):
+        with self.assertNumQueries(num):
+            response = request()
+        self.assertLess(response.status_code, 500)
+        add_rows()
+        with self.assertNumQueries(num):
+            response = request()
+        self.assertLess(response.status_code, 500)
+        return response
+
+    # Sessions and the logged-in user (profile joined in) are served from the cache,
+    # so pages run no auth queries once force_login has warmed it.
+
+    def test_dashboard(self):
+        from django.core.cache import cache
+
+        def _get():
+            cache.clear()
+            return self.client.get(reverse('dashboard'))
+        # session and user reloaded after the clear (2), links page, total count
+        self.assertConstantQueries(4, self.add_links, _get)
+
+    def test_dashboard_cached(self):
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('dashboard'))
+
+    def test_dashboard_htmx_table(self):
+        headers = {'HX-Request': 'true', 'HX-Target': 'links-table'}
+        # page, matched count for the bulk confirmation
+        self.assertConstantQueries(2, self.add_links, lambda: self.client.get(
+            reverse('dashboard'), {'q': 'bulk'}, headers=headers))
+
+    def test_dashboard_search_page(self):
+        self.add_links(60)
+        from shortener.search import search_links
+        _, cursor = search_links('bulk')
+        self.assertConstantQueries(2, self.add_links, lambda: self.client.get(
+            reverse('dashboard'), {'q': 'bulk', 'cursor': cursor}))
+
+    def test_create_link(self):
+        with self.assertNumQueries(3):
+            # savepoint, insert, release: the savepoint is only taken because TestCase wraps the
+            # request in a transaction; in autocommit the insert is the only query (AliasCreationTests)
+            response = self.client.post(reverse('create_link'), {'original_url': 'https://example.org/', 'custom_alias': 'made'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_edit_link(self):
+        url = reverse('edit_link', args=[self.link.id])
+        self.assertConstantQueries(1, self.add_links, lambda: self.client.get(url))
+        with self.assertNumQueries(4):
+            self.client.post(url, {'action': 'update', 'original_url': 'https://example.net/', 'custom_alias': 'first'})
+
+    def test_delete_link(self):
+        # fetch, delete link checks, delete link
+        with self.assertNumQueries(3):
+            self.client.post(reverse('delete_link', args=[self.link.id]))
+
+    def test_redirect(self):
+        url = reverse('redirect_to_original', args=['first'])
+        self.client.logout()
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_redirect_with_rules(self):
+        # The covering index carries has_rules, not the rules document: a second fetch for those.
+        Link.objects.create(original_url='https://example.com/', short_code='ruled',
+                            rules=[{'device': ['mobile'], 'url': 'https://m.example.com/'}])
+        self.client.logout()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('redirect_to_original', args=['ruled']),
+                                       headers={'User-Agent': RulesTests.IPHONE})
+        self.assertEqual(response['Location'], 'https://m.example.com/')
+
+    def test_root_redirect(self):
+        self.client.logout()
+        with self.assertNumQueries(1):
+            self.client.get(reverse('root_redirect'))
+
+    def test_login(self):
+        self.client.logout()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('login'))
+        # user lookup, session insert and key cycle, last_login update, user and profile
+        # loaded into the cache; no profile re-save
+        with self.assertNumQueries(10):
+            self.client.post(reverse('login'), {'username': 'staff', 'password': 'pw'})
+
+    def test_logout(self):
+        # the session row is fetched and deleted; the cached copy goes with it
+        with self.assertNumQueries(2):
+            self.client.get(reverse('logout'))
+
+    def test_settings_profile(self):
+        self.assertConstantQueries(0, self.add_users, lambda: self.client.get(reverse('settings_profile')))
+
+    def test_settings_users(self):
+        self.assertConstantQueries(1, self.add_users, lambda: self.client.get(reverse('settings_users')))
+
+    def test_settings_cache(self):
+        self.assertConstantQueries(0, self.add_links, lambda: self.client.get(reverse('settings_cache')))
+
+    def test_cache_actions(self):
+        from shortener import link_cache, metrics
+        with mock.patch.object(link_cache, 'redis_connection'), mock.patch.object(link_cache, 'clear_shard', return_value=0), \
+                mock.patch.object(metrics, 'reset'):
+            # Redis only; the user comes from the cache.
+            for name, data in (('delete_cache_key', {'key': ':1:shortener:url:first'}), ('clear_all_cache', {}),
+                               ('reset_cache_stats', {})):
+                with self.subTest(name), self.assertNumQueries(0):
+                    self.client.post(reverse(name), data)
+
+    def test_settings_profiler(self):
+        def _profile():
+            self.client.get(reverse('redirect_to_original', args=['first']),
+                            headers={'X-Profile-Token': profiling.make_token(self.admin)})
+        _profile()
+        self.assertConstantQueries(0, _profile, lambda: self.client.get(reverse('settings_profiler')))
+        report_id = profiling.recent_reports()[0]['id']
+        self.assertConstantQueries(0, _profile, lambda: self.client.get(reverse('profile_report', args=[report_id])))
+
+    def test_create_user(self):
+        self.assertConstantQueries(0, self.add_users, lambda: self.client.get(reverse('create_user')))
+        # username check, insert user, insert profile
+        with self.assertNumQueries(3):
+            self.client.post(reverse('create_user'), {
+                'username': 'new', 'password': 'pw-long-enough-123', 'confirm_password': 'pw-long-enough-123',
+            })
+
+    def test_edit_user(self):
+        url = reverse('edit_user', args=[self.staff.id])
+        self.assertConstantQueries(1, self.add_users, lambda: self.client.get(url))
+
+    def test_toggle_user_active(self):
+        with self.assertNumQueries(2):
+            self.client.post(reverse('toggle_user_active', args=[self.staff.id]))
+
+    def test_delete_user(self):
+        self.add_users(2)
+        users = iter(User.objects.filter(username__startswith='user').values_list('id', flat=True))
+
+        def _grow():
+            for i in range(10):
+                User.objects.create_user(f'more{i}', password='pw', is_staff=True)
+        # user, profile, then DELETEs for admin log, groups, permissions, profile and user
+        self.assertConstantQueries(7, _grow, lambda: self.client.post(reverse('delete_user', args=[next(users)])))
+        self.assertFalse(User.objects.filter(username__startswith='user').exists())
+
+    def test_bulk_links(self):
+        self.add_links()
+        ids = list(Link.objects.filter(short_code__startswith='bulk').values_list('id', flat=True))
+        batches = iter([ids[:10], ids[10:]])
+
+        def _delete_page():
+            return self.client.post(reverse('bulk_links'), {'action': 'delete', 'ids': next(batches)})
+        def _grow():
+            Link.objects.bulk_create(Link(original_url=f'https://example.com/more{i}', short_code=f'more{i}') for i in range(1000))
+        # select rows, DELETE link checks and links, savepoint and release
+        self.assertConstantQueries(5, _grow, _delete_page)
+        self.assertFalse(Link.objects.filter(short_code__startswith='bulk').exists())
+        self.assertEqual(Link.objects.filter(short_code__startswith='more').count(), 1000)
+
+    def test_bulk_links_all_matching(self):
+        self.add_links()
+        url = reverse('bulk_links')
+        with self.assertNumQueries(4):
+            response = self.client.post(url, {'action': 'retarget', 'select_all': 'on', 'q': 'bulk',
+                                              'original_url': 'https://example.org/moved'})
+        self.assertRedirects(response, reverse('dashboard') + '?q=bulk', fetch_redirect_response=False)
+        self.assertEqual(Link.objects.filter(original_url='https://example.org/moved').count(), 20)
+        with self.assertNumQueries(4):
+            self.client.post(url, {'action': 'replace_prefix', 'select_all': 'on', 'domain': 'example.org',
+                                   'old_prefix': 'https://example.org/', 'new_prefix': 'https://example.net/'})
+        self.assertEqual(Link.objects.filter(original_url='https://example.net/moved').count(), 20)
+        self.assertEqual(Link.objects.get(short_code='first').original_url, 'https://example.com/')
+
+    def test_bulk_links_all_matching_needs_a_search(self):
+        self.add_links()
+        total = Link.objects.count()
+        for search in ({}, {'q': ''}, {'date_from': 'not-a-date'}):
+            response = self.client.post(reverse('bulk_links'), {'action': 'delete', 'select_all': 'on', **search},
+                                        follow=True)
+            self.assertContains(response, 'Search for the links to change')
+            self.assertEqual(Link.objects.count(), total)
+        response = self.client.get(reverse('dashboard'), {'q': 'bulk'})
+        self.assertContains(response, 'data-matched="20"')
+
+    def test_api_resolve(self):
+        with mock.patch.object(api, 'API_TOKENS', ['t']):
+            with self.assertNumQueries(1):
+                self.client.post(reverse('api_resolve_links'), {'codes': ['first', 'nope']},
+                                 content_type='application/json', headers={'Authorization': 'Bearer t'})
+
+    def test_admin_link_changelist(self):
+        url = reverse('admin:shortener_link_changelist')
+        # count, page joined with link checks, status filter choices
+        self.assertConstantQueries(3, self.add_links, lambda: self.client.get(url))
+
+    def test_admin_user_changelist(self):
+        url = reverse('admin:auth_user_changelist')
+        self.assertConstantQueries(3, self.add_users, lambda: self.client.get(url))
+
+
+class ColdStartTests(SimpleTestCase):
+    """A redirect cold start loads only the redirect path and stays within its time budget."""
+
+    # Generous enough for a loaded CI runner; measured around 350-450ms locally.
+    BUDGET_MS = 1500
+
+    def test_redirect_imports(self):
+        report = measure_startup('/abc123/')
+        self.assertEqual(report['view'], 'shortener.redirects.redirect_to_original')
+        loaded = set(report['modules'])
+        self.assertEqual([m for m in REDIRECT_EXCLUDED_MODULES if m in loaded], [])
+
+    def test_redirect_budget(self):
+        timings = sorted(r['boot_ms'] + r['resolve_ms'] for r in (measure_startup('/abc123/') for _ in range(3)))
+        self.assertLess(timings[1], self.BUDGET_MS)
+
+    def test_dashboard_loads_lazily(self):
+        from django.urls import resolve
+        # Resolving names the view; the module is only imported when the view is called.
+        report = measure_startup('/links/')
+        self.assertEqual(report['view'], 'shortener.views.dashboard')
+        self.assertNotIn('shortener.views', report['modules'])
+        from shortener import views
+        self.assertIs(resolve('/links/').func.view, views.dashboard)
+
+    def test_reverse_does_not_load_views(self):
+        # Building the reverse map inspects every view; lazy ones answer without importing.
+        report = measure_startup('/abc123/', reverse_names=['dashboard', 'api_bulk_links'])
+        self.assertEqual(report['reversed'], ['/links/', '/api/links/bulk/'])
+        loaded = set(report['modules'])
+        self.assertEqual([m for m in REDIRECT_EXCLUDED_MODULES if m in loaded], [])
+
+
+class SpaceSavingTests(SimpleTestCase):
+    def test_exact_below_capacity(self):
+        sketch = SpaceSaving(8)
+        for code in 'aabbbc':
+            sketch.offer(code)
+        self.assertEqual(sketch.top(), [('b', 3, 0), ('a', 2, 0), ('c', 1, 0)])
+
+    def test_heavy_hitters_on_skewed_stream(self):
+        rng = random.Random(7)
+        stream = [f"c{int(rng.paretovariate(1.1))}" for _ in range(50000)]
+        stream += [f"tail{i}" for i in range(5000)]  # one-off codes churning the sketch
+        rng.shuffle(stream)
+        sketch = SpaceSaving(64)
+        for code in stream:
+            sketch.offer(code)
+        true = Counter(stream)
+        self.assertEqual(len(sketch), 64)
+        for code, count, error in sketch.top():
+            self.assertLessEqual(count - error, true[code])
+            self.assertLessEqual(true[code], count)
+        self.assertEqual([code for code, _, _ in sketch.top(5)], [code for code, _ in true.most_common(5)])
+
+
+class RulesTests(SimpleTestCase):
+    IPHONE = ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+              'Version/17.1 Mobile/15E148 Safari/604.1')
+
+    def setUp(self):
+        from django.test import RequestFactory
+        self.factory = RequestFactory()
+
+    def choose(self, spec, client_id='', **meta):
+        from shortener.rules import compile_rules, evaluate
+        return evaluate(compile_rules(spec), self.factory.get('/x/', **meta), client_id)
+
+    def at(self, *args):
+        """Pin the rules clock to ``datetime(*args)`` in RULES_TZ."""
+        from shortener import rules
+        now = datetime.datetime(*args, tzinfo=rules.RULES_TZ)
+        return mock.patch.object(rules, 'datetime', mock.Mock(now=lambda tz: now))
+
+    def test_device(self):
+        spec = [{'device': ['mobile', 'tablet'], 'url': 'https://m.example.com/'}]
+        self.assertEqual(self.choose(spec, HTTP_USER_AGENT=self.IPHONE), 'https://m.example.com/')
+        self.assertIsNone(self.choose(spec, HTTP_USER_AGENT='Mozilla/5.0 (Windows NT 10.0; Win64; x64)'))
+        self.assertIsNone(self.choose(spec, HTTP_USER_AGENT='curl/8.4.0'))
+
+    def test_country_and_language(self):
+        from shortener.rules import COUNTRY_META_KEY
+        spec = [{'country': ['TW', 'HK'], 'language': ['zh'], 'url': 'https://example.com/zh/'}]
+        self.assertEqual(self.choose(spec, **{COUNTRY_META_KEY: 'tw', 'HTTP_ACCEPT_LANGUAGE': 'zh-TW,en;q=0.8'}),
+                         'https://example.com/zh/')
+        self.assertIsNone(self.choose(spec, **{COUNTRY_META_KEY: 'TW', 'HTTP_ACCEPT_LANGUAGE': 'en-US'}))
+        self.assertIsNone(self.choose(spec, **{COUNTRY_META_KEY: 'DE', 'HTTP_ACCEPT_LANGUAGE': 'zh'}))
+        self.assertIsNone(self.choose(spec, HTTP_ACCEPT_LANGUAGE='zh'))
+
+    def test_time_window(self):
+        office = [{'time': {'start': '09:00', 'end': '18:00', 'days': [0, 1, 2, 3, 4]}, 'url': 'https://example.com/open'}]
+        night = [{'time': {'start': '22:00', 'end': '06:00'}, 'url': 'https://example.com/night'}]
+        with self.at(2026, 10, 19, 9, 0):  # a Monday
+            self.assertEqual(self.choose(office), 'https://example.com/open')
+            self.assertIsNone(self.choose(night))
+        with self.at(2026, 10, 19, 18, 1):
+            self.assertIsNone(self.choose(office))
+        with self.at(2026, 10, 18, 12, 0):  # a Sunday
+            self.assertIsNone(self.choose(office))
+        with self.at(2026, 10, 18, 23, 30):
+            self.assertEqual(self.choose(night), 'https://example.com/night')
+        with self.at(2026, 10, 19, 5, 59):
+            self.assertEqual(self.choose(night), 'https://example.com/night')
+
+    def test_first_match_wins(self):
+        spec = [{'device': ['mobile'], 'url': 'https://m.example.com/'}, {'url': 'https://example.com/all'}]
+        self.assertEqual(self.choose(spec, HTTP_USER_AGENT=self.IPHONE), 'https://m.example.com/')
+        self.assertEqual(self.choose(spec, HTTP_USER_AGENT='Mozilla/5.0 (X11; Linux x86_64)'), 'https://example.com/all')
+
+    def test_split_is_sticky_and_weighted(self):
+        spec = [{'split': [{'url': 'https://a.example.com/', 'weight': 80}, {'url': 'https://b.example.com/', 'weight': 20}]}]
+        for client_id in ('203.0.113.7', '198.51.100.1', '2001:db8::1'):
+            self.assertEqual(len({self.choose(spec, client_id) for _ in range(5)}), 1)
+        counts = Counter(self.choose(spec, f'client{i}') for i in range(5000))
+        self.assertAlmostEqual(counts['https://a.example.com/'] / 5000, 0.8, delta=0.03)
+
+    def test_invalid_rules(self):
+        from shortener.rules import compile_rules
+        self.assertIsNone(compile_rules([]))
+        for spec in ({'url': 'https://example.com/'}, [{'device': ['phone'], 'url': 'https://example.com/'}],
+                     [{'country': ['DE']}], [{'url': 'not a url'}], [{'time': {'start': '25:00'}, 'url': 'https://example.com/'}],
+                     [{'time': {'days': [7]}, 'url': 'https://example.com/'}],
+                     [{'split': [{'url': 'https://example.com/', 'weight': 0}]}]):
+            with self.assertRaises(ValueError):
+                compile_rules(spec)
+
+
+class BotDetectionTests(SimpleTestCase):
+    HUMANS = [
+        'Mozilla/5.0 (Linux; Android 10; CUBOT_X30) AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/120.0.6099.144 Mobile Safari/537.36',
+        'Mozilla/5.0 (Linux; Android 9; CUBOT KING KONG) AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/110.0.5481.153 Mobile Safari/537.36',
+        'Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+        'Mobile/15E148 [LinkedInApp]/9.29.8663',
+        'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+        'Mobile/15E148 [Pinterest/iOS]',
+        'Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/118.0.5993.111 Mobile Safari/537.36 Snapchat/12.58.0.36 (like Safari/604.1, Android 13)',
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+        'Version/17.1 Safari/605.1.15',
+        '',
+    ]
+    BOTS = [
+        'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+        'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+        'LinkedInBot/1.0 (compatible; Mozilla/5.0; Apache-HttpClient +http://www.linkedin.com)',
+        'Pinterest/0.2 (+https://www.pinterest.com/bot.html)',
+        'Mozilla/5.0 (compatible; Pinterestbot/1.0; +http://www.pinterest.com/bot.html)',
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_1) AppleWebKit/601.2.4 (KHTML, like Gecko) '
+        'Version/9.0.1 Safari/601.2.4 facebookexternalhit/1.1 Facebot Twitterbot/1.0',
+        'Mozilla/5.0 (compatible; Snap URL Preview Service; bot; snapchat; https://developers.snap.com/robots)',
+        'Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)',
+        'WhatsApp/2.23.20.0 A',
+        'TelegramBot (like TwitterBot)',
+        'Mozilla/5.0 (compatible; Discordbot/2.0; +https://discordapp.com)',
+        'curl/8.4.0',
+        'python-requests/2.31.0',
+    ]
+
+    def test_humans(self):
+        from shortener.bots import is_bot
+        self.assertEqual([ua for ua in self.HUMANS if is_bot(ua)], [])
+
+    def test_bots(self):
+        from shortener.bots import is_bot
+        self.assertEqual([ua for ua in self.BOTS if not is_bot(ua)], [])
+
+
+class HashRingTests(SimpleTestCase):
+    NODES = {f'shard{i}': f'redis://cache-{i}:6379/1' for i in range(4)}
+    KEYS = [f'code{i}' for i in range(20000)]
+
+    def assign(self, ring):
+        return {key: ring.get_node(key) for key in self.KEYS}
+
+    def test_distribution(self):
+        from shortener.link_cache import HashRing
+        shares = Counter(self.assign(HashRing(self.NODES)).values())
+        for node in self.NODES:
+            self.assertAlmostEqual(shares[node] / len(self.KEYS), 0.25, delta=0.06)
+
+    def test_adding_a_node_moves_only_its_share(self):
+        from shortener.link_cache import HashRing
+        before = self.assign(HashRing(self.NODES))
+        after = self.assign(HashRing({**self.NODES, 'shard4': 'redis://cache-4:6379/1'}))
+        moved = [key for key in self.KEYS if before[key] != after[key]]
+        self.assertAlmostEqual(len(moved) / len(self.KEYS), 0.2, delta=0.05)
+        self.assertEqual({after[key] for key in moved}, {'shard4'})
+
+    def test_placement_follows_identity_not_position(self):
+        from shortener.link_cache import HashRing
+        before = self.assign(HashRing(self.NODES))
+        # The list reordered, so every alias now names another URL: each key stays with its URL.
+        renamed = {f'shard{3 - i}': url for i, url in enumerate(self.NODES.values())}
+        after = self.assign(HashRing(renamed))
+        self.assertTrue(all(self.NODES[before[key]] == renamed[after[key]] for key in self.KEYS))
+        # Removing a node moves only that node's keys.
+        without = self.assign(HashRing({alias: url for alias, url in self.NODES.items() if alias != 'shard1'}))
+        self.assertTrue(all(without[key] == before[key] for key in self.KEYS if before[key] != 'shard1'))
+
+
+class MetricsTests(SimpleTestCase):
+    def test_incr_never_calls_redis(self):
+        from shortener import link_cache, metrics
+        with mock.patch.object(metrics, '_flusher', object()), \
+                mock.patch.object(link_cache, 'redis_connection', side_effect=AssertionError):
+            metrics.incr('test_metric', 3)
+        con = mock.Mock()
+        with mock.patch.object(link_cache, 'redis_connection', return_value=con):
+            metrics.flush()
+        con.pipeline.return_value.hincrby.assert_any_call(metrics.METRICS_KEY, 'test_metric', 3)
+
+
+class HotKeysTests(SimpleTestCase):
+    def setUp(self):
+        from shortener import hotkeys
+        for patch in (mock.patch.object(hotkeys, '_flusher', object()),  # no background thread
+                      mock.patch.object(hotkeys, '_handed_off', deque())):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_record_never_calls_redis(self):
+        from shortener import hotkeys
+
+        def _requests():
+            hotkeys.record('hot')
+            hotkeys._local.tracker.flush_at = 0
+            for i in range(63):
+                hotkeys.record('hot' if i % 2 else f'cold{i}')
+
+        with mock.patch.object(hotkeys.link_cache, 'redis_connection', side_effect=AssertionError):
+            thread = threading.Thread(target=_requests)
+            thread.start()
+            thread.join()
+        # The 32nd request handed its sketch off; the flusher sends it in one pipeline.
+        self.assertEqual(len(hotkeys._handed_off), 1)
+        con = mock.Mock()
+        hotkeys.flush(con)
+        pipe = con.pipeline.return_value
+        self.assertEqual(sum(c.args[1] for c in pipe.zincrby.call_args_list), 32)
+        pipe.execute.assert_called_once_with()
+        self.assertEqual(len(hotkeys._handed_off), 0)
+
+    def test_pinned_copy_not_served_after_change(self):
+        from shortener import hotkeys, link_changes
+        log, mirror = _FakeChangeLog(), link_changes.ChangeMirror(0)
+        entry = {'url': 'https://example.com/', 'id': 1}
+        copied_at = link_changes.now_ms()
+        with mock.patch.object(hotkeys, '_pins', (copied_at, {'hot': entry})), \
+                mock.patch.object(link_changes, '_mirror', mirror):
+            mirror.sync(log)
+            self.assertIs(hotkeys.pinned_entry('hot'), entry)
+            # Changed through another worker, which could only drop its own copy.
+            log.scores['hot'] = copied_at + 5
+            mirror.sync(log)
+            self.assertIsNone(hotkeys.pinned_entry('hot'))
+
+    def test_key_pinned_elsewhere_gets_its_ttl_back(self):
+        from shortener import hotkeys
+        con = mock.Mock()
+        # 'old' was pinned by another (or a restarted) worker; this one never had a copy.
+        con.smembers.return_value = {b'old', b'hot'}
+        entry = {'url': 'https://example.com/', 'id': 1}
+        with mock.patch.object(hotkeys, '_pins', (0, {})), mock.patch.object(hotkeys, 'CACHE_TTL', 300), \
+                mock.patch.object(hotkeys.link_changes, '_mirror', hotkeys.link_changes.ChangeMirror(0)), \
+                mock.patch.object(hotkeys, 'top_keys', return_value=[('hot', hotkeys.HOT_KEYS_PIN_MIN_HITS)]), \
+                mock.patch.object(hotkeys.link_cache, 'get_many', return_value={'hot': entry}), \
+                mock.patch.object(hotkeys.link_cache, 'persist_many') as persist_many, \
+                mock.patch.object(hotkeys.link_cache, 'expire_many') as expire_many:
+            hotkeys._refresh_pins(con)
+            self.assertEqual(hotkeys.pinned_codes(), ['hot'])
+        con.sadd.assert_called_once_with(hotkeys.PINNED_KEY, 'hot')
+        persist_many.assert_called_once_with({'hot': entry})
+        expire_many.assert_called_once_with({'old'}, 300)
+        con.srem.assert_called_once_with(hotkeys.PINNED_KEY, 'old')
+
+    def test_change_mirror_starts_before_pins_are_copied(self):
+        from shortener import hotkeys, link_changes
+        mirrors = []
+
+        def _get_many(codes):
+            mirrors.append(link_changes._mirror)
+            return {'hot': {'url': 'https://example.com/', 'id': 1}}
+
+        with mock.patch.object(hotkeys, '_pins', (0, {})), mock.patch.object(link_changes, '_mirror', None), \
+                mock.patch.object(link_changes.ChangeMirror, 'start'), \
+                mock.patch('shortener.snapshot.get_snapshot', return_value=None), \
+                mock.patch.object(hotkeys, 'top_keys', return_value=[('hot', hotkeys.HOT_KEYS_PIN_MIN_HITS)]), \
+                mock.patch.object(hotkeys.link_cache, 'get_many', side_effect=_get_many), \
+                mock.patch.object(hotkeys.link_cache, 'persist_many'):
+            hotkeys._refresh_pins(mock.Mock(**{'smembers.return_value': set()}))
+            copied_at, _ = hotkeys._pins
+        self.assertIsNotNone(mirrors[0])
+        self.assertLessEqual(mirrors[0].start_ms, copied_at)
+        # A copy from before the mirror started is never served.
+        mirror = link_changes.ChangeMirror(copied_at)
+        mirror.sync(_FakeChangeLog())
+        self.assertTrue(mirror.is_current('hot', copied_at))
+        self.assertFalse(mirror.is_current('hot', copied_at - 1))
+
+
+class SamplingTests(SimpleTestCase):
+    def setUp(self):
+        from shortener import ga4
+        for patch in (mock.patch.object(ga4, 'GA_MEASUREMENT_ID', 'G-TEST'), mock.patch.object(ga4, 'GA_API_SECRET', 's'),
+                      mock.patch.object(ga4, 'GA_ASYNC', False), mock.patch.object(ga4, 'GA_SPOOL_DIR', None),
+                      mock.patch.object(ga4, 'GA_SAMPLE_RATE', 0.5), mock.patch.object(ga4, 'GA_SAMPLE_OVERRIDES', {'promo': 0.1}),
+                      mock.patch.object(ga4, 'GA_ADAPTIVE', False), mock.patch.object(ga4, '_inflight', 0),
+                      mock.patch.object(ga4, '_latency_ewma', 0.0)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_bucket_is_stable_and_uniform(self):
+        from shortener.ga4 import _sample_bucket
+        self.assertEqual(_sample_bucket('1234567890.1700000000'), _sample_bucket('1234567890.1700000000'))
+        # Pinned: a change of hash would re-sample every visitor mid-session.
+        self.assertAlmostEqual(_sample_bucket('1234567890.1700000000'), 0.3292, places=4)
+        buckets = [_sample_bucket(f'{i}.1700000000') for i in range(10000)]
+        self.assertTrue(all(0 <= b < 1 for b in buckets))
+        self.assertAlmostEqual(sum(b < 0.25 for b in buckets) / len(buckets), 0.25, delta=0.02)
+
+    def test_overrides(self):
+        from shortener.ga4 import effective_sample_rate
+        self.assertEqual(effective_sample_rate('promo'), 0.1)
+        self.assertEqual(effective_sample_rate('other'), 0.5)
+        self.assertEqual(effective_sample_rate(), 0.5)
+        with mock.patch.dict('shortener.ga4.GA_SAMPLE_OVERRIDES', {'all': 2, 'none': -1}):
+            self.assertEqual((effective_sample_rate('all'), effective_sample_rate('none')), (1.0, 0.0))
+
+    def test_kept_events_carry_sample_weight(self):
+        from django.test import RequestFactory
+        from shortener import ga4
+        kept = next(f'{i}.1700000000' for i in range(100) if ga4._sample_bucket(f'{i}.1700000000') < 0.5)
+        dropped = next(f'{i}.1700000000' for i in range(100) if ga4._sample_bucket(f'{i}.1700000000') >= 0.5)
+        sent = []
+        with mock.patch.object(ga4, '_send_ga4_event_thread', side_effect=lambda cid, name, params, *rest: sent.append((cid, params))):
+            for client_id in (kept, dropped):
+                request = RequestFactory().get('/x/')
+                request.COOKIES['_ga'] = f'GA1.1.{client_id}'
+                ga4.send_ga4_event(request, short_code='other')
+            with mock.patch.object(ga4, 'GA_SAMPLE_RATE', 1.0):
+                ga4.send_ga4_event(request, short_code='other')
+        self.assertEqual(sent, [(kept, {'sample_weight': 2.0}), (dropped, {})])
+
+    def test_adaptive_rate(self):
+        from shortener import ga4
+        with mock.patch.object(ga4, 'GA_ADAPTIVE', True), mock.patch.object(ga4, 'GA_ADAPTIVE_MAX_INFLIGHT', 32), \
+                mock.patch.object(ga4, 'GA_ADAPTIVE_MAX_LATENCY', 1.0), mock.patch.object(ga4, 'GA_ADAPTIVE_MIN_RATE', 0.01):
+            self.assertEqual(ga4.effective_sample_rate(), 0.5)  # no pressure
+            with mock.patch.object(ga4, '_inflight', 64):
+                self.assertEqual(ga4.effective_sample_rate(), 0.25)
+            with mock.patch.object(ga4, '_latency_ewma', 4.0):
+                self.assertEqual(ga4.effective_sample_rate(), 0.125)
+            with mock.patch.object(ga4, '_inflight', 32000):
+                self.assertEqual(ga4.effective_sample_rate(), 0.01)  # floored at the minimum rate
+                with mock.patch.dict('shortener.ga4.GA_SAMPLE_OVERRIDES', {'rare': 0.005}):
+                    self.assertEqual(ga4.effective_sample_rate('rare'), 0.005)  # ...but never raised to it
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Local target server: /ok, /missing (404), /moved (301 to /ok), /nohead (405 on HEAD), /slow."""
+
+    def _respond(self, head):
+        if self.path == '/slow':
+            time.sleep(1)
+        if self.path == '/moved':
+            self.send_response(301)
+            self.send_header('Location', '/ok')
+        elif self.path == '/nohead' and head:
+            self.send_response(405)
+        elif self.path in ('/ok', '/nohead', '/slow'):
+            self.send_response(200)
+        else:
+            self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+    def do_GET(self):
+        self._respond(head=False)
+
+    def log_message(self, *args):
+        pass
+
+
+class _CollectHandler(BaseHTTPRequestHandler):
+    """Stand-in GA4 collect endpoint: answers 503 while ``server.failing``, else records the events."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.server.failing:
+            self.send_response(503)
+        else:
+            self.server.events.extend(event['params']['n'] for event in body['events'])
+            self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SpoolReplayTests(SimpleTestCase):
+    def setUp(self):
+        from shortener import ga4
+        from shortener.spool import EventSpool
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _CollectHandler)
+        self.server.failing, self.server.events = True, []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        for name, value in (('GA_ENDPOINT', f'http://127.0.0.1:{self.server.server_port}/mp/collect'),
+                            ('GA_MEASUREMENT_ID', 'G-TEST'), ('GA_API_SECRET', 'secret')):
+            patcher = mock.patch.object(ga4, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.spool = EventSpool(self.directory, prefix='ga4', fsync_interval=60)
+
+    def _append(self, spool, numbers):
+        for n in numbers:
+            spool.append([n, 'client', 'page_view', {'n': n}, None, None, None])
+
+    def test_replay_with_backoff_until_endpoint_recovers(self):
+        from django.core.management.base import CommandError
+        from shortener import ga4
+        self._append(self.spool, range(30))
+        self.spool.flush()
+        with mock.patch.object(ga4, 'get_spool', return_value=self.spool):
+            with self.assertRaises(CommandError):
+                call_command('replay_ga4_spool', stdout=open(os.devnull, 'w'))
+            self.assertEqual(self.spool.pending_count(), 30)
+
+            self.server.failing = False
+            call_command('replay_ga4_spool', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.server.events, list(range(30)))
+        self.assertEqual(self.spool.pending_count(), 0)
+
+    def test_live_writer_segment_is_not_drained(self):
+        from shortener.spool import EventSpool
+        self.server.failing = False
+        self._append(self.spool, range(3))
+        # Buffered, not yet on disk, and old enough to look abandoned.
+        old = time.time() - 3600
+        os.utime(self.spool._path, (old, old))
+        replayer = EventSpool(self.directory, prefix='ga4')
+        from shortener import ga4
+        self.assertEqual(replayer.drain(ga4.send_ga4_batch), (0, True))
+        self._append(self.spool, [3])
+
+        # Once the writer is gone its lock is released and the segment is picked up.
+        self.spool._file.flush()
+        self.spool._file.close()
+        os.utime(self.spool._path, (old, old))
+        self.assertEqual(replayer.drain(ga4.send_ga4_batch), (4, True))
+        self.assertEqual(self.server.events, [0, 1, 2, 3])
+
+    def test_write_failure_opens_a_fresh_segment(self):
+        from shortener import ga4
+        self._append(self.spool, [0])
+        broken = self.spool._path
+        with mock.patch.object(self.spool._file, 'write', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self._append(self.spool, [1])
+        self._append(self.spool, [2])
+        self.assertNotEqual(self.spool._path, broken)
+        with mock.patch.object(ga4, 'get_spool', return_value=self.spool), \
+                mock.patch.object(self.spool, 'append', side_effect=ValueError('closed file')):
+            with self.assertLogs('shortener.ga4', 'WARNING'):
+                self.assertFalse(ga4._spool_event('client', 'page_view', {}))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AccessLogTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'access.log')
+
+    def handler(self, max_bytes=0, backups=0, capacity=100):
+        import logging
+        from shortener.access_log import BatchingRotatingFileHandler
+        handler = BatchingRotatingFileHandler(self.path, max_bytes, backups, capacity)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.addCleanup(handler.close)
+        return handler
+
+    def emit(self, handler, *lines):
+        import logging
+        for line in lines:
+            handler.emit(logging.makeLogRecord({'msg': line}))
+
+    def read(self, path=None):
+        if not os.path.exists(path or self.path):
+            return []
+        with open(path or self.path, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_line_format(self):
+        from shortener.access_log import format_line
+        self.assertEqual(format_line((1700000000.25, 'abc123', 'hit', 0.8449, '203.0.113.7', 'Mozilla/5.0')),
+                         '2023-11-14T22:13:20.250Z abc123 hit 0.84 203.0.113.7 9cc35efc')
+        # Codes can't break the space-separated format; missing fields become '-'.
+        self.assertEqual(format_line((1700000000.0, 'a b@c', '404', 12.0, None, '')),
+                         '2023-11-14T22:13:20.000Z a%20b@c 404 12.00 - -')
+
+    def test_full_queue_drops_and_counts(self):
+        import queue
+        from shortener import access_log
+        full = queue.Queue(maxsize=1)
+        full.put_nowait(None)
+        with mock.patch.object(access_log, 'ACCESS_LOG_PATH', self.path), \
+                mock.patch.object(access_log, '_listener', object()), mock.patch.object(access_log, '_queue', full), \
+                mock.patch.object(access_log.metrics, 'incr') as incr:
+            access_log.log_redirect('abc123', 'hit', time.perf_counter(), '203.0.113.7', 'Mozilla/5.0')
+        incr.assert_called_once_with('access_log_dropped')
+        self.assertEqual(full.qsize(), 1)
+
+    def test_batch_is_written_when_full(self):
+        handler = self.handler(capacity=3)
+        self.emit(handler, 'one', 'two')
+        self.assertEqual(self.read(), [])
+        self.emit(handler, 'three')
+        self.assertEqual(self.read(), ['one', 'two', 'three'])
+
+    def test_batch_is_written_when_idle(self):
+        import queue
+        from shortener import access_log
+        handler = self.handler()
+        listener = access_log.AccessLogListener(queue.Queue(), handler)
+        with mock.patch.object(access_log, 'ACCESS_LOG_FLUSH_INTERVAL', 0.05):
+            listener.start()
+            self.addCleanup(listener.stop)
+            listener.queue.put_nowait((1700000000.0, 'abc123', 'miss', 3.0, '203.0.113.7', ''))
+            deadline = time.monotonic() + 5
+            while not self.read() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(self.read(), ['2023-11-14T22:13:20.000Z abc123 miss 3.00 203.0.113.7 -'])
+
+    def test_rotation_keeps_backups(self):
+        handler = self.handler(max_bytes=100, backups=2, capacity=1)
+        self.emit(handler, *(f'{i:02d}' + 'x' * 37 for i in range(10)))
+        # Two 41-byte lines fit per file; the oldest lines fall off the last backup.
+        self.assertEqual([line[:2] for line in self.read(f'{self.path}.2')], ['04', '05'])
+        self.assertEqual([line[:2] for line in self.read(f'{self.path}.1')], ['06', '07'])
+        self.assertEqual([line[:2] for line in self.read()], ['08', '09'])
+        self.assertFalse(os.path.exists(f'{self.path}.3'))
+
+    def test_aggregate(self):
+        import io
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(
+                '2026-09-30T23:59:59.000Z abc123 hit 9.00 203.0.113.9 aaaaaaaa\n'
+                '2026-10-01T00:00:01.000Z abc123 hit 1.00 203.0.113.7 aaaaaaaa\n'
+                '2026-10-01T00:00:02.000Z abc123 miss 4.00 203.0.113.7 aaaaaaaa\n'
+                '2026-10-01T00:00:03.000Z abc123 hit 1.00 203.0.113.8 aaaaaaaa\n'
+                '2026-10-01T00:00:04.000Z a%20b 404 0.50 - -\n'
+                'not an access log line\n'
+            )
+        out, err = io.StringIO(), io.StringIO()
+        call_command('aggregate_access_log', self.path, '--since', '2026-10-01', '--json', stdout=out, stderr=err)
+        self.assertEqual(json.loads(out.getvalue()), [
+            {'short_code': 'abc123', 'total': 3, 'hit': 2, 'miss': 1, '404': 0, '410': 0, 'visitors': 2, 'avg_latency_ms': 2.0},
+            {'short_code': 'a b', 'total': 1, 'hit': 0, 'miss': 0, '404': 1, '410': 0, 'visitors': 1, 'avg_latency_ms': 0.5},
+        ])
+        self.assertIn('Skipped 1 malformed lines.', err.getvalue())
+
+        out = io.StringIO()
+        call_command('aggregate_access_log', self.path, '--top', '1', stdout=out, stderr=io.StringIO())
+        table = out.getvalue().splitlines()
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table[1].split(), ['abc123', '4', '3', '1', '0', '0', '3', '3.75'])
+
+
+class CheckLinksTests(TransactionTestCase):
+    # The command reads and writes through sync_to_async's thread, so data must be committed.
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        base = f'http://127.0.0.1:{self.server.server_port}'
+        for path in ('ok', 'missing', 'moved', 'nohead', 'slow'):
+            Link.objects.create(original_url=f'{base}/{path}', short_code=path)
+        Link.objects.create(original_url='http://127.0.0.1:1/refused', short_code='refused')
+        Link.objects.create(original_url='http://\u2603.net/', short_code='snowman')
+
+    def test_check_links(self):
+        call_command('check_links', timeout=0.5, chunk_size=2, per_host=2, stdout=open(os.devnull, 'w'))
+        checks = {c.link.short_code: c for c in LinkCheck.objects.select_related('link')}
+        self.assertEqual({code: c.status_code for code, c in checks.items()}, {
+            'ok': 200, 'missing': 404, 'moved': 200, 'nohead': 200, 'slow': None, 'refused': None, 'snowman': None,
+        })
+        self.assertTrue(checks['moved'].final_url.endswith('/ok'))
+        self.assertEqual(checks['slow'].error, 'timeout')
+        self.assertTrue(checks['refused'].error.startswith('ConnectError'))
+        self.assertTrue(checks['snowman'].error.startswith('InvalidURL'))
+
+        # Recently checked links are skipped; results are upserted, not duplicated.
+        call_command('check_links', older_than=1, stdout=open(os.devnull, 'w'))
+        call_command('check_links', timeout=0.5, stdout=open(os.devnull, 'w'))
+        self.assertEqual(LinkCheck.objects.count(), 7)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReconcileCacheTests(TestCase):
+    def test_reconcile_page(self):
+        from shortener import link_cache, services
+        links = [Link.objects.create(original_url=f'https://example.com/{i}', short_code=f'r{i}') for i in range(4)]
+        services.cache_links(links)
+        Link.objects.filter(pk=links[0].pk).update(original_url='https://example.com/moved')
+        Link.objects.filter(pk=links[1].pk).update(rules=[{'country': ['DE'], 'url': 'https://example.de/'}])
+        link_cache.store('gone', 'https://example.com/gone', None)
+        codes = {code: f':1:shortener:url:{code}'.encode() for code in ['r0', 'r1', 'r2', 'r3', 'gone', 'expired']}
+
+        con = mock.Mock()
+        # One query however many links the page holds: every field the check reads is loaded.
+        with mock.patch.object(link_cache, 'redis_connection', return_value=con), self.assertNumQueries(1):
+            counts = reconcile_page('default', codes)
+        self.assertEqual(counts, {'scanned': 6, 'orphaned': 1, 'stale': 2, 'misplaced': 0})
+        self.assertCountEqual(con.unlink.call_args.args, [codes['gone'], codes['r0'], codes['r1']])
+
+        with mock.patch.object(link_cache, 'redis_connection', return_value=con):
+            con.reset_mock()
+            reconcile_page('default', codes, dry_run=True)
+        con.unlink.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExpiringLinkTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_expired_link_is_gone_from_cache(self):
+        from django.utils import timezone
+        link = Link.objects.create(original_url='https://example.com/sale', short_code='sale',
+                                   expires_at=timezone.now() + datetime.timedelta(hours=1))
+        url = reverse('redirect_to_original', args=['sale'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        Link.objects.filter(pk=link.pk).update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        from shortener import services
+        services.invalidate_link_cache('sale')
+        self.assertEqual(self.client.get(url).status_code, 410)
+        # The tombstone answers without the database.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 410)
+        self.assertEqual(services.resolve_links(['sale']), {'sale': None})
+
+    def test_cache_timeout_capped_at_expiry(self):
+        from shortener import services
+        now = time.time()
+        with mock.patch.object(services, 'CACHE_TTL', 3600):
+            self.assertEqual(services.cache_timeout({'url': 'u', 'expires_at': None}), 3600)
+            self.assertEqual(services.cache_timeout({'url': 'u', 'expires_at': now + 7200}), 3600)
+            self.assertLessEqual(services.cache_timeout({'url': 'u', 'expires_at': now + 60}), 60)
+            self.assertEqual(services.cache_timeout({'url': 'u', 'expires_at': now - 1}), services.LINK_GONE_CACHE_TTL)
+        with mock.patch.object(services, 'CACHE_TTL', None):
+            self.assertLessEqual(services.cache_timeout({'url': 'u', 'expires_at': now + 60}), 60)
+
+    def test_links_table_cached_until_first_expiry(self):
+        from django.utils import timezone
+        from shortener import views
+        now = timezone.now()
+        links = [Link(), Link(expires_at=now + datetime.timedelta(seconds=90)),
+                 Link(expires_at=now - datetime.timedelta(hours=1))]
+        with mock.patch.object(views, 'LINKS_TABLE_CACHE_TTL', 3600):
+            self.assertTrue(80 < views._table_cache_timeout(links) <= 91)
+            # Already expired rows render as such; they do not shorten the cache.
+            self.assertEqual(views._table_cache_timeout(links[::2]), 3600)
+
+    def test_sweep_expired_links(self):
+        import json
+        import tempfile
+        from django.utils import timezone
+        past = timezone.now() - datetime.timedelta(hours=2)
+        Link.objects.bulk_create([
+            Link(original_url=f'https://example.com/{i}', short_code=f'old{i}', expires_at=past) for i in range(5)
+        ])
+        Link.objects.create(original_url='https://example.com/recent', short_code='recent',
+                            expires_at=timezone.now() - datetime.timedelta(minutes=5))
+        Link.objects.create(original_url='https://example.com/live', short_code='live',
+                            expires_at=timezone.now() + datetime.timedelta(hours=1))
+        Link.objects.create(original_url='https://example.com/forever', short_code='forever')
+
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as archive:
+            call_command('sweep_expired_links', batch_size=2, grace=1, sleep=0, archive=archive.name,
+                         stdout=open(os.devnull, 'w'))
+            archived = [json.loads(line)['short_code'] for line in archive]
+        self.assertCountEqual(archived, [f'old{i}' for i in range(5)])
+        self.assertCountEqual(Link.objects.values_list('short_code', flat=True), ['recent', 'live', 'forever'])
+
+
+class _FakeChangeLog:
+    """The sorted-set calls the change log makes, over a dict."""
+
+    def __init__(self):
+        self.scores = {}
+
+    def pipeline(self, transaction=True):
+        return mock.Mock(zadd=self.zadd, zremrangebyscore=self.zremrangebyscore)
+
+    def zadd(self, key, mapping):
+        self.scores.update(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        self.scores = {code: score for code, score in self.scores.items() if score > high}
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        return sorted(((code.encode(), score) for code, score in self.scores.items() if score >= low),
+                      key=lambda row: row[1])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SnapshotChangeTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from shortener import link_changes
+        from shortener.snapshot import LinkSnapshot, write_snapshot
+        cache.clear()
+        self.link = Link.objects.create(original_url='https://example.com/live', short_code='snap')
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'links.snap')
+        write_snapshot(path, [('snap', 'https://example.com/built')], built_at=int(time.time()) - 60)
+        snapshot = LinkSnapshot(path)
+        self.addCleanup(snapshot.close)
+        self.log = _FakeChangeLog()
+        self.mirror = link_changes.ChangeMirror(snapshot.built_at * 1000)
+        for patch in (mock.patch('shortener.redirects.get_snapshot', return_value=snapshot),
+                      mock.patch.object(link_changes, 'LINK_CHANGES_ENABLED', True),
+                      mock.patch.object(link_changes, '_mirror', self.mirror),
+                      mock.patch.object(link_changes.link_cache, 'redis_connection', return_value=self.log)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.url = reverse('redirect_to_original', args=['snap'])
+
+    def test_deleted_link_is_not_served_from_snapshot(self):
+        from shortener import services
+        self.mirror.sync(self.log)
+        self.assertEqual(self.client.get(self.url)['Location'], 'https://example.com/built')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.delete_link(self.link)
+        self.mirror.sync(self.log)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_out_of_date_mirror_falls_through(self):
+        # Never synced: the snapshot could be serving anything, so ask the cache and database.
+        self.assertEqual(self.client.get(self.url)['Location'], 'https://example.com/live')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from shortener import link_cache, redirects, services
+        cache.clear()
+        for patch in (mock.patch.object(redirects, 'CACHE_SOFT_TTL', 60), mock.patch.object(services, 'CACHE_SOFT_TTL', 60),
+                      mock.patch.object(services, 'CACHE_REFRESH_ASYNC', False)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.link = Link.objects.create(original_url='https://example.com/old', short_code='swr')
+        entry = services.cache_link(self.link)
+        link_cache.store('swr', {**entry, 'fresh_until': time.time() - 1}, None)
+        # Retargeted without invalidation, as if the entry had simply aged.
+        Link.objects.filter(pk=self.link.pk).update(original_url='https://example.com/new')
+        self.url = reverse('redirect_to_original', args=['swr'])
+
+    def test_stale_entry_is_served_then_refreshed(self):
+        from shortener import link_cache
+        self.assertEqual(self.client.get(self.url)['Location'], 'https://example.com/old')
+        self.assertEqual(link_cache.get('swr')['url'], 'https://example.com/new')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url)['Location'], 'https://example.com/new')
+
+    def test_only_one_refresh_takes_the_lock(self):
+        from shortener import services
+        release = threading.Event()
+        with mock.patch.object(services, '_refresh_link', side_effect=lambda code: release.wait(5)) as refresh:
+            threads = [threading.Thread(target=services.refresh_link_cache, args=['swr']) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            # Every thread but the lock holder gives up without refreshing.
+            deadline = time.monotonic() + 5
+            while sum(thread.is_alive() for thread in threads) > 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+        refresh.assert_called_once_with('swr')
+
+    def test_refresh_lock_is_released_and_not_a_link_key(self):
+        from fnmatch import fnmatch
+        from shortener import link_cache, services
+        with mock.patch.object(services, '_refresh_link', side_effect=RuntimeError('boom')), \
+                self.assertRaises(RuntimeError):
+            services.refresh_link_cache('swr')
+        # Released even though the refresh failed.
+        self.assertTrue(link_cache.add_lock('swr', 'refresh', 60))
+        self.assertFalse(fnmatch(link_cache._lock_key('swr', 'refresh'), link_cache.LINK_KEY_PATTERN))
+
+    def test_failed_refresh_keeps_serving_stale(self):
+        from django.db import DatabaseError
+        from shortener import link_cache, services
+        with mock.patch.object(services, 'resolve_link', side_effect=DatabaseError('down')), \
+                self.assertLogs('shortener.services', 'WARNING'):
+            self.assertEqual(self.client.get(self.url)['Location'], 'https://example.com/old')
+        self.assertEqual(link_cache.get('swr')['url'], 'https://example.com/old')
+        # Once the database is back, the next hit refreshes the entry.
+        self.assertEqual(self.client.get(self.url)['Location'], 'https://example.com/old')
+        self.assertEqual(link_cache.get('swr')['url'], 'https://example.com/new')
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for code, url in [('abc123', 'https://example.com/page'), ('xabc', 'https://other.org/abc-thing'),
+                          ('www', 'https://www.example.com/x'), ('bare', 'http://Example.com'),
+                          ('sub', 'https://sub.example.com/')]:
+            Link.objects.create(original_url=url, short_code=code)
+
+    def codes(self, **filters):
+        from shortener.search import filter_links
+        return set(filter_links(Link.objects.all(), **filters).values_list('short_code', flat=True))
+
+    def test_prefix_and_substring(self):
+        # Short terms only match short codes, by prefix.
+        self.assertEqual(self.codes(query='ab'), {'abc123'})
+        self.assertEqual(self.codes(query='xa'), {'xabc'})
+        # From three characters, URLs match by substring too.
+        self.assertEqual(self.codes(query='abc'), {'abc123', 'xabc'})
+        self.assertEqual(self.codes(query='EXAMPLE.com/pa'), {'abc123'})
+        self.assertEqual(self.codes(query='123'), set())
+
+    def test_domain(self):
+        self.assertEqual(self.codes(domain='example.com'), {'abc123', 'bare'})
+        self.assertEqual(self.codes(domain='https://EXAMPLE.com/anything'), {'abc123', 'bare'})
+        self.assertEqual(self.codes(domain='www.example.com'), {'www'})
+        self.assertEqual(self.codes(domain='example.com', query='abc'), {'abc123'})
+
+    def test_cursor_pages_through_equal_timestamps(self):
+        from django.utils import timezone
+        from shortener.search import search_links
+        Link.objects.bulk_create(Link(original_url=f'https://example.net/{i}', short_code=f'same{i}') for i in range(7))
+        # Several rows share each created_at; the id tiebreak must neither skip nor repeat them.
+        stamp = timezone.now()
+        Link.objects.filter(short_code__startswith='same').update(created_at=stamp)
+        Link.objects.filter(short_code__in=['abc123', 'xabc']).update(created_at=stamp)
+        seen, cursor = [], ''
+        while True:
+            page, cursor = search_links(cursor=cursor, page_size=3)
+            seen += [link.id for link in page]
+            if not cursor:
+                break
+        expected = list(Link.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(search_links(cursor='not-a-cursor', page_size=3)[0], search_links(page_size=3)[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LinksTableTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw'))
+        self.link = Link.objects.create(original_url='https://example.com/one', short_code='one')
+        Link.objects.create(original_url='https://example.com/two', short_code='two')
+
+    def assertBumps(self, change):
+        """``change`` bumps the table generation, and the cached table is rendered afresh."""
+        from shortener.services import links_table_generation
+        self.assertContains(self.client.get(reverse('dashboard')), 'https://example.com/one')  # warms the cache
+        before = links_table_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertGreater(links_table_generation(), before)
+        return self.client.get(reverse('dashboard')).content.decode()
+
+    def test_save(self):
+        def _save():
+            self.link.original_url = 'https://example.com/edited'
+            self.link.save()
+        html = self.assertBumps(_save)
+        self.assertIn('https://example.com/edited', html)
+        self.assertNotIn('https://example.com/one', html)
+
+    def test_delete(self):
+        html = self.assertBumps(lambda: self.client.post(reverse('delete_link', args=[self.link.id])))
+        self.assertNotIn('https://example.com/one', html)
+        self.assertIn('https://example.com/two', html)
+
+    def test_bulk_action(self):
+        html = self.assertBumps(lambda: self.client.post(reverse('bulk_links'), {
+            'action': 'retarget', 'ids': [self.link.id], 'original_url': 'https://example.org/moved',
+        }))
+        self.assertIn('https://example.org/moved', html)
+        self.assertNotIn('https://example.com/one', html)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkWriteTests(TestCase):
+    def test_bulk_update_invalidates_after_commit(self):
+        from shortener import link_cache, services
+        Link.objects.create(original_url='https://example.com/a', short_code='upd')
+        with mock.patch.object(link_cache, 'unlink_many') as unlink_many, mock.patch.object(link_cache, 'delete_many') as delete_many:
+            with self.captureOnCommitCallbacks() as callbacks:
+                services.bulk_update_links({'upd': 'https://example.com/b'})
+            # Nothing is evicted before commit, or a racing redirect could re-cache the old target.
+            unlink_many.assert_not_called()
+            delete_many.assert_not_called()
+            for callback in callbacks:
+                callback()
+        unlink_many.assert_called_once_with(['upd'])
+
+
+class _FakeReplicaRedis:
+    """The string and pipeline calls replica.py makes, over a dict; the change stream stays empty."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def xrevrange(self, key, count=None):
+        return []
+
+    def pipeline(self, transaction=True):
+        calls = []
+        pipe = mock.Mock(execute=lambda: [getattr(self, name)(*args, **kwargs) for name, args, kwargs in calls])
+        for name in ('get', 'set', 'xrevrange'):
+            setattr(pipe, name, lambda *args, _name=name, **kwargs: calls.append((_name, args, kwargs)))
+        return pipe
+
+
+class ReplicaTests(TestCase):
+    def setUp(self):
+        from shortener import replica
+        self.con = _FakeReplicaRedis()
+        Link.objects.create(original_url='https://example.com/a', short_code='rep-a')
+        # The sync thread closes stale connections between rounds; not inside a test transaction.
+        patch = mock.patch.object(replica, 'close_old_connections')
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_apply_in_order(self):
+        from shortener.replica import LinkReplica
+        local = LinkReplica()
+        local.load(self.con)
+        self.assertEqual(local.lookup('rep-a'), 'https://example.com/a')
+        self.assertTrue(local.apply(1, 'set', 'rep-b', 'https://example.com/b'))
+        self.assertTrue(local.apply(1, 'del', 'rep-b', ''))  # already applied: ignored
+        self.assertTrue(local.apply(2, 'del', 'rep-a', ''))
+        self.assertEqual((local.lookup('rep-a'), local.lookup('rep-b')), (None, 'https://example.com/b'))
+
+    def test_gap_then_resync(self):
+        from shortener.replica import LinkReplica
+        local = LinkReplica()
+        local.load(self.con)
+        Link.objects.create(original_url='https://example.com/c', short_code='rep-c')
+        self.assertFalse(local.apply(2, 'set', 'rep-c', 'https://example.com/c'))
+        self.assertIsNone(local.lookup('rep-c'))
+        # First from the shared snapshot; if the gap persists, from the database.
+        local._resync(self.con)
+        self.assertIsNone(local.lookup('rep-c'))
+        local._resync(self.con)
+        self.assertEqual(local.lookup('rep-c'), 'https://example.com/c')
+        self.assertEqual(local.resyncs, 2)
+
+    def test_periodic_resync_repairs_failed_publish(self):
+        from shortener import replica
+        workers = [replica.LinkReplica(), replica.LinkReplica()]
+        for worker in workers:
+            worker.load(self.con)
+        # Changed while publishing failed: no event ever reaches the stream.
+        Link.objects.filter(short_code='rep-a').update(original_url='https://example.com/moved')
+        with mock.patch.object(replica, 'REPLICA_RESYNC_INTERVAL', 0):
+            with mock.patch.object(replica, 'publish_snapshot', wraps=replica.publish_snapshot) as rebuild:
+                for worker in workers:
+                    worker._refresh(self.con)
+        # One worker rebuilt the shared snapshot; both loaded it.
+        self.assertEqual(rebuild.call_count, 1)
+        self.assertEqual([w.lookup('rep-a') for w in workers], ['https://example.com/moved'] * 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LinkReuseTests(TestCase):
+    def test_get_or_create_matches_normalised_target(self):
+        from shortener import services
+        link, created = services.get_or_create_link('https://example.com/')
+        self.assertTrue(created)
+        with self.assertNumQueries(1):
+            self.assertEqual(services.get_or_create_link('HTTPS://Example.com:443'), (link, False))
+        # Paths stay case-sensitive; links with rules or an expiry are never shared.
+        self.assertTrue(services.get_or_create_link('https://example.com/Other')[1])
+        services.update_link(link, None, None, rules=[{'country': 'DE', 'url': 'https://example.de/'}])
+        self.assertTrue(services.get_or_create_link('https://example.com/')[1])
+
+    def test_bulk_create_reuse(self):
+        from shortener import services
+        existing = services.create_link('https://example.com/a')
+        results = services.bulk_create_links(
+            [('https://EXAMPLE.com/a', None, None), ('https://example.com/b', None, None),
+             ('https://example.com:443/b', None, None), ('https://example.com/a', 'mine', None)],
+            reuse=True,
+        )
+        links = [link for link, _ in results]
+        self.assertEqual([created for _, created in results], [False, True, False, True])
+        self.assertEqual(links[0], existing)
+        self.assertEqual(links[1].pk, links[2].pk)
+        self.assertEqual(links[3].short_code, 'mine')
+
+    def test_hash_follows_rewrites(self):
+        from shortener import services
+        from shortener.urlhash import url_hash
+        link = services.create_link('https://example.org/x')
+        services.bulk_replace_url_prefix(Link.objects.all(), 'https://example.org/', 'https://example.net/')
+        link.refresh_from_db()
+        self.assertEqual(link.url_hash, url_hash('https://example.net/x'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import Client
+        cache.clear()
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        self.client.force_login(self.admin)
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def test_cached_user_has_no_password_hash(self):
+        import pickle
+        from django.core.cache import cache
+        from shortener.auth import CachedModelBackend, user_cache_key
+        entry = cache.get(user_cache_key(self.staff.pk))  # cached at login
+        self.assertEqual(entry['user']['username'], 'staff')
+        self.assertNotIn(self.staff.password.encode(), pickle.dumps(entry))
+        user = CachedModelBackend().get_user(self.staff.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.username, user.is_staff, user.profile.avatar_url), ('staff', True, None))
+            self.assertEqual(user.get_session_auth_hash(), self.staff.get_session_auth_hash())
+        # The password is loaded when needed, and a save leaves it alone.
+        self.assertTrue(user.check_password('pw'))
+        user.email = 'new@example.com'
+        user.save()
+        self.staff.refresh_from_db()
+        self.assertEqual(self.staff.email, 'new@example.com')
+        self.assertTrue(self.staff.check_password('pw'))
+
+    def test_changes_invalidate_cached_user(self):
+        profile = reverse('settings_profile')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.staff_client.get(profile).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('toggle_user_active', args=[self.staff.id]))
+        self.assertEqual(self.staff_client.get(profile).status_code, 302)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(profile, {'avatar_url': 'https://example.com/me.png'})
+        self.assertContains(self.client.get(profile), 'https://example.com/me.png')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProfilingTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        Link.objects.create(original_url='https://example.com/', short_code='prof')
+
+    def test_token_profiles_one_request(self):
+        url = reverse('redirect_to_original', args=['prof'])
+        response = self.client.get(url, headers={'X-Profile-Token': profiling.make_token(self.admin)})
+        self.assertEqual(response.status_code, 302)
+        report = profiling.get_report(response['X-Profile-Id'])
+        self.assertEqual(report['path'], url)
+        self.assertTrue(any('shortener_link' in query['sql'] for query in report['sql']['events']))
+        self.assertIn('get', [call['op'] for call in report['cache']['events']])
+        self.assertIn('redirect_to_original', report['functions'])
+
+        # The cache methods are back to normal afterwards; the next call is not recorded.
+        self.assertNotIn('X-Profile-Id', self.client.get(url))
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('settings_profiler'))
+        self.assertContains(response, report['id'])
+        self.assertContains(self.client.get(reverse('profile_report', args=[report['id']])), 'shortener_link')
+
+    def test_query_flag_is_stripped_from_report(self):
+        token = profiling.make_token(self.admin)
+        response = self.client.get(reverse('redirect_to_original', args=['prof']), {'_profile': token, 'utm': 'x'})
+        self.assertEqual(profiling.get_report(response['X-Profile-Id'])['path'], '/prof/?utm=x')
+
+    def test_rejected_tokens(self):
+        staff = User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        url = reverse('redirect_to_original', args=['prof'])
+        for token in ('nonsense', profiling.make_token(staff), profiling.make_token(self.admin) + 'x'):
+            self.assertNotIn('X-Profile-Id', self.client.get(url, headers={'X-Profile-Token': token}))
+        with mock.patch.object(profiling, 'PROFILE_TOKEN_MAX_AGE', -1):
+            self.assertNotIn('X-Profile-Id', self.client.get(
+                url, headers={'X-Profile-Token': profiling.make_token(self.admin)}))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AliasCreationTests(TransactionTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(self.admin)
+        Link.objects.create(original_url='https://example.com/', short_code='taken')
+
+    def test_create_is_a_single_insert(self):
+        from shortener import services
+        with self.assertNumQueries(1):
+            services.create_link('https://example.org/', 'made')
+        with self.assertRaisesMessage(services.AliasTaken, "Alias 'made' is already taken."):
+            services.create_link('https://example.net/', 'made')
+
+    def test_update_collision_leaves_instance_unchanged(self):
+        from shortener import services
+        link = Link.objects.create(original_url='https://example.org/', short_code='mine')
+        before = {field: getattr(link, field) for field in ('original_url', 'url_hash', 'short_code', 'rules', 'expires_at')}
+        with self.assertRaisesMessage(services.AliasTaken, "Alias 'taken' is already taken."):
+            services.update_link(link, 'https://example.net/', 'taken', rules=[{'country': 'DE', 'url': 'https://example.de/'}],
+                                 expires_at=datetime.datetime(2099, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual({field: getattr(link, field) for field in before}, before)
+        # Still usable: a later save writes the old values, not the rejected ones.
+        link.save()
+        link.refresh_from_db()
+        self.assertEqual((link.original_url, link.short_code, link.rules), ('https://example.org/', 'mine', None))
+
+    def test_generated_code_collision_is_retried(self):
+        from shortener import services
+        with mock.patch.object(services, 'random_short_code', side_effect=['taken', 'fresh']):
+            self.assertEqual(services.create_link('https://example.org/').short_code, 'fresh')
+
+    def test_taken_alias_is_a_form_error(self):
+        response = self.client.post(reverse('create_link'), {'original_url': 'https://example.org/', 'custom_alias': 'taken'},
+                                    follow=True)
+        self.assertContains(response, "Alias &#x27;taken&#x27; is already taken.")
+        self.assertEqual(Link.objects.count(), 1)
+
+        link = Link.objects.create(original_url='https://example.org/', short_code='mine')
+        response = self.client.post(reverse('edit_link', args=[link.id]),
+                                    {'action': 'update', 'original_url': 'https://example.org/', 'custom_alias': 'taken'})
+        self.assertContains(response, "Alias &#x27;taken&#x27; is already taken.")
+        link.refresh_from_db()
+        self.assertEqual(link.short_code, 'mine')
+
+    def test_reserved_routes_need_no_query(self):
+        from shortener.utils import check_reserved_short_code, system_route_segments
+        self.assertLessEqual({'admin', 'api', 'links', 'login', 'settings'}, system_route_segments())
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(check_reserved_short_code('Admin/x'))
+            self.assertIsNone(check_reserved_short_code('logouts'))
+
+    def test_api_reports_taken_aliases_per_item(self):
+        with mock.patch.object(api, 'API_TOKENS', ['t']):
+            response = self.client.post(
+                reverse('api_bulk_links'),
+                {'create': [{'original_url': 'https://example.org/', 'custom_alias': 'taken'},
+                            {'original_url': 'https://example.org/', 'custom_alias': 'free'}]},
+                content_type='application/json', headers={'Authorization': 'Bearer t'},
+            )
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([link['short_code'] for link in response.json()['created']], ['free'])
+        self.assertEqual(response.json()['errors'][0]['index'], 0)
+
+    def test_api_results_carry_request_indexes(self):
+        from shortener import link_cache
+        Link.objects.create(original_url='https://example.com/a', short_code='first')
+        with mock.patch.object(api, 'API_TOKENS', ['t']), mock.patch.object(link_cache, 'unlink_many'), \
+                mock.patch.object(link_cache, 'delete_many'):
+            response = self.client.post(
+                reverse('api_bulk_links'),
+                {'create': [{'original_url': 'https://example.org/1'},
+                            {'original_url': 'https://example.org/2', 'custom_alias': 'taken'},
+                            {'original_url': 'https://example.org/3', 'custom_alias': 'free'},
+                            {'original_url': 'https://example.org/4'}],
+                 'update': [{'short_code': 'missing', 'original_url': 'https://example.org/5'},
+                            {'short_code': 'taken', 'original_url': 'https://example.org/6'},
+                            {'short_code': 'first', 'original_url': 'https://example.org/7'}]},
+                content_type='application/json', headers={'Authorization': 'Bearer t'},
+            )
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        created = {item['index']: item for item in body['created']}
+        self.assertEqual(sorted(created), [0, 2, 3])
+        self.assertEqual(created[2]['short_code'], 'free')
+        self.assertEqual(created[3]['original_url'], 'https://example.org/4')
+        self.assertEqual([(item['index'], item['short_code']) for item in body['updated']], [(1, 'taken'), (2, 'first')])
+        self.assertEqual([(error['op'], error['index']) for error in body['errors']], [('create', 1), ('update', 0)])
+
+    def test_api_validates_alias_length_and_reuse(self):
+        with mock.patch.object(api, 'API_TOKENS', ['t']):
+            response = self.client.post(
+                reverse('api_bulk_links'),
+                {'create': [{'original_url': 'https://example.org/', 'custom_alias': 'x' * 16},
+                            {'original_url': 'https://example.org/', 'custom_alias': 'x' * 15}]},
+                content_type='application/json', headers={'Authorization': 'Bearer t'},
+            )
+            self.assertEqual(response.status_code, 207)
+            self.assertEqual([link['short_code'] for link in response.json()['created']], ['x' * 15])
+            self.assertEqual([error['index'] for error in response.json()['errors']], [0])
+
+            response = self.client.post(
+                reverse('api_bulk_links'), {'create': [{'original_url': 'https://example.org/'}], 'reuse': 'false'},
+                content_type='application/json', headers={'Authorization': 'Bearer t'},
+            )
+            self.assertEqual(response.status_code, 400)
@@ -0,0 +1,35 @@
+"""Normalised target URLs and their 64-bit hash, stored in ``Link.url_hash``.
+
+Kept free of Django imports so migrations can use it.
+"""
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """Case-fold the scheme and host, drop a default port and give an empty path ``/``.
+
+    Path, query and fragment are kept as they are; servers may treat them case-sensitively.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f'[{host}]'
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+    userinfo = parts.netloc.rpartition('@')[0]
+    netloc = f'{userinfo}@{host}' if userinfo else host
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, parts.fragment))
+
+
+def url_hash(url: str) -> int:
+    """Signed 64-bit BLAKE2b of the normalised URL, to fit a BIGINT column."""
+    digest = hashlib.blake2b(normalize_url(url).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
@@ -1,23 +1,70 @@
+from functools import cached_property
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import path
-from . import views
+from django.utils.module_loading import import_string
+from . import redirects
+
+
+class LazyView:
+    """A view imported on first use, so redirect-only cold starts never load the dashboard or API modules.
+
+    What Django asks of a view without calling it is known from the declaration: the names
+    and ``view_class`` when ``reverse()`` builds the resolver, ``csrf_exempt`` in
+    CsrfViewMiddleware. Other attribute lookups are answered by the real view.
+    """
+
+    # Only function views are wrapped.
+    _ABSENT = frozenset({'view_class', 'view_initkwargs'})
+
+    def __init__(self, dotted_path, csrf_exempt=False):
+        self.dotted_path = dotted_path
+        self.__module__, self.__name__ = dotted_path.rsplit('.', 1)
+        self.__qualname__ = self.__name__
+        self.csrf_exempt = csrf_exempt
+
+    @cached_property
+    def view(self):
+        view = import_string(self.dotted_path)
+        if getattr(view, 'csrf_exempt', False) != self.csrf_exempt:
+            raise ImproperlyConfigured(f"{self.dotted_path} must be declared with csrf_exempt={not self.csrf_exempt}.")
+        return view
+
+    def __call__(self, request, *args, **kwargs):
+        return self.view(request, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name in self._ABSENT:
+            raise AttributeError(name)
+        return getattr(self.view, name)
+
+
+def lazy(view_name, **declared):
+    return LazyView(f'shortener.{view_name}', **declared)
+
 
 urlpatterns = [
-    path('', views.root_redirect, name='root_redirect'),
-    path('login/', views.login_view, name='login'),
-    path('logout/', views.logout_view, name='logout'),
-    path('links/', views.dashboard, name='dashboard'),
-    path('links/create/', views.create_link, name='create_link'),
-    path('links/edit/<int:link_id>/', views.edit_link, name='edit_link'),
-    path('links/delete/<int:link_id>/', views.delete_link, name='delete_link'),
-    path('settings/', views.settings_view, name='settings'),
-    path('settings/profile/', views.settings_profile, name='settings_profile'),
-    path('settings/users/', views.settings_users, name='settings_users'),
-    path('settings/cache/', views.settings_cache, name='settings_cache'),
-    path('settings/users/create/', views.create_user, name='create_user'),
-    path('settings/users/<int:user_id>/edit/', views.edit_user, name='edit_user'),
-    path('settings/users/<int:user_id>/delete/', views.delete_user, name='delete_user'),
-    path('settings/users/<int:user_id>/toggle/', views.toggle_user_active, name='toggle_user_active'),
-    path('settings/cache/delete/', views.delete_cache_key, name='delete_cache_key'),
-    path('settings/cache/clear/', views.clear_all_cache, name='clear_all_cache'),
-    path('<str:short_code>/', views.redirect_to_original, name='redirect_to_original'),
-]
\ No newline at end of file
+    path('', redirects.root_redirect, name='root_redirect'),
+    path('login/', lazy('views.login_view'), name='login'),
+    path('logout/', lazy('views.logout_view'), name='logout'),
+    path('links/', lazy('views.dashboard'), name='dashboard'),
+    path('links/create/', lazy('views.create_link'), name='create_link'),
+    path('links/edit/<int:link_id>/', lazy('views.edit_link'), name='edit_link'),
+    path('links/delete/<int:link_id>/', lazy('views.delete_link'), name='delete_link'),
+    path('links/bulk/', lazy('views.bulk_links'), name='bulk_links'),
+    path('settings/', lazy('views.settings_view'), name='settings'),
+    path('settings/profile/', lazy('views.settings_profile'), name='settings_profile'),
+    path('settings/users/', lazy('views.settings_users'), name='settings_users'),
+    path('settings/cache/', lazy('views.settings_cache'), name='settings_cache'),
+    path('settings/profiler/', lazy('views.settings_profiler'), name='settings_profiler'),
+    path('settings/profiler/<str:report_id>/', lazy('views.profile_report'), name='profile_report'),
+    path('settings/users/create/', lazy('views.create_user'), name='create_user'),
+    path('settings/users/<int:user_id>/edit/', lazy('views.edit_user'), name='edit_user'),
+    path('settings/users/<int:user_id>/delete/', lazy('views.delete_user'), name='delete_user'),
+    path('settings/users/<int:user_id>/toggle/', lazy('views.toggle_user_active'), name='toggle_user_active'),
+    path('settings/cache/delete/', lazy('views.delete_cache_key'), name='delete_cache_key'),
+    path('settings/cache/clear/', lazy('views.clear_all_cache'), name='clear_all_cache'),
+    path('settings/cache/stats/reset/', lazy('views.reset_cache_stats'), name='reset_cache_stats'),
+    path('api/links/resolve/', lazy('api.resolve_links_view', csrf_exempt=True), name='api_resolve_links'),
+    path('api/links/bulk/', lazy('api.bulk_links_view', csrf_exempt=True), name='api_bulk_links'),
+    path('<str:short_code>/', redirects.redirect_to_original, name='redirect_to_original'),
+]
@@ -1,11 +1,11 @@
-from django.urls import resolve, Resolver404
-from .models import Link
+import re
+from functools import cache
 
 RESERVED_ALIASES = {
-    'links', 'login', 'logout', 'create', 'delete', 'settings', 'admin', 'static', 'cache', 'users'
+    'links', 'login', 'logout', 'create', 'delete', 'settings', 'admin', 'static', 'cache', 'users', 'api'
 }
 RESERVED_PREFIXES = (
-    'settings/', 'delete/', 'users/', 'cache/', 'links/',
+    'settings/', 'delete/', 'users/', 'cache/', 'links/', 'api/',
 )
 
 
@@ -16,8 +16,8 @@ def normalize_short_code(short_code: str) -> str:
     return short_code
 
 
-def validate_short_code(short_code: str, exclude_link_id=None) -> str | None:
-    """Return error message if short code is invalid; None if ok."""
+def check_reserved_short_code(short_code: str) -> str | None:
+    """Return error message if the alias is reserved or shadows a system URL; no DB access."""
     if not short_code:
         return "Alias is required."
 
@@ -30,23 +30,32 @@ def validate_short_code(short_code: str, exclude_link_id=None) -> str | None:
         if normalized.lower().startswith(prefix):
             return f"Alias '{normalized}' is reserved and cannot be used."
 
-    if normalized != '@root':
-        try:
-            resolved_match = resolve(f"/{normalized}/")
-            if resolved_match.url_name != 'redirect_to_original':
-                return f"Alias '{normalized}' conflicts with a system URL."
-        except Resolver404:
-            pass
-
-    qs = Link.objects.filter(short_code=normalized)
-    if exclude_link_id:
-        qs = qs.exclude(id=exclude_link_id)
-    if qs.exists():
-        return f"Alias '{normalized}' is already taken."
+    if normalized != '@root' and normalized.lower().split('/')[0] in system_route_segments():
+        return f"Alias '{normalized}' conflicts with a system URL."
 
     return None
 
 
+@cache
+def system_route_segments() -> frozenset[str]:
+    """Lower-cased first path segments of every route other than the short code catch-all.
+
+    Built once from the URLconf, so checking an alias needs neither ``resolve()`` nor the database.
+    """
+    from django.urls import get_resolver
+    segments = set()
+    for pattern in get_resolver().url_patterns:
+        routes = [pattern.pattern]
+        if hasattr(pattern, 'url_patterns') and not str(pattern.pattern):
+            # An include() mounted at the root contributes its own first segments.
+            routes = [child.pattern for child in pattern.url_patterns]
+        for route in routes:
+            segment = str(route).lstrip('^').split('/')[0]
+            if re.fullmatch(r'[\w.@-]+', segment):
+                segments.add(segment.lower())
+    return frozenset(segments)
+
+
 def link_cache_key(short_code):
     return f"shortener:url:{short_code}"
 
@@ -1,7 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import Http404, HttpResponse
 from django.core.cache import cache
-from django_redis import get_redis_connection
+from django.template.loader import render_to_string
+from django.http import HttpResponse
 from django.contrib import messages
 from django.urls import reverse
 from django.contrib.auth import login, logout
@@ -9,24 +9,33 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.conf import settings
-from django.utils.http import url_has_allowed_host_and_scheme
-from .utils import link_cache_key, get_client_ip
+from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme, urlencode
+from . import hotkeys, link_cache, metrics, profiling
 from .models import Link
-from zlink.settings import CACHE_TTL
-from .ga4 import send_ga4_event
-from .forms import LinkCreateForm, LinkUpdateForm, AdminUserCreateForm, AdminUserUpdateForm, ProfileForm
+from .search import filter_links, search_links
+from .forms import LinkCreateForm, LinkUpdateForm, LinkSearchForm, LinkBulkActionForm, AdminUserCreateForm, AdminUserUpdateForm, ProfileForm
 from .services import (
-    resolve_link as service_resolve_link,
+    AliasTaken,
     create_link as service_create_link,
+    get_or_create_link,
+    LINK_REUSE_EXISTING,
     update_link as service_update_link,
     delete_link as service_delete_link,
     create_admin_user,
+    links_table_generation,
+    bulk_delete_links,
+    bulk_retarget_links,
+    bulk_replace_url_prefix,
+    bulk_set_expiry,
 )
-import time
 import logging
+import datetime
 
 logger = logging.getLogger(__name__)
 
+LINKS_TABLE_CACHE_TTL = getattr(settings, 'LINKS_TABLE_CACHE_TTL', 86400)
+
 
 def _errors_to_message(form):
     return "; ".join([" ".join(v) for v in form.errors.values()]) if form and form.errors else ""
@@ -43,76 +52,6 @@ def superuser_required(view_func):
         login_url='login'
     )(view_func)
 
-def resolve_short_code(request, short_code):
-    key = link_cache_key(short_code)
-    try:
-        cached_data = cache.get(key)
-    except Exception:
-        cached_data = None
-        if settings.DEBUG:
-            logger.warning("Cache get failed for key %s", key)
-
-    client_ip = get_client_ip(request)
-    user_agent = request.META.get('HTTP_USER_AGENT', '')
-    
-    if cached_data:
-        try:
-            cache.touch(key, CACHE_TTL)
-        except Exception:
-            if settings.DEBUG:
-                logger.warning("Cache touch failed for key %s", key)
-
-        target_url = cached_data['url'] if isinstance(cached_data, dict) else cached_data
-        
-        # GA4 Tracking
-        current_scheme = request.scheme
-        current_host = request.get_host()
-        full_short_url = f"{current_scheme}://{current_host}/{short_code}"
-        
-        send_ga4_event(
-            request, 
-            params={
-                'page_title': target_url, # Use original URL as page title
-                'page_location': full_short_url
-            },
-            ip_address=client_ip,
-            user_agent=user_agent
-        )
-        
-        return redirect(target_url)
-
-    link = service_resolve_link(short_code)
-
-    # GA4 Tracking for non-cached hit
-    current_scheme = request.scheme
-    current_host = request.get_host()
-    full_short_url = f"{current_scheme}://{current_host}/{short_code}"
-    
-    send_ga4_event(
-        request, 
-        params={
-            'page_title': link.original_url, # Use original URL as page title
-            'page_location': full_short_url
-        },
-        ip_address=client_ip,
-        user_agent=user_agent
-    )
-
-    try:
-        cache.set(
-            key,
-            {
-                "url": link.original_url,
-                "id": link.id,
-                "cached_at": time.time(),
-            },
-            timeout=CACHE_TTL
-        )
-    except Exception:
-        if settings.DEBUG:
-            logger.warning("Cache set failed for key %s", key)
-    return redirect(link.original_url)
-
 def login_view(request):
     if request.user.is_authenticated:
         return redirect('dashboard')
@@ -136,38 +75,40 @@ def login_view(request):
 def delete_cache_key(request):
     if request.method == 'POST':
         key = request.POST.get('key')
+        shard = request.POST.get('shard')
         if key:
-            try:
-                con = get_redis_connection("default")
-                con.delete(key)
+            aliases = [shard] if shard in link_cache.LINK_CACHE_ALIASES else None
+            results = link_cache.fan_out(lambda alias: link_cache.redis_connection(alias).delete(key), aliases)
+            errors = [f"{alias}: {error}" for alias, _, error in results if error]
+            if errors:
+                messages.error(request, f"Error deleting key: {'; '.join(errors)}")
+            else:
                 messages.success(request, f"Key '{key}' deleted.")
-            except Exception as e:
-                messages.error(request, f"Error deleting key: {e}")
 
     return redirect('settings_cache')
 
 @superuser_required
 def clear_all_cache(request):
     if request.method == 'POST':
-        try:
-            con = get_redis_connection("default")
-            keys = list(con.scan_iter(match="*shortener:url:*"))
-            if keys:
-                con.delete(*keys)
+        results = link_cache.fan_out(link_cache.clear_shard)
+        errors = [f"{alias}: {error}" for alias, _, error in results if error]
+        if errors:
+            messages.error(request, f"Error clearing cache: {'; '.join(errors)}")
+        else:
             messages.success(request, "All 'shortener:url:*' cache keys cleared.")
-        except Exception as e:
-            messages.error(request, f"Error clearing cache: {e}")
 
     # Previously returned HTMX fragment for HX-Request; now always redirect to settings page
     return redirect('settings_cache')
 
-def root_redirect(request):
-    try:
-        return resolve_short_code(request, '@root')
-    except Http404:
-        if request.user.is_authenticated:
-            return redirect('dashboard')
-        return redirect('login')
+@superuser_required
+def reset_cache_stats(request):
+    if request.method == 'POST':
+        try:
+            metrics.reset()
+            messages.success(request, "Cache hit/miss counters reset.")
+        except Exception as e:
+            messages.error(request, f"Error resetting counters: {e}")
+    return redirect('settings_cache')
 
 @admin_required
 def delete_link(request, link_id):
@@ -181,17 +122,91 @@ def delete_link(request, link_id):
     return redirect('dashboard')
 
 
-def redirect_to_original(request, short_code):
-    return resolve_short_code(request, short_code)
+def _table_cache_timeout(links) -> int:
+    """LINKS_TABLE_CACHE_TTL, cut short when a shown link expires sooner and its row must change."""
+    now = timezone.now()
+    timeout = LINKS_TABLE_CACHE_TTL
+    for link in links:
+        if link.expires_at and link.expires_at > now:
+            timeout = min(timeout, int((link.expires_at - now).total_seconds()) + 1)
+    return timeout
+
+
+def _links_table(request):
+    """Rendered link table for the search in ``request.GET``.
+
+    The unfiltered first page is cached per table generation, until the first link on it
+    expires; rows are cached by content in every case.
+    """
+    search = LinkSearchForm(request.GET or None)
+    params = search.cleaned_data if search.is_valid() else {}
+    filtered = search.is_bound and search.is_valid() and search.is_filtered()
+    cursor = params.get('cursor', '')
+
+    scheme, host = request.scheme, request.get_host()
+    generation = links_table_generation()
+
+    def _render():
+        links, next_cursor = search_links(
+            params.get('q', ''), params.get('domain', ''), params.get('date_from'), params.get('date_to'), cursor,
+        )
+        query = request.GET.copy()
+        query.pop('cursor', None)
+        first_query = query.urlencode()
+        next_query = None
+        if next_cursor:
+            query['cursor'] = next_cursor
+            next_query = query.urlencode()
+        matched = None
+        if filtered:
+            # Named in the "all matching" bulk confirmation; only searches pay for this count.
+            matched = filter_links(Link.objects.all(), params.get('q', ''), params.get('domain', ''),
+                                   params.get('date_from'), params.get('date_to')).count()
+        html = render_to_string('shortener/_links_table.html', {
+            'links': links,
+            'filtered': filtered,
+            'matched': matched,
+            'paged': bool(cursor),
+            # The header total is only shown for the cached unfiltered view.
+            'total': None if filtered else Link.objects.count(),
+            'first_query': first_query,
+            'next_query': next_query,
+            'scheme': scheme,
+            'host': host,
+            'cache_rows': generation is not None,
+            'row_cache_ttl': LINKS_TABLE_CACHE_TTL,
+            # Sent with the bulk action form so "all matching" applies to the search shown.
+            'search_fields': [(k, str(v)) for k, v in params.items() if v and k != 'cursor'] if filtered else [],
+        }, request)
+        return html, _table_cache_timeout(links)
+
+    if generation is None or filtered or cursor:
+        return _render()[0]
+
+    key = f"shortener:links_table:{generation}:{scheme}:{host}"
+    try:
+        html = cache.get(key)
+    except Exception:
+        logger.debug("Cache get failed for %s", key)
+        html = None
+    if html is None:
+        html, timeout = _render()
+        try:
+            cache.set(key, html, timeout=timeout)
+        except Exception:
+            logger.debug("Cache set failed for %s", key)
+    return html
+
 
 @admin_required
 def dashboard(request):
-    links = Link.objects.all().order_by('-created_at')
     form = LinkCreateForm()
     hx_target = request.headers.get('HX-Target')
     if request.headers.get('HX-Request') and hx_target == 'links-table':
-        return render(request, 'shortener/_links_table.html', {'links': links, 'scheme': request.scheme, 'host': request.get_host()})
-    return render(request, 'shortener/links.html', {'links': links, 'section': 'links', 'form': form})
+        return HttpResponse(_links_table(request))
+    return render(request, 'shortener/links.html', {
+        'links_table': _links_table(request), 'section': 'links', 'form': form, 'search_form': LinkSearchForm(request.GET or None),
+    })
 
 
 @admin_required
@@ -203,22 +218,75 @@ def create_link(request):
     if form.is_valid():
         original_url = form.cleaned_data['original_url']
         custom_alias = form.cleaned_data.get('custom_alias') or None
+        expires_at = form.cleaned_data.get('expires_at')
         try:
-            link = service_create_link(original_url, custom_alias)
+            if LINK_REUSE_EXISTING and not custom_alias and not expires_at:
+                link, created = get_or_create_link(original_url)
+            else:
+                link, created = service_create_link(original_url, custom_alias, expires_at), True
             if custom_alias:
                 messages.success(request, f"Link created with alias: {custom_alias}")
-            else:
+            elif created:
                 messages.success(request, f"Link created: {link.short_code}")
+            else:
+                messages.success(request, f"This URL already has a link: {link.short_code}")
+        except AliasTaken as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, f"Error creating link: {str(e)}")
     else:
         messages.error(request, _errors_to_message(form))
 
-    links = Link.objects.all().order_by('-created_at')
     if request.headers.get('HX-Request'):
         dashboard_url = reverse('dashboard')
         return HttpResponse('', headers={'HX-Redirect': dashboard_url})
-    return render(request, 'shortener/links.html', {'links': links, 'section': 'links', 'form': form})
+    if form.is_valid():
+        # The dashboard renders the (cached) table; don't build it here as well.
+        return redirect('dashboard')
+    return render(request, 'shortener/links.html', {'links_table': _links_table(request), 'section': 'links', 'form': form})
+
+@admin_required
+def bulk_links(request):
+    """Apply a bulk action to the checked rows, or to every link matching the search sent along."""
+    if request.method != 'POST':
+        return redirect('dashboard')
+
+    form = LinkBulkActionForm(request.POST)
+    search = LinkSearchForm(request.POST)
+    search_params = search.cleaned_data if search.is_valid() else {}
+    if form.is_valid() and form.cleaned_data['select_all'] and not (search.is_valid() and search.is_filtered()):
+        # Never let a missing or mangled search turn "all matching" into the whole table.
+        messages.error(request, "Search for the links to change before applying an action to all matching links.")
+    elif form.is_valid():
+        data = form.cleaned_data
+        if data['select_all']:
+            queryset = filter_links(Link.objects.all(), search_params.get('q', ''), search_params.get('domain', ''),
+                                    search_params.get('date_from'), search_params.get('date_to'))
+        else:
+            queryset = Link.objects.filter(pk__in=data['ids'])
+        try:
+            if data['action'] == 'delete':
+                count = bulk_delete_links(queryset)
+                messages.success(request, f"Deleted {count} links.")
+            elif data['action'] == 'expire':
+                count = bulk_set_expiry(queryset, data['expires_at'])
+                messages.success(request, f"Set the expiry of {count} links." if data['expires_at'] else f"Cleared the expiry of {count} links.")
+            elif data['action'] == 'retarget':
+                count = bulk_retarget_links(queryset, data['original_url'])
+                messages.success(request, f"Retargeted {count} links.")
+            else:
+                count = bulk_replace_url_prefix(queryset, data['old_prefix'], data['new_prefix'])
+                messages.success(request, f"Updated {count} links from {data['old_prefix']} to {data['new_prefix']}.")
+        except ValueError as e:
+            messages.error(request, str(e))
+    else:
+        messages.error(request, _errors_to_message(form))
+
+    query = urlencode({k: v for k, v in search_params.items() if v and k != 'cursor'})
+    dashboard_url = f"{reverse('dashboard')}?{query}" if query else reverse('dashboard')
+    if request.headers.get('HX-Request'):
+        return HttpResponse('', headers={'HX-Redirect': dashboard_url})
+    return redirect(dashboard_url)
 
 @superuser_required
 def create_user(request):
@@ -270,7 +338,7 @@ def toggle_user_active(request, user_id):
             messages.error(request, "Only superusers can deactivate staff accounts.")
         else:
             user.is_active = not user.is_active
-            user.save()
+            user.save(update_fields=['is_active'])
             status = "activated" if user.is_active else "deactivated"
             messages.success(request, f"User {user.username} has been {status}.")
     return redirect('settings_users')
@@ -371,7 +439,18 @@ def edit_user(request, user_id):
 @admin_required
 def edit_link(request, link_id):
     link = get_object_or_404(Link, id=link_id)
-    form = LinkUpdateForm(request.POST or None, link_id=link.id, initial_alias=link.short_code)
+    initial = {}
+    if link.rules:
+        initial['rules'] = link.rules
+    if link.expires_at:
+        # The format of <input type="datetime-local">, in the site's time zone.
+        initial['expires_at'] = timezone.localtime(link.expires_at).strftime('%Y-%m-%dT%H:%M')
+    form = LinkUpdateForm(
+        request.POST or None,
+        link_id=link.id,
+        initial_alias=link.short_code,
+        initial=initial or None,
+    )
 
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -388,9 +467,13 @@ def edit_link(request, link_id):
             new_short_code = form.cleaned_data.get('custom_alias') or link.short_code
             new_original_url = form.cleaned_data.get('original_url') or link.original_url
             try:
-                service_update_link(link, new_original_url, new_short_code)
+                service_update_link(link, new_original_url, new_short_code, rules=form.cleaned_data.get('rules'),
+                                    expires_at=form.cleaned_data.get('expires_at'))
                 messages.success(request, "Link updated successfully.")
                 return redirect('dashboard')
+            except AliasTaken as e:
+                form.add_error('custom_alias', str(e))
+                messages.error(request, _errors_to_message(form))
             except Exception as e:
                 messages.error(request, f"Error updating link: {e}")
         else:
@@ -463,34 +546,114 @@ def settings_users(request):
         'section': 'settings'
     })
 
+def _hit_stats():
+    """Link cache hit ratio from the counters all workers flush to Redis, or None if unavailable."""
+    try:
+        totals = metrics.totals()
+    except Exception:
+        logger.debug("Reading cache counters failed")
+        return None
+    hits, misses = totals.get('link_cache_hit', 0), totals.get('link_cache_miss', 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'not_found': totals.get('link_404', 0),
+        'gone': totals.get('link_gone', 0),
+        'local_hits': totals.get('link_local_hit', 0),
+        'pinned_hits': totals.get('link_pinned_hit', 0),
+        'lookups': lookups,
+        'hit_ratio': round(100 * hits / lookups, 1) if lookups else None,
+        'since': datetime.datetime.fromtimestamp(totals['since'], tz=datetime.timezone.utc) if 'since' in totals else None,
+    }
+
+
+def _hot_keys():
+    """Hottest short codes over the last one to two HOT_KEYS_WINDOWs, or None if unavailable."""
+    try:
+        top = hotkeys.top_keys()
+    except Exception:
+        logger.debug("Reading hot keys failed")
+        return None
+    pinned = set(hotkeys.pinned_codes())
+    return [{'short_code': code, 'hits': hits, 'pinned': code in pinned} for code, hits in top]
+
+
 @superuser_required
 def settings_cache(request):
-    # Get cache data
+    # Get cache data from every shard in parallel
     cache_data = []
-    error = None
-    try:
-        con = get_redis_connection("default")
-        keys = []
-        for key in con.scan_iter(match="*shortener:url:*"):
-            keys.append(key)
-
-        for k in keys:
-            decoded_key = k.decode('utf-8')
-            ttl = con.ttl(k)
-            k_type = con.type(k).decode('utf-8')
-            if 'url:' in decoded_key:
-                display_key = decoded_key.split('url:')[-1]
-            else:
-                display_key = decoded_key
-
-            cache_data.append({'key': decoded_key, 'display_key': display_key, 'ttl': ttl, 'type': k_type})
-    except Exception as e:
-        error = str(e)
-        if settings.DEBUG:
-            logger.warning("Redis connection failed in settings_cache: %s", e)
+    shards = []
+    errors = []
+    for alias, items, error in link_cache.fan_out(link_cache.scan_shard):
+        shard = {'alias': alias, 'keys': 0, 'online': error is None}
+        if error is not None:
+            shard['error'] = str(error)
+            errors.append(f"{alias}: {error}")
+            if settings.DEBUG:
+                logger.warning("Redis connection failed in settings_cache for %s: %s", alias, error)
+        else:
+            shard['keys'] = len(items)
+            shard['no_ttl'] = sum(1 for item in items if item['ttl'] == -1)
+            for item in items:
+                decoded_key = item['key']
+                if 'url:' in decoded_key:
+                    display_key = decoded_key.split('url:')[-1]
+                else:
+                    display_key = decoded_key
+                cache_data.append({**item, 'display_key': display_key, 'shard': alias})
+        shards.append(shard)
+
+    for alias, health, error in link_cache.fan_out(link_cache.shard_health, [s['alias'] for s in shards if s['online']]):
+        shard = next(s for s in shards if s['alias'] == alias)
+        if error is None:
+            shard.update(health)
+
+    for alias, stats, error in link_cache.fan_out(link_cache.shard_stats, [s['alias'] for s in shards if s['online']]):
+        shard = next(s for s in shards if s['alias'] == alias)
+        if error is None:
+            shard['stats'] = stats
+            if stats['avg_key_bytes'] is not None:
+                shard['link_memory'] = stats['avg_key_bytes'] * shard['keys']
+        elif settings.DEBUG:
+            logger.warning("Redis INFO failed in settings_cache for %s: %s", alias, error)
 
     return render(request, 'shortener/settings_cache.html', {
         'keys': cache_data,
-        'error': error,
+        'shards': shards,
+        'hit_stats': _hit_stats(),
+        'hot_keys': _hot_keys(),
+        'hot_keys_window': hotkeys.HOT_KEYS_WINDOW,
+        'hot_keys_pin': hotkeys.HOT_KEYS_PIN,
+        'no_ttl': sum(s.get('no_ttl', 0) for s in shards),
+        'error': '; '.join(errors) or None,
+        'section': 'settings'
+    })
+
+
+def _report_time(report):
+    return {**report, 'at': datetime.datetime.fromtimestamp(report['at'], tz=datetime.timezone.utc)}
+
+
+@superuser_required
+def settings_profiler(request):
+    return render(request, 'shortener/settings_profiler.html', {
+        'token': profiling.make_token(request.user),
+        'token_max_age': profiling.PROFILE_TOKEN_MAX_AGE // 60,
+        'report_ttl': profiling.PROFILE_REPORT_TTL // 60,
+        'enabled': profiling.PROFILING_ENABLED,
+        'reports': [_report_time(summary) for summary in profiling.recent_reports()],
+        'section': 'settings'
+    })
+
+
+@superuser_required
+def profile_report(request, report_id):
+    report = profiling.get_report(report_id)
+    if report is None:
+        messages.error(request, "That profile report has expired.")
+        return redirect('settings_profiler')
+    return render(request, 'shortener/profile_report.html', {
+        'report': _report_time(report),
         'section': 'settings'
     })
@@ -0,0 +1,38 @@
+// Relative "created ... ago" labels, rendered in the browser so the link table HTML stays cacheable
+
+const TIMESINCE_UNITS = [
+    ['year', 365 * 24 * 3600],
+    ['month', 30 * 24 * 3600],
+    ['week', 7 * 24 * 3600],
+    ['day', 24 * 3600],
+    ['hour', 3600],
+    ['minute', 60],
+];
+
+function timesince(date) {
+    const seconds = Math.max(0, Math.floor((Date.now() - date.getTime()) / 1000));
+    for (const [name, size] of TIMESINCE_UNITS) {
+        const count = Math.floor(seconds / size);
+        if (count >= 1) {
+            return `${count} ${name}${count === 1 ? '' : 's'} ago`;
+        }
+    }
+    return 'just now';
+}
+
+function renderTimesince(root) {
+    (root || document).querySelectorAll('time[data-timesince]').forEach((el) => {
+        const date = new Date(el.getAttribute('datetime'));
+        if (isNaN(date.getTime())) return;
+        if (!el.title) el.title = date.toLocaleString();
+        el.textContent = timesince(date);
+    });
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', () => renderTimesince());
+} else {
+    renderTimesince();
+}
+document.addEventListener('htmx:afterSwap', (event) => renderTimesince(event.target));
+setInterval(() => renderTimesince(), 60000);
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shortener.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -113,12 +114,132 @@ CACHES = {
     }
 }
 
+# Optional link cache sharding: "redis://a:6379/1,redis://b:6379/1". shortener:url:* keys are routed
+# across these nodes by consistent hashing; everything else stays on the default cache. A node's
+# place on the ring is hashed from its URL, or from a name given as "name=redis://...", never
+# from its position: reordering the list, or adding or removing a node, only moves the keys of
+# the nodes concerned. Name nodes to be able to move one to another address.
+REDIS_SHARD_URLS = [u.strip() for u in os.getenv('REDIS_SHARD_URLS', '').split(',') if u.strip()]
+LINK_CACHE_NODE_IDS = {}
+for _i, _entry in enumerate(REDIS_SHARD_URLS):
+    _name, _url = _entry.split('=', 1) if '=' in _entry.split('://', 1)[0] else (_entry, _entry)
+    CACHES[f'shard{_i}'] = {**CACHES['default'], 'LOCATION': _url}
+    LINK_CACHE_NODE_IDS[f'shard{_i}'] = _name
+LINK_CACHE_ALIASES = list(LINK_CACHE_NODE_IDS) or ['default']
+LINK_CACHE_VNODES = int(os.getenv('LINK_CACHE_VNODES', 160))
+
 _cache_ttl_raw = os.getenv('CACHE_TTL')
 CACHE_TTL = None if _cache_ttl_raw in (None, 'None', 'none', '') else int(_cache_ttl_raw)
 
+# Stale-while-revalidate: after CACHE_SOFT_TTL seconds a link entry is served stale and refreshed
+# in the background; CACHE_TTL stays the hard expiry. Disabled when unset.
+_cache_soft_ttl_raw = os.getenv('CACHE_SOFT_TTL')
+CACHE_SOFT_TTL = None if _cache_soft_ttl_raw in (None, 'None', 'none', '') else int(_cache_soft_ttl_raw)
+CACHE_REFRESH_ASYNC = str(os.getenv('CACHE_REFRESH_ASYNC', 'True')).strip().lower() in {'1', 'true', 'yes', 'on'}
+
+# Expired links answer 410 Gone from a cached tombstone kept this many seconds (entries for
+# expiring links otherwise get CACHE_TTL capped at their remaining lifetime).
+LINK_GONE_CACHE_TTL = int(os.getenv('LINK_GONE_CACHE_TTL', 3600))
+
+# Shortening a URL that already has a plain link (no alias, rules or expiry) returns that link
+# instead of inserting a duplicate. The API can also ask for this per request ("reuse": true).
+LINK_REUSE_EXISTING = str(os.getenv('LINK_REUSE_EXISTING', 'False')).strip().lower() in {'1', 'true', 'yes', 'on'}
+
+# Rendered dashboard link table fragments; invalidated by a generation bump on any link change.
+LINKS_TABLE_CACHE_TTL = int(os.getenv('LINKS_TABLE_CACHE_TTL', 86400))
+
+# Replica mode: each worker holds the full link map in memory, synced from a Redis Stream
+LINK_REPLICA = str(os.getenv('LINK_REPLICA', 'False')).strip().lower() in {'1', 'true', 'yes', 'on'}
+LINK_REPLICA_STREAM_MAXLEN = int(os.getenv('LINK_REPLICA_STREAM_MAXLEN', 100000))
+# Changes whose publish failed (Redis unreachable) reach the replicas at the next full resync:
+# one worker rebuilds the shared snapshot from the DB at most every LINK_REPLICA_RESYNC_INTERVAL
+# seconds, and every worker loads it.
+LINK_REPLICA_RESYNC_INTERVAL = float(os.getenv('LINK_REPLICA_RESYNC_INTERVAL', 900))
+
+# Memory-mapped link snapshot built by `manage.py build_link_snapshot`. It reflects links as of the
+# build; links edited or deleted afterwards are skipped using a change log each worker re-reads
+# every LINK_CHANGES_INTERVAL seconds (also used for pinned hot keys). While a worker cannot read
+# the log, it serves nothing from the snapshot. The log keeps LINK_CHANGES_RETENTION seconds of
+# changes, and an older snapshot is not used at all: rebuild more often than that.
+LINK_SNAPSHOT_PATH = os.getenv('LINK_SNAPSHOT_PATH') or None
+LINK_CHANGES_INTERVAL = float(os.getenv('LINK_CHANGES_INTERVAL', 1))
+LINK_CHANGES_RETENTION = int(os.getenv('LINK_CHANGES_RETENTION', 7 * 86400))
+
 GA4_TIMEOUT = int(os.getenv('GA4_TIMEOUT', 3))
 GA4_ASYNC = str(os.getenv('GA4_ASYNC', 'True')).strip().lower() in {'1', 'true', 'yes', 'on'}
 
+# GA4 sampling: global rate, per-link overrides ("code:0.1,other:0.5") and load-adaptive mode
+GA4_SAMPLE_RATE = float(os.getenv('GA4_SAMPLE_RATE', 1.0))
+GA4_SAMPLE_OVERRIDES = {
+    code.strip(): float(rate)
+    for code, _, rate in (item.partition(':') for item in os.getenv('GA4_SAMPLE_OVERRIDES', '').split(','))
+    if code.strip() and rate.strip()
+}
+GA4_ADAPTIVE_SAMPLING = str(os.getenv('GA4_ADAPTIVE_SAMPLING', 'False')).strip().lower() in {'1', 'true', 'yes', 'on'}
+GA4_ADAPTIVE_MAX_INFLIGHT = int(os.getenv('GA4_ADAPTIVE_MAX_INFLIGHT', 32))
+GA4_ADAPTIVE_MAX_LATENCY = float(os.getenv('GA4_ADAPTIVE_MAX_LATENCY', 1.0))
+GA4_ADAPTIVE_MIN_RATE = float(os.getenv('GA4_ADAPTIVE_MIN_RATE', 0.01))
+
+# Failed or overflow GA4 events are spooled here (disabled when unset) and replayed by `manage.py replay_ga4_spool`
+GA4_ENDPOINT = os.getenv('GA4_ENDPOINT', 'https://www.google-analytics.com/mp/collect')
+GA4_SPOOL_DIR = os.getenv('GA4_SPOOL_DIR') or None
+GA4_MAX_INFLIGHT = int(os.getenv('GA4_MAX_INFLIGHT', 64))
+GA4_FAILURE_COOLDOWN = int(os.getenv('GA4_FAILURE_COOLDOWN', 30))
+
+# Bot filtering: 'skip' drops analytics for crawlers/preview fetchers, 'tag' sends them with is_bot=1
+BOT_ANALYTICS = os.getenv('BOT_ANALYTICS', 'skip').strip().lower()
+# BOT_USER_AGENT_PATTERNS replaces the built-in list with comma separated regular expressions.
+BOT_USER_AGENT_PATTERNS = [p.strip() for p in os.getenv('BOT_USER_AGENT_PATTERNS', '').split(',') if p.strip()] or None
+BOT_EMPTY_USER_AGENT = str(os.getenv('BOT_EMPTY_USER_AGENT', 'False')).strip().lower() in {'1', 'true', 'yes', 'on'}
+
+# Bearer tokens accepted by the JSON API (/api/links/...), comma separated
+API_TOKENS = [t.strip() for t in os.getenv('API_TOKENS', '').split(',') if t.strip()]
+API_MAX_BATCH = int(os.getenv('API_MAX_BATCH', 1000))
+
+# Redirect access log (disabled when unset), written off the request path and rolled up by
+# `manage.py aggregate_access_log`. Rotates at ACCESS_LOG_MAX_BYTES, keeping ACCESS_LOG_BACKUPS files.
+ACCESS_LOG_PATH = os.getenv('ACCESS_LOG_PATH') or None
+ACCESS_LOG_MAX_BYTES = int(os.getenv('ACCESS_LOG_MAX_BYTES', 10 * 1024 * 1024))
+ACCESS_LOG_BACKUPS = int(os.getenv('ACCESS_LOG_BACKUPS', 5))
+ACCESS_LOG_BATCH_SIZE = int(os.getenv('ACCESS_LOG_BATCH_SIZE', 256))
+ACCESS_LOG_FLUSH_INTERVAL = float(os.getenv('ACCESS_LOG_FLUSH_INTERVAL', 1.0))
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv('ACCESS_LOG_QUEUE_SIZE', 10000))
+
+# Link cache hit/miss/404 counters are kept per worker and added to Redis by a background
+# thread every METRICS_FLUSH_INTERVAL seconds; the cache settings page samples CACHE_STATS_SAMPLE_SIZE
+# link keys with MEMORY USAGE to estimate the link cache's footprint.
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+CACHE_STATS_SAMPLE_SIZE = int(os.getenv('CACHE_STATS_SAMPLE_SIZE', 200))
+
+# Hot key tracking: each worker keeps a HOT_KEYS_CAPACITY-counter top-K sketch and adds it to
+# a shared per-HOT_KEYS_WINDOW ranking every HOT_KEYS_FLUSH_INTERVAL seconds. With HOT_KEYS_PIN,
+# the top HOT_KEYS_PIN_TOP codes with at least HOT_KEYS_PIN_MIN_HITS hits lose their Redis TTL
+# and are served from a copy in every worker.
+HOT_KEYS_CAPACITY = int(os.getenv('HOT_KEYS_CAPACITY', 128))
+HOT_KEYS_FLUSH_INTERVAL = float(os.getenv('HOT_KEYS_FLUSH_INTERVAL', 10))
+HOT_KEYS_WINDOW = int(os.getenv('HOT_KEYS_WINDOW', 60))
+HOT_KEYS_PIN = str(os.getenv('HOT_KEYS_PIN', 'False')).strip().lower() in {'1', 'true', 'yes', 'on'}
+HOT_KEYS_PIN_TOP = int(os.getenv('HOT_KEYS_PIN_TOP', 20))
+HOT_KEYS_PIN_MIN_HITS = int(os.getenv('HOT_KEYS_PIN_MIN_HITS', 1000))
+
+# Sessions and the logged-in user are read from Redis, so a warm admin request runs no
+# auth queries. cached_db still writes sessions through to the database, so they survive
+# a cache flush. Sessions from before the switch stay valid on the plain ModelBackend.
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+SESSION_CACHE_ALIAS = 'default'
+AUTHENTICATION_BACKENDS = [
+    'shortener.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))
+
+# On-demand profiling: a request carrying a superuser's token (Settings > Profiler) in the
+# X-Profile-Token header or ?_profile= runs under cProfile with SQL and cache calls timed.
+# Tokens are valid PROFILE_TOKEN_MAX_AGE seconds; reports are kept PROFILE_REPORT_TTL seconds.
+PROFILING_ENABLED = str(os.getenv('PROFILING_ENABLED', 'True')).strip().lower() in {'1', 'true', 'yes', 'on'}
+PROFILE_TOKEN_MAX_AGE = int(os.getenv('PROFILE_TOKEN_MAX_AGE', 3600))
+PROFILE_REPORT_TTL = int(os.getenv('PROFILE_REPORT_TTL', 900))
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -161,6 +282,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles_build', 'static')
 
 LOGIN_URL = 'login'
 
+# The covering index on Link uses INCLUDE, which SQLite ignores; it falls back to a plain index there.
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
 DEFAULT_SUPERUSER_USERNAME = os.getenv('DEFAULT_SUPERUSER_USERNAME', 'ZLink')
 DEFAULT_SUPERUSER_EMAIL = os.getenv('DEFAULT_SUPERUSER_EMAIL', 'zlink@zhiu.dev')
 DEFAULT_SUPERUSER_PASSWORD = os.getenv('DEFAULT_SUPERUSER_PASSWORD', 'ZLink')
\ No newline at end of file